@@ -1,61 +1,96 @@
 """
 One-Factor-At-a-Time (OFAT) (local) sensitivity analysis, based on methods provided by the SA notebook and the article of ten Broeke (2016)
-Script to run OFAT using BatchRunnerMP and save data in the folder data/OFAT
-
-Run script as Python3 OFAT.py filename n_cores
-
-where n_cores specifies the number of cores to use for multiprocessing
+Script to run OFAT and save data in the folder data/OFAT
+
+Run script as Python3 OFAT.py filename n_cores [engine] [cache_dir] [study]
+    [--backend {local,queue}] [--queue QUEUE] [--max-tasks-per-child N]
+
+where n_cores specifies the number of cores to use for multiprocessing, the
+optional engine is one of the keys of `MODEL_ENGINES` (default: the engine of
+the study), the optional cache_dir is a cache of model runs (see `RunCache`),
+so a re-run with changed parameter ranges only runs the new points, and the
+optional study is the study file defining the problem, fixed parameters,
+reporters, repetitions and time steps (default: studies/ofat.json, see
+study.py). The nominal point, which is part of every sweep, is simulated only
+once. The runtimes of the runs are recorded in data/runtimes/<engine>.jsonl,
+from which later sweeps learn to run the slowest runs first. With
+--backend queue the runs are put in a work queue in the --queue directory,
+which workers on other hosts can join (see workqueue.py).
 """
-from model import LeafcutterAntsFungiMutualismModel, track_ants, track_leaves, track_ratio_foragers
-from model import track_ants_leaves, track_dormant_ants
-from batchrunner import BatchRunnerMP
-import pandas as pd
+from model import MODEL_ENGINES
+from model import ResultsStoreWriter, RunCache
+from failures import FailureLedger
+from workqueue import BACKENDS
 import numpy as np
 
+import argparse
 import os
 import sys
 from tqdm import tqdm
 
+from costs import engine_runtimes
+from study import TYPES, compile_study, load_study, run_plan
+
 if not os.path.exists('data/OFAT'):
     os.makedirs('data/OFAT')
 if not os.path.exists('figures/OFAT'):
     os.makedirs('figures/OFAT')
 
 
-def collect_OFAT_data(fileName, problem, model_reporters, fixed_parameters,
-                      repetitions=5, time_steps=100, distinct_samples=5,
-                      save_data=True):
+def collect_OFAT_data(fileName, plan, analysis='ofat', processes=None,
+                      save_data=True, cache=None, costs=None, backend=None,
+                      queue=None, maxtasksperchild=None):
     """
-    Function that collects data for the OFAT sensitivity analysis and save the data
-    when save_data is set to true
+    Function that collects data for the OFAT sensitivity analysis `analysis`
+    of the compiled study `plan` and save the data when save_data is set to
+    true. Every model run is also written to the results store
+    data/OFAT/fileName as soon as it completes. The runs are dispatched
+    longest expected first by the `RuntimeModel` `costs`, if given, to the
+    pool of `backend` (see `run_plan`). Runs that keep failing are left out
+    of the data and recorded in failures.json in the store.
     """
+    problem = {var: [TYPES[kind], bounds] for var, (kind, bounds)
+               in plan.study['analyses'][analysis]['problem'].items()}
+    fixed_parameters = plan.study['fixed_parameters']
+    model_reporters = plan.model_reporters
+    runs = plan.analyses[analysis]
+    print(plan.summary())
+
+    store = None
+    ledger = FailureLedger()
+    if save_data:
+        ledger = FailureLedger('data/OFAT/' + fileName + '/failures.json')
+        store = ResultsStoreWriter('data/OFAT/' + fileName, metadata={
+            'problem': plan.study['analyses'][analysis]['problem'],
+            'model_reporters': list(model_reporters.keys()),
+            'fixed_parameters': fixed_parameters})
+
+    # the runs of the sweeps that each model run is shared by
+    runs_of_task = {}
+    for i, (task, point, repetition, tags) in enumerate(runs):
+        runs_of_task.setdefault(task, []).append(i)
+
+    results = {}
+    with tqdm(total=len(runs)) as pbar:
+        for task, result in run_plan(plan, list(runs_of_task), processes,
+                                     cache, costs, backend, queue, ledger,
+                                     maxtasksperchild):
+            results[task] = result
+            for i in runs_of_task[task]:
+                if store is not None:
+                    _, point, repetition, tags = runs[i]
+                    store.write(i, result, params={**point, **tags,
+                                                   'iteration': repetition})
+                pbar.update()
 
     # create a dictionary where each dataframe is saved as the value of key
     # variable name
-    data = {}
-
-    for var in tqdm(problem.keys()):
-        # get the sample for this variable
-        samples = np.linspace(
-            *problem[var][1], num=distinct_samples, dtype=problem[var][0])
-
-        # remove this parameter from the fixed parameter dictionary
-        fixed_params_copy = fixed_parameters.copy()
-        del fixed_params_copy[var]
-
-        batch = BatchRunnerMP(LeafcutterAntsFungiMutualismModel,
-                              max_steps=max_steps,
-                              iterations=repetitions,
-                              variable_parameters={var: samples},
-                              fixed_parameters=fixed_params_copy,
-                              model_reporters=model_reporters,
-                              display_progress=False,
-                              nr_processes=int(sys.argv[2])
-                              )
+    table = plan.table(analysis, results)
+    data = {var: table[table['parameter'] == var].drop(columns='parameter')
+            .reset_index(drop=True) for var in problem}
 
-        batch.run_all()
-
-        data[var] = batch.get_model_vars_dataframe()
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
 
     if save_data:
         np.savez('data/OFAT/' + fileName, data=data, problem=problem,
@@ -65,80 +100,54 @@ def collect_OFAT_data(fileName, problem, model_reporters, fixed_parameters,
 
 
 if __name__ == '__main__':
-
-    if len(sys.argv) < 2:
-        print("no filename specified and no nr of cores specified")
-        print("please run as python3 OFAT.py filname n_cores")
-        sys.exit(-1)
-    elif len(sys.argv) < 3:
-        print("no filename OR no nr of cores specified")
-        print("please run as python3 OFAT.py filname n_cores")
+    argparser = argparse.ArgumentParser(
+        description="One-Factor-At-a-Time sensitivity analysis")
+    argparser.add_argument("filename", type=str,
+                           help="suffix of the name of the data file in "
+                           "data/OFAT")
+    argparser.add_argument("n_cores", type=int,
+                           help="number of processes to use in pool (local "
+                           "workers with the queue backend)")
+    argparser.add_argument("engine", type=str, nargs="?", default=None,
+                           help="model engine to run (overrides the study)")
+    argparser.add_argument("cache_dir", type=str, nargs="?", default=None,
+                           help="directory of a cache of model runs")
+    argparser.add_argument("study", type=str, nargs="?",
+                           default="studies/ofat.json",
+                           help="study file defining the analysis")
+    argparser.add_argument("--backend", type=str, default="local",
+                           choices=BACKENDS,
+                           help="run the model runs in a pool of local "
+                           "processes, or in a work queue that workers on "
+                           "other hosts can join (see workqueue.py)")
+    argparser.add_argument("--queue", type=str, default="data/queue",
+                           help="directory of the work queue, shared with the "
+                           "workers")
+    argparser.add_argument("--max-tasks-per-child", type=int, default=None,
+                           help="replace a worker process after this many "
+                           "model runs")
+    args = argparser.parse_args()
+
+    study = load_study(args.study)
+
+    if args.engine is not None:
+        study['engine'] = args.engine
+    engine = study.get('engine', 'agent')
+    if engine not in MODEL_ENGINES:
+        print(f"unknown engine {engine}, choose one of {list(MODEL_ENGINES)}")
         sys.exit(-1)
 
-    # define the parameters and ranges to run OFAT for
-    problem = {'num_ants': [int, [10, 100]],
-               'num_plants': [int, [30, 200]],
-               'pheromone_lifespan': [int, [5, 100]],
-               'num_plant_leaves': [int, [10, 200]],
-               'initial_foragers_ratio': [float, [0.1, 1.0]],
-               'leaf_regrowth_rate': [float, [0.01, 1.0]],
-               'ant_death_probability': [float, [0, 0.02]],
-               'initial_fungus_energy': [float, [10, 100]],
-               'fungus_decay_rate': [float, [0.001, 0.02]],
-               'energy_biomass_cvn': [float, [1, 4]],
-               'fungus_larvae_cvn': [float, [0.2, 1.5]],
-               'energy_per_offspring': [float, [0.5, 1.5]],
-               'max_fitness_queue_size': [int, [1, 20]],
-               'caretaker_carrying_amount': [float, [0.1, 2]],
-               'dormant_roundtrip_mean': [float, [30, 80]],
-               'caretaker_roundtrip_mean': [float, [5, 20]]
-               }
-
-    # obtain nominal model parameters
-    model = LeafcutterAntsFungiMutualismModel()
-    default_pheromone_lifespan = model.pheromone_lifespan
-
-    # set the output variables
-    model_reporters = {"Ants_Biomass": track_ants,
-                       "Fungus_Biomass": lambda m: m.fungus.biomass,
-                       "Fraction forager ants": track_ratio_foragers,
-                       "Available leaves": track_leaves,
-                       "Dormant caretakers fraction": track_dormant_ants,
-                       "Death reason": lambda m: m.death_reason,
-                       }
-
-    # set fixed parameters, eg collect_data = False
-    fixed_parameters = {'collect_data': False,
-                        'width': 50,
-                        'height': 50,
-                        'num_ants': 50,
-                        'num_plants': 64,
-                        'pheromone_lifespan': 30,
-                        'num_plant_leaves': 100,
-                        'initial_foragers_ratio': 0.5,
-                        'leaf_regrowth_rate': 0.5,
-                        'ant_death_probability': 0.01,
-                        'initial_fungus_energy': 50,
-                        'fungus_decay_rate': 0.005,
-                        'energy_biomass_cvn': 2.0,
-                        'fungus_larvae_cvn': 0.9,
-                        'energy_per_offspring': 1.0,
-                        'fungus_biomass_death_threshold': 5.0,
-                        'max_fitness_queue_size': 10,
-                        'caretaker_carrying_amount': 1,
-                        'caretaker_roundtrip_mean': 5.0,
-                        'caretaker_roundtrip_std': 5.0,
-                        'dormant_roundtrip_mean': 60.0,
-                        }
-
-    # estimation floor comp 2,5h
-    repetitions = 64
-    max_steps = 1000
-    distinct_samples = 10
-
-    fileName = f"reps{repetitions}maxtime{max_steps}distinctsam{distinct_samples}" + \
-        sys.argv[1]
-
-    collect_OFAT_data(fileName, problem, model_reporters, fixed_parameters,
-                      repetitions=repetitions, time_steps=max_steps, distinct_samples=distinct_samples,
-                      save_data=True)
+    cache = RunCache(args.cache_dir) if args.cache_dir else None
+
+    plan = compile_study(study)
+    analysis = study['analyses']['ofat']
+
+    repetitions = analysis.get('repetitions', study.get('repetitions', 1))
+    fileName = f"reps{repetitions}maxtime{study['max_steps']}distinctsam{analysis['samples']}" + \
+        args.filename
+
+    collect_OFAT_data(fileName, plan, processes=args.n_cores,
+                      save_data=True, cache=cache,
+                      costs=engine_runtimes(engine), backend=args.backend,
+                      queue=args.queue,
+                      maxtasksperchild=args.max_tasks_per_child)
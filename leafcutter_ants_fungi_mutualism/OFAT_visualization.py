@@ -4,8 +4,13 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from model import LeafcutterAntsFungiMutualismModel, track_ants, track_leaves, track_ratio_foragers, track_ants_leaves
 
+import os
 import sys
 
+from model import ResultsStore
+
+# reporters plotted as the number of runs they hold for, and how to count them
+COUNTED_REPORTERS = {'Death reason': 'count', 'Censored': 'sum'}
 
 def plot_param_var_conf(ax, df, var, param, i):
     """
@@ -61,15 +66,14 @@ def plot_all_vars(data, model_reporters, save_fig=True, show_fig=False):
 
     for row, var in enumerate(data.keys()):
         for col, output_param in enumerate(model_reporters):
-            if output_param == 'Death reason':
-                #             print(output_param)
-                x = snapshot_data.groupby(var).mean().reset_index()[var]
-#             print(x)
-                y = snapshot_data.groupby(var).count()['Death reason']
-#             print(y)
-                axs[row, col].scatter(x, y, c='darkgreen', marker='o')
+            if output_param in COUNTED_REPORTERS:
+                # number of runs that died, or that were censored (which
+                # are not deaths), per value of var
+                y = data[var].groupby(var)[output_param].agg(
+                    COUNTED_REPORTERS[output_param])
+                axs[row, col].scatter(y.index, y, c='darkgreen', marker='o')
                 axs[row, col].set_xlabel(var)
-                axs[row, col].set_ylabel(param)
+                axs[row, col].set_ylabel(output_param)
             else:
                 plot_param_var_conf(
                     axs[row, col], data[var], var, output_param, col)
@@ -83,9 +87,25 @@ def plot_all_vars(data, model_reporters, save_fig=True, show_fig=False):
 
 def recover_OFAT_data(fileName):
     """
-    Recovers data saved in collect_OFAT_data function
+    Recovers data saved in collect_OFAT_data function, from its results store
+    if there is one (which also holds the runs of an interrupted study) and
+    otherwise from its .npz file
     """
-    return dict(np.load('data/OFAT/' + fileName + '.npz', allow_pickle=True))
+    path = 'data/OFAT/' + fileName
+    if not os.path.isdir(path):
+        return dict(np.load(path + '.npz', allow_pickle=True))
+
+    store = ResultsStore(path)
+    table = store.table()
+    data = {var: table[table['parameter'] == var].drop(columns='parameter')
+            for var in table['parameter'].unique()}
+    problem = {var: [{'int': int, 'float': float}[kind], bounds]
+               for var, (kind, bounds) in store.metadata['problem'].items()}
+    # same layout as the .npz file
+    return {key: np.array(value, dtype=object) for key, value in (
+        ('data', data), ('problem', problem),
+        ('model_reporters', store.metadata['model_reporters']),
+        ('fixed_parameters', store.metadata['fixed_parameters']))}
 
 
 if __name__ == '__main__':
@@ -1,148 +1,139 @@
 """
 Sobol' (global) sensitivity analysis, based on methods provided by the SA notebook and the article of ten Broeke (2016), using SALib python package
 Script to run Sobol' SA and save data
+
+The problem, fixed parameters, reporters and sample are defined by a study
+file (default studies/sobol.json, see study.py) with a "saltelli" analysis.
 """
-from model import LeafcutterAntsFungiMutualismModel, track_ants, track_leaves, track_ratio_foragers
-from model import track_ants_leaves, track_dormant_ants
-from mesa.batchrunner import BatchRunner
-import pandas as pd
+from model import MODEL_ENGINES, ResultMatrix, RunCache
+from failures import FailureLedger
+from workqueue import BACKENDS
 import numpy as np
 import os
-import sys
 
 import time
 import argparse
-import multiprocess as mp
-from itertools import product
 
-from SALib.sample import saltelli
-from SALib.analyze import sobol
+from costs import engine_runtimes
+from study import compile_study, load_study, problem_sampler, run_plan, sample_hash
 
 if not os.path.exists('data/Sobol'):
     os.makedirs('data/Sobol')
 if not os.path.exists('figures/Sobol'):
     os.makedirs('figures/Sobol')
 
-# from https://salib.readthedocs.io/en/latest/basics.html
-
-# define the parameters and ranges in a way that is not confusing; uncomment parameters to include in analysis
-problem = {
-    'fungus_decay_rate': [float, [0.001, 0.02]],
-    'energy_biomass_cvn': [float, [1, 4]],
-    'fungus_larvae_cvn': [float, [0.55, 1.25]],
-    'caretaker_carrying_amount': [float, [0.5, 1.35]],
-    'caretaker_roundtrip_mean': [float, [5, 12]]
-}
-
-# SALib's saltelli sampler wants it in another format so here we go
-problem_sampler = {
-    'num_vars': len(problem),
-    'names': [key for key in sorted(problem.keys())],
-    'bounds': [problem[key][1] for key in sorted(problem.keys())]
-}
-
-# set fixed parameters, eg collect_data = False. this includes all parameters not in problem
-fixed_parameters = {'collect_data': False,
-                    'width': 50,
-                    'height': 50,
-                    'num_ants': 50,
-                    'num_plants': 64,
-                    'pheromone_lifespan': 30,
-                    'num_plant_leaves': 100,
-                    'initial_foragers_ratio': 0.5,
-                    'leaf_regrowth_rate': 0.5,
-                    'ant_death_probability': 0.01,
-                    'initial_fungus_energy': 50,
-                    'fungus_decay_rate': 0.005,
-                    'energy_biomass_cvn': 2.0,
-                    'fungus_larvae_cvn': 0.9,
-                    'energy_per_offspring': 1.0,
-                    'fungus_biomass_death_threshold': 5,
-                    'max_fitness_queue_size': 10,
-                    'caretaker_carrying_amount': 1,
-                    'caretaker_roundtrip_mean': 5,
-                    'dormant_roundtrip_mean': 60.0,
-                    }
-
-# remove problem parameters from dictionary of fixed parameters
-for key in problem.keys():
-    del fixed_parameters[key]
-
-##### ?????? ######
-# The SA notebook does this, which is very different implementation than the example of the read the docs????
-repetitions = 10
-max_steps = 100
-distinct_samples = 10
-
-
-def fungus_biomass(model):
-    return model.fungus.biomass
-
-
-# , problem_sampler, parameter_setting, fixed_parameters, i):
-def run_model(args):
-
-    model, args, problem_sampler, parameter_setting, fixed_parameters, i = args
-
-    # create dictionary containing the variable parameters
-    var_param = {}
-    for key, val in zip(problem_sampler['names'], parameter_setting):
-        # transform into integer if required
-        # NOTE this is using global variable problem.. not the best method, so think about fix
-        if problem[key][0] == int:
-            val = round(val)
-        var_param[key] = val
-
-    m = model(**var_param, **fixed_parameters)
-
-    while m.running and m.schedule.steps < args["time_steps"]:
-        m.step()
-
-    return m, i
 
+def sobol_analysis(study):
+    """ name and definition of the saltelli analysis of the study """
+    for name, analysis in study['analyses'].items():
+        if analysis['kind'] == 'saltelli':
+            return name, analysis
+    raise ValueError("the study has no saltelli analysis")
 
-def run_model_parallel(args):
-    args, model_reporters = args
-    n_cores = args["n_cores"]
-    if n_cores is None:
-        n_cores = mp.cpu_count()
 
-    # load the sample
-    param_values = np.loadtxt('data/Sobol/saltellisample')
+def shard_rows(shard, rows):
+    """ rows of the sample evaluated by shard "i/n" (all rows if None) """
+    if shard is None:
+        return np.arange(rows)
+    i, n = map(int, shard.split('/'))
+    return np.array_split(np.arange(rows), n)[i]
+
 
-    results = np.zeros((len(param_values), len(model_reporters.keys())))
+def load_plan(args):
+    """ compile the study, with the overrides given on the command line """
+    study = load_study(args["study"])
+    for key, arg in (("engine", "engine"), ("max_steps", "time_steps"),
+                     ("seed", "seed")):
+        if args[arg] is not None:
+            study[key] = args[arg]
+    if args["stop_on_death"]:
+        study["fixed_parameters"]["stop_on_death"] = True
+    if args["steady_state_window"] is not None:
+        study["fixed_parameters"]["steady_state_window"] = \
+            args["steady_state_window"]
 
-    with mp.Pool(n_cores) as pool:
-        for model, ix in pool.imap_unordered(
-            run_model,
-            [(LeafcutterAntsFungiMutualismModel, args, problem_sampler,
-              param_values[i], fixed_parameters, i) for i in range(len(param_values))]
-        ):
-            results[ix] = np.array([model_reporters[key](model)
-                                   for key in sorted(model_reporters.keys())])
-            #results[ix] = model.fungus.biomass, track_ants(model), track_ratio_foragers(model), track_leaves(model),
+    # resumed and parallel jobs derive the same seeds from the recorded root
+    path = 'data/Sobol/' + args["output_file"]
+    if study.get("seed") is None and os.path.exists(os.path.join(path, 'meta.json')):
+        study["seed"] = int(ResultMatrix(path).metadata['seed_entropy'])
 
-    return results
+    return compile_study(study)
+
+
+def run_model_parallel(args):
+    plan = load_plan(args)
+    name, analysis = sobol_analysis(plan.study)
+    runs = plan.analyses[name]
+    columns = sorted(plan.model_reporters.keys())
+    print(plan.summary())
+
+    param_values = np.array([[point[key] for key in
+                              problem_sampler(analysis['problem'])['names']]
+                             for _, point, _, _ in runs])
+
+    # rows that are written are kept if the job is killed, and skipped when
+    # it is run again
+    path = 'data/Sobol/' + args["output_file"]
+    matrix = ResultMatrix.open(path, len(runs), len(columns), metadata={
+        'sample_hash': sample_hash(param_values), 'columns': columns,
+        'problem': problem_sampler(analysis['problem']),
+        'fixed_parameters': plan.study['fixed_parameters'],
+        'engine': plan.study.get('engine', 'agent'),
+        'time_steps': plan.max_steps, 'seed_entropy': str(plan.seed)})
+    rows = matrix.missing(shard_rows(args["shard"], len(runs)))
+    print(f"{len(rows)} rows left to evaluate in this shard")
+
+    # rows that share a model run are written together
+    rows_of_task = {}
+    for row in rows:
+        rows_of_task.setdefault(runs[row][0], []).append(row)
+
+    cache = None
+    if args["cache"]:
+        cache = RunCache(args["cache"], max_bytes=None if args["cache_size"]
+                         is None else int(args["cache_size"] * 1e6))
+
+    # the slowest runs first, by the runtimes of earlier runs of the engine
+    costs = engine_runtimes(plan.study.get('engine', 'agent'))
+    # runs that keep failing stay missing, recorded in a ledger per shard
+    ledger = FailureLedger(os.path.join(path, 'failures.json' if args["shard"]
+                                        is None else 'failures-%s-of-%s.json'
+                                        % tuple(args["shard"].split('/'))))
+    for task, result in run_plan(plan, list(rows_of_task), args["n_cores"],
+                                 cache, costs, args["backend"], args["queue"],
+                                 ledger, args["max_tasks_per_child"]):
+        for row in rows_of_task[task]:
+            # -1 if the run was not stopped early
+            matrix.write(row, [result.reporters[key] for key in columns],
+                         -1 if result.stop_step is None else result.stop_step)
+
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
+
+    seeds = [plan.tasks[task]['seed'] for task, _, _, _ in runs]
+    return matrix, seeds, plan
 
 
 def main(args):
-    args, model_reporters = args
     start = time.time()
-    results = run_model_parallel((args, model_reporters))
+    matrix, seeds, plan = run_model_parallel(args)
     end = time.time()
 
     print(f"Done! Took {end - start}")
-    print(f"------ Saving data to {args['output_file']} --------")
-    np.savez('data/Sobol/'+args["output_file"], results=results,
-             fixed_parameters=fixed_parameters, problem=problem_sampler, model_reporters=model_reporters)
-
-
-def create_saltelli_sample():
-    """ create the parameter values. This needs to be done only once!!! """
-    param_values = saltelli.sample(
-        problem_sampler, N=512, calc_second_order=False)
+    if not matrix.complete:
+        # the other shards are still running or have to be (re)started
+        print(f"{len(matrix.missing())} of {matrix.rows} rows are missing, "
+              f"not saving the results yet")
+        return
 
-    np.savetxt('data/Sobol/saltellisample', param_values)
+    name, analysis = sobol_analysis(plan.study)
+    print(f"------ Saving data to {args['output_file']} --------")
+    np.savez('data/Sobol/'+args["output_file"], results=np.array(matrix.values),
+             fixed_parameters=plan.study['fixed_parameters'],
+             problem=problem_sampler(analysis['problem']),
+             model_reporters=list(plan.model_reporters.keys()),
+             seeds=seeds, seed_entropy=str(plan.seed),
+             stop_steps=matrix.stop_steps)
 
 
 if __name__ == "__main__":
@@ -150,32 +141,50 @@ if __name__ == "__main__":
         description="Leafcutter Ants Fungy Mutualism model runner")
 
     argparser.add_argument("output_file", type=str,
-                           help="location of output file")
-    # argparser.add_argument("input_sample", type=str, help="location of saltelli sample")
-
-    # argparser.add_argument("-s", "--saltelli-sample", type=int, default=1024,
-    #                        help="length of saltelli sample, preferrably power of 2")
-    argparser.add_argument("-t", "--time-steps", type=int, default=1000,
-                           help="number of time steps to execute")
+                           help="name of the result matrix directory in "
+                           "data/Sobol, the .npz file is saved next to it once "
+                           "all rows are evaluated")
+    argparser.add_argument("--study", type=str, default="studies/sobol.json",
+                           help="study file defining the analysis")
+    argparser.add_argument("-t", "--time-steps", type=int, default=None,
+                           help="number of time steps to execute (overrides "
+                           "the study)")
     argparser.add_argument("-n", "--n-cores", type=int, default=None,
-                           help="number of processes to use in pool")
+                           help="number of processes to use in pool (local "
+                           "workers with the queue backend)")
+    argparser.add_argument("-e", "--engine", type=str, default=None,
+                           choices=sorted(MODEL_ENGINES.keys()),
+                           help="model engine to run (overrides the study)")
+    argparser.add_argument("-s", "--seed", type=int, default=None,
+                           help="root seed of the model runs' seeds "
+                           "(overrides the study)")
+    argparser.add_argument("--stop-on-death", action="store_true",
+                           help="stop a run when the colony dies")
+    argparser.add_argument("--steady-state-window", type=int, default=None,
+                           help="stop a run when the fungus biomass and ant "
+                           "count are steady over this many steps")
+    argparser.add_argument("--cache", type=str, default=None,
+                           help="directory of a cache of model runs; runs "
+                           "found in it are not run again")
+    argparser.add_argument("--cache-size", type=float, default=None,
+                           help="size limit of the cache in MB, the least "
+                           "recently used runs are evicted beyond it")
+    argparser.add_argument("--shard", type=str, default=None,
+                           help="evaluate only shard i/n of the sample (e.g. "
+                           "0/4), shards can run in parallel on different hosts")
+
+    argparser.add_argument("--backend", type=str, default="local",
+                           choices=BACKENDS,
+                           help="run the model runs in a pool of local "
+                           "processes, or in a work queue that workers on "
+                           "other hosts can join (see workqueue.py)")
+    argparser.add_argument("--queue", type=str, default="data/queue",
+                           help="directory of the work queue, shared with the "
+                           "workers")
+    argparser.add_argument("--max-tasks-per-child", type=int, default=None,
+                           help="replace a worker process after this many "
+                           "model runs")
 
     args = vars(argparser.parse_args())
 
-    # create the parameter values. This needs to be done only once!!!
-    # create_saltelli_sample()
-    param_values = np.loadtxt('data/Sobol/saltellisample')
-    create_saltelli_sample()
-
-    # set the output variables
-    # set the output variables
-    model_reporters = {"Ants_Biomass": track_ants,
-                       "Fungus_Biomass": fungus_biomass,
-                       "Fraction forager ants": track_ratio_foragers,
-                       "Available leaves": track_leaves,
-                       "Dormant caretakers fraction": track_dormant_ants,
-                       "Ants with leaves": track_ants_leaves,
-                       #    "Death reason": lambda m: m.death_reason,
-                       }
-
-    main((args, model_reporters))
+    main(args)
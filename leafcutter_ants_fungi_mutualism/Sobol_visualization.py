@@ -2,24 +2,38 @@
 Process the results made using Sobol.py script
 """
 from model import LeafcutterAntsFungiMutualismModel, track_ants, track_leaves, track_ratio_foragers, track_ants_leaves
+from model import ResultMatrix
 from SALib.analyze import sobol
 import numpy as np
 import matplotlib.pyplot as plt
+import os
+import sys
 
 
 def fungus_biomass(model):
     return model.fungus.biomass
 
 
-data = np.load('data/Sobol/test.npz', allow_pickle=True)
-# print(data['results'])
-problem = data['problem'][()]
-results = data['results'][()]
-model_reporters = data['model_reporters'][()]
+fileName = sys.argv[1] if len(sys.argv) > 1 else 'test'
+
+if os.path.isdir('data/Sobol/' + fileName):
+    # the result matrix written by Sobol.py, which must be complete
+    matrix = ResultMatrix('data/Sobol/' + fileName)
+    matrix.require_complete()
+    problem = matrix.metadata['problem']
+    results = matrix.values
+    columns = matrix.metadata['columns']
+else:
+    data = np.load('data/Sobol/' + fileName + '.npz', allow_pickle=True)
+    # print(data['results'])
+    problem = data['problem'][()]
+    results = data['results'][()]
+    # a dict of the reporters in older files, a list of their names in newer
+    columns = sorted(data['model_reporters'][()])
 
 Si_all = {}
 
-for i, key in enumerate(sorted(model_reporters.keys())):
+for i, key in enumerate(columns):
     Si_all[key] = sobol.analyze(
         problem, results[:, i], calc_second_order=False, print_to_console=True)
 
@@ -1,13 +1,24 @@
+import os
+
 from tqdm import tqdm
-from multiprocess import Pool, cpu_count
+from multiprocess import cpu_count
 
 from mesa.batchrunner import BatchRunner
 
+from costs import RuntimeModel, makespan_report, plan_chunks
+from failures import FailureLedger, run_with_retries
+from memory import MemoryGovernor
+from model import retry_seed, run_and_summarize, run_key, spawn_seeds
+from workqueue import open_pool
+
 
 class BatchRunnerMP(BatchRunner):
     """Child class of BatchRunner, extended with multiprocessing support."""
 
-    def __init__(self, model_cls, nr_processes=None, **kwargs):
+    def __init__(self, model_cls, nr_processes=None, seed=None, store=None,
+                 store_params=None, cache=None, costs=None, backend=None,
+                 queue=None, limits=None, retries=2, ledger=None,
+                 maxtasksperchild=None, **kwargs):
         """Create a new BatchRunnerMP for a given model with the given
         parameters.
 
@@ -15,8 +26,54 @@ class BatchRunnerMP(BatchRunner):
         nr_processes: int
                       the number of separate processes the BatchRunner
                       should start, all running in parallel.
+        seed: int
+              root seed from which every model run gets its own seed, fresh
+              entropy if None. The seed of every run is reported in the
+              "seed" column of the model variables.
+        store: ResultsStoreWriter
+               if given, every model run is written to this results store as
+               soon as it completes, with its parameters (including the
+               iteration) and `store_params`.
+        cache: RunCache
+               if given, model runs found in this cache are not run again and
+               the others are added to it.
+        costs: RuntimeModel
+               if given, the model runs are dispatched longest expected first
+               by this cost model, with cheap runs batched into chunks, and
+               their runtimes are recorded in it.
+        backend: str
+                 "local" (default) for a pool of local processes, "queue" for
+                 a work queue in the directory `queue` that workers on other
+                 hosts can join as well (see workqueue.py).
+        limits: RunLimits
+                wall-clock and step rate limits of every model run.
+        retries: int
+                 number of times a model run that fails or exceeds its limits
+                 is retried with a fresh seed, before it is left out of the
+                 results.
+        ledger: FailureLedger
+                records the failed attempts, by default in failures.json in
+                the store (if any). A report is printed at the end.
+        maxtasksperchild: int
+                          if given, local worker processes are replaced after
+                          this many jobs.
         kwargs: the kwargs required for the parent BatchRunner class
         """
+        self.seed = seed
+        self.seed_entropy = None
+        self.store = store
+        self.store_params = store_params or {}
+        self.cache = cache
+        self.costs = RuntimeModel() if costs is None else costs
+        self.backend = backend
+        self.queue = queue
+        self.limits = limits
+        self.retries = retries
+        if ledger is None:
+            ledger = FailureLedger(None if store is None else
+                                   os.path.join(store.path, "failures.json"))
+        self.ledger = ledger
+        self.maxtasksperchild = maxtasksperchild
         if nr_processes is None:
             # identify the number of processors available on users machine
             available_processors = cpu_count()
@@ -26,28 +83,34 @@ class BatchRunnerMP(BatchRunner):
             self.processes = nr_processes
 
         super().__init__(model_cls, **kwargs)
-        self.pool = Pool(self.processes)
 
     def _make_model_args_mp(self):
         """Prepare all combinations of parameter values for `run_all`
         Due to multiprocessing requirements of @StaticMethod takes different input, hence the similar function
         Returns:
             List of list with the form:
-            [[model_object, dictionary_of_kwargs, max_steps, iterations]]
+            [[model_object, dictionary_of_kwargs, max_steps, iterations,
+              model_reporters, agent_reporters, limits]]
         """
         total_iterations = self.iterations
         all_kwargs = []
 
         count = len(self.parameters_list)
         if count:
+            # one independent seed per model run
+            self.seed_entropy, seeds = spawn_seeds(
+                self.seed, count * self.iterations)
             for params in self.parameters_list:
                 kwargs = params.copy()
                 kwargs.update(self.fixed_parameters)
                 # run each iterations specific number of times
                 for iter in range(self.iterations):
                     kwargs_repeated = kwargs.copy()
+                    kwargs_repeated["seed"] = seeds[len(all_kwargs)]
                     all_kwargs.append(
-                        [self.model_cls, kwargs_repeated, self.max_steps, iter]
+                        [self.model_cls, kwargs_repeated, self.max_steps, iter,
+                         self.model_reporters, self.agent_reporters,
+                         self.limits]
                     )
 
         elif len(self.fixed_parameters):
@@ -70,20 +133,29 @@ class BatchRunnerMP(BatchRunner):
             iter_args[1] = key word arguments needed for model object
             iter_args[2] = maximum number of steps for model
             iter_args[3] = number of time to run model for stochastic/random variation with same parameters
+            iter_args[4] = model reporters, evaluated in the worker
+            iter_args[5] = agent reporters, evaluated in the worker
+            iter_args[6] = limits of the run (`RunLimits` or None)
         :return:
             tuple of param values which serves as a unique key for model results
-            model object
+            RunResult of the model run (not the model itself, to keep the
+            payload sent back to the parent small)
         """
 
         model_i = iter_args[0]
         kwargs = iter_args[1]
         max_steps = iter_args[2]
         iteration = iter_args[3]
+        model_reporters = iter_args[4]
+        agent_reporters = iter_args[5]
+        limits = iter_args[6]
 
-        # instantiate version of model with correct parameters
-        model = model_i(**kwargs)
-        while model.running and model.schedule.steps < max_steps:
-            model.step()
+        # instantiate version of model with correct parameters, a stopped
+        # model carries its final state forward up to `max_steps`
+        result = run_and_summarize(model_i, kwargs, max_steps,
+                                   model_reporters=model_reporters,
+                                   agent_reporters=agent_reporters,
+                                   limits=limits)
 
         # add iteration number to dictionary to make unique_key
         kwargs["iteration"] = iteration
@@ -91,7 +163,7 @@ class BatchRunnerMP(BatchRunner):
         # convert kwargs dict to tuple to  make consistent
         param_values = tuple(kwargs.values())
 
-        return param_values, model
+        return param_values, result
 
     def _result_prep_mp(self, results):
         """
@@ -101,23 +173,19 @@ class BatchRunnerMP(BatchRunner):
         :updates model_vars and agents_vars so consistent across all batchrunner
         """
         # Take results and convert to dictionary so dataframe can be called
-        for model_key, model in results.items():
+        for model_key, result in results.items():
             if self.model_reporters:
-                self.model_vars[model_key] = self.collect_model_vars(model)
+                self.model_vars[model_key] = result.reporters
+                self.model_vars[model_key]["seed"] = result.seed
+                self.model_vars[model_key]["stop_step"] = result.stop_step
             if self.agent_reporters:
-                agent_vars = self.collect_agent_vars(model)
-                for agent_id, reports in agent_vars.items():
+                for agent_id, reports in result.agent_vars.items():
                     agent_key = model_key + (agent_id,)
                     self.agent_vars[agent_key] = reports
-            if hasattr(model, "datacollector"):
-                if model.datacollector.model_reporters is not None:
-                    self.datacollector_model_reporters[
-                        model_key
-                    ] = model.datacollector.get_model_vars_dataframe()
-                if model.datacollector.agent_reporters is not None:
-                    self.datacollector_agent_reporters[
-                        model_key
-                    ] = model.datacollector.get_agent_vars_dataframe()
+            if result.timeseries is not None:
+                self.datacollector_model_reporters[
+                    model_key
+                ] = result.get_model_vars_dataframe()
 
         # Make results consistent
         if len(self.datacollector_model_reporters.keys()) == 0:
@@ -125,41 +193,146 @@ class BatchRunnerMP(BatchRunner):
         if len(self.datacollector_agent_reporters.keys()) == 0:
             self.datacollector_agent_reporters = None
 
+    def _store_result(self, store_run, result):
+        """
+        Write `result` to the store, if any. `store_run` is the index of the
+        run in the store and its parameters.
+        """
+        if self.store is None:
+            return
+        index, params = store_run
+        self.store.write(index, result, params={**params, **self.store_params})
+
+    def _cache_result(self, key, result):
+        """
+        Add `result` to the cache under `key`, if there is a cache.
+        """
+        if self.cache is not None:
+            self.cache.put(key, result)
+
+    def _prepare_runs(self):
+        """
+        Prepare the model runs of `run_all`: look them up in the cache and
+        number them for the store, after the last run in it.
+        Returns:
+            the runs that still have to be dispatched, in the format of
+            `_make_model_args_mp`
+        """
+        run_iter_args, self._total_iterations = self._make_model_args_mp()
+        # store results in ordered dictionary
+        self._results = {}
+        # run i is written to the store as run `first_index + i`, along with
+        # its parameters
+        first_index = 0 if self.store is None else self.store.next_index()
+        self._store_runs = {}
+        for i, run in enumerate(run_iter_args):
+            params = dict(run[1], iteration=run[3])
+            self._store_runs[tuple(params.values())] = (first_index + i,
+                                                        params)
+
+        # only the runs that are not cached are dispatched
+        self._cache_keys = {}
+        if self.cache is not None:
+            pending = []
+            for run in run_iter_args:
+                params = tuple(run[1].values()) + (run[3],)
+                self._cache_keys[params] = run_key(run[0], run[1], run[2],
+                                                   run[4], run[5])
+                result = self.cache.get(self._cache_keys[params])
+                if result is None:
+                    pending.append(run)
+                else:
+                    self._results[params] = result
+                    self._store_result(self._store_runs[params], result)
+            run_iter_args = pending
+
+        return run_iter_args
+
+    def _finish_run(self, params, result):
+        """
+        Keep the `result` of the run with parameter values `params`, and
+        write it to the store and cache.
+        """
+        self._results[params] = result
+        self._store_result(self._store_runs[params], result)
+        # a retried run has another seed than its cache key
+        if result.seed == self._store_runs[params][1]["seed"]:
+            self._cache_result(self._cache_keys.get(params), result)
+        self.costs.record(self._store_runs[params][1], self.max_steps,
+                          result.runtime)
+
+    def _finish_all(self):
+        self._result_prep_mp(self._results)
+
+        return (
+            getattr(self, "model_vars", None),
+            getattr(self, "agent_vars", None),
+            getattr(self, "datacollector_model_reporters", None),
+            getattr(self, "datacollector_agent_reporters", None),
+        )
+
     def run_all(self):
         """
         Run the model at all parameter combinations and store results,
         overrides run_all from BatchRunner.
         """
 
-        run_iter_args, total_iterations = self._make_model_args_mp()
-        # register the process pool and init a queue
-        # store results in ordered dictionary
-        results = {}
+        run_iter_args = self._prepare_runs()
 
-        if self.processes > 1:
-            with tqdm(total_iterations, disable=not self.display_progress) as pbar:
-                for params, model in self.pool.imap_unordered(
-                    self._run_wrappermp, run_iter_args
+        if self.processes > 1 or self.backend == "queue":
+            with tqdm(total=self._total_iterations,
+                      disable=not self.display_progress) as pbar:
+                pbar.update(len(self._results))
+                chunks = _plan(run_iter_args, self.costs, self.processes)
+                for position, (_, result) in run_with_retries(
+                    lambda: open_pool(self.backend, self.processes,
+                                      self.queue, self.maxtasksperchild),
+                    self._run_wrappermp, run_iter_args, chunks,
+                    describe=_describe, retries=self.retries, reseed=_reseed,
+                    ledger=self.ledger,
+                    task_timeout=getattr(self.limits, "timeout", None),
+                    governor=MemoryGovernor(self.processes)
                 ):
-                    results[params] = model
+                    # keyed by the planned parameters, also if retried
+                    self._finish_run(_params(run_iter_args[position]), result)
                     pbar.update()
-
-                self._result_prep_mp(results)
+            if self.ledger.entries:
+                print(self.ledger.report())
         # For debugging model due to difficulty of getting errors during
         # multiprocessing
         else:
             for run in run_iter_args:
-                params, model_data = self._run_wrappermp(run)
-                results[params] = model_data
+                self._finish_run(*self._run_wrappermp(run))
 
-            self._result_prep_mp(results)
+        return self._finish_all()
 
-        # Close multi-processing
-        self.pool.close()
 
-        return (
-            getattr(self, "model_vars", None),
-            getattr(self, "agent_vars", None),
-            getattr(self, "datacollector_model_reporters", None),
-            getattr(self, "datacollector_agent_reporters", None),
-        )
+def _params(run):
+    """
+    Parameter values of a run of `_make_model_args_mp`, with the iteration.
+    """
+    return tuple(run[1].values()) + (run[3],)
+
+
+def _describe(run):
+    return dict(run[1], iteration=run[3])
+
+
+def _reseed(run, attempt):
+    """
+    Run `run` with a fresh seed for retry `attempt`.
+    """
+    kwargs = dict(run[1], seed=retry_seed(run[1]["seed"], attempt))
+    return [run[0], kwargs] + list(run[2:])
+
+
+def _plan(runs, costs, processes):
+    """
+    Chunks of `runs` (see `plan_chunks`) by the expected runtimes of the
+    `RuntimeModel` `costs`, reported if it learned from recorded runtimes.
+    """
+    expected = [costs.predict(run[1], run[2]) for run in runs]
+    chunks = plan_chunks(expected, processes)
+    if costs.fitted:
+        print("Expected " + makespan_report(expected, chunks, processes))
+    return chunks
@@ -0,0 +1,218 @@
+"""
+Runtime cost model of model runs, used to dispatch the runs of a sweep
+longest-expected-first and to batch cheap runs into chunks.
+
+The wall time of every run is recorded in a log (one JSON record per line)
+together with its parameters, and a linear model of the log runtime in the
+log of the numeric parameters is fitted to it. Without a log every run is
+expected to take equally long and the order of the tasks is kept.
+"""
+import json
+import os
+import queue
+import time
+
+import multiprocess as mp
+import numpy as np
+
+
+class RuntimeModel:
+    """
+    Cost model learned from the recorded runtimes in the log file at `path`
+    (no log if None).
+    """
+
+    # parameters that say nothing about the runtime
+    IGNORED = ("seed", "iteration")
+
+    def __init__(self, path=None, ridge=1e-3):
+        self.path = path
+        self.ridge = ridge
+        self.records = []
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.records = [json.loads(line) for line in f if line.strip()]
+        self.names = None
+        self.coefficients = None
+        self.fit()
+
+    @property
+    def fitted(self) -> bool:
+        """ whether any runtimes were recorded to learn from """
+        return self.coefficients is not None
+
+    def _features(self, kwargs, max_steps):
+        values = [max_steps] + [kwargs.get(name, 0) for name in self.names]
+        return np.log1p(np.abs(np.array(values, dtype=np.float64)))
+
+    @staticmethod
+    def _numeric(kwargs):
+        return {name: value for name, value in kwargs.items()
+                if name not in RuntimeModel.IGNORED
+                and isinstance(value, (int, float))
+                and not isinstance(value, bool)}
+
+    def fit(self) -> None:
+        """
+        Fit the model to the recorded runtimes.
+        """
+        if not self.records:
+            return
+
+        self.names = sorted(set().union(*(record["params"]
+                                          for record in self.records)))
+        X = np.array([self._features(record["params"], record["max_steps"])
+                      for record in self.records])
+        X = np.column_stack((np.ones(len(X)), X))
+        y = np.log(np.maximum([record["runtime"] for record in self.records],
+                              1e-6))
+        # ridge regression, so few records and constant parameters are fine
+        A = X.T @ X + self.ridge * np.eye(X.shape[1])
+        self.coefficients = np.linalg.solve(A, X.T @ y)
+
+    def predict(self, kwargs, max_steps) -> float:
+        """
+        Expected wall time in seconds of a run with `kwargs` for `max_steps`
+        steps (1 for every run if nothing was recorded). Parameters that are
+        not numeric in this run (e.g. None) count as 0, like missing ones.
+        """
+        if self.coefficients is None:
+            return 1.0
+        x = np.concatenate(([1.0], self._features(self._numeric(kwargs),
+                                                   max_steps)))
+        return float(np.exp(x @ self.coefficients))
+
+    def record(self, kwargs, max_steps, runtime) -> None:
+        """
+        Record the `runtime` of a run, appended to the log.
+        """
+        record = {"params": self._numeric(kwargs), "max_steps": max_steps,
+                  "runtime": runtime}
+        self.records.append(record)
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def engine_runtimes(engine, directory="data/runtimes") -> RuntimeModel:
+    """
+    Cost model of the runs of model engine `engine`, learned from and
+    recording to the engine's log in `directory`, shared by all studies.
+    """
+    return RuntimeModel(os.path.join(directory, f"{engine}.jsonl"))
+
+
+def plan_chunks(costs, processes, chunks_per_process=2, tolerance=0.01):
+    """
+    Order tasks with expected `costs` longest-first and batch the cheap ones
+    into chunks, each of about the remaining cost divided by
+    `processes * chunks_per_process`, so chunks shrink towards the tail and
+    expensive tasks stay on their own. Tasks are not batched if that would
+    lengthen the expected makespan by more than `tolerance`.
+
+    Returns:
+        list of chunks, each a list of task positions
+    """
+    order = sorted(range(len(costs)), key=lambda i: -costs[i])
+    remaining = sum(costs)
+    parts = max(processes * chunks_per_process, 1)
+
+    chunks = []
+    chunk, chunk_cost = [], 0.0
+    for i in order:
+        if chunk and chunk_cost + costs[i] > remaining / parts:
+            chunks.append(chunk)
+            remaining -= chunk_cost
+            chunk, chunk_cost = [], 0.0
+        chunk.append(i)
+        chunk_cost += costs[i]
+    if chunk:
+        chunks.append(chunk)
+
+    batched = makespan([sum(costs[i] for i in chunk) for chunk in chunks],
+                       processes)[0]
+    single = makespan([costs[i] for i in order], processes)[0]
+    if batched > single * (1 + tolerance):
+        return [[i] for i in order]
+    return chunks
+
+
+def makespan(chunk_costs, processes):
+    """
+    Simulated makespan of running chunks with `chunk_costs`, in order, on
+    `processes` workers that each take the next chunk when idle.
+
+    Returns:
+        the makespan and the total idle time of the workers at the tail
+    """
+    finish = np.zeros(max(min(processes, len(chunk_costs)), 1))
+    for cost in chunk_costs:
+        finish[np.argmin(finish)] += cost
+    end = finish.max()
+    return end, float((end - finish).sum())
+
+
+def makespan_report(costs, chunks, processes) -> str:
+    """
+    Makespan and tail idle time of tasks with `costs` (in seconds) run one
+    at a time in submission order and run as the `chunks` of `plan_chunks`.
+    """
+    before = makespan(costs, processes)
+    after = makespan([sum(costs[i] for i in chunk) for chunk in chunks],
+                     processes)
+    return (f"makespan on {processes} processes {before[0]:.1f} s with "
+            f"{before[1]:.1f} s tail idle in submission order, "
+            f"{after[0]:.1f} s with {after[1]:.1f} s tail idle longest first "
+            f"in {len(chunks)} chunks")
+
+
+def _run_chunk(args):
+    func, chunk = args
+    return [func(task) for task in chunk]
+
+
+def dispatch(pool, func, tasks, chunks, timeout=None, governor=None):
+    """
+    Run `func` on every task of `tasks` in `pool`, one chunk of `chunks`
+    (see `plan_chunks`) per job, yielding the results as they complete.
+    Raises a `multiprocess.TimeoutError` if the pool returns no result for
+    `timeout` seconds (a work queue also re-queues the tasks of dead workers
+    itself). With a `MemoryGovernor` `governor`, a local pool runs no more
+    jobs at a time than it allows.
+    """
+    jobs = [(func, [tasks[i] for i in chunk]) for chunk in chunks]
+    if governor is None or not hasattr(pool, "apply_async"):
+        results = pool.imap_unordered(_run_chunk, jobs)
+        for _ in chunks:
+            if timeout is not None and hasattr(results, "next"):
+                yield from results.next(timeout)
+            else:
+                yield from next(results)
+        return
+
+    done = queue.Queue()
+    submitted = in_flight = 0
+    last_result = time.monotonic()
+    while submitted < len(jobs) or in_flight:
+        while submitted < len(jobs) and in_flight < governor.limit():
+            pool.apply_async(_run_chunk, (jobs[submitted],),
+                             callback=lambda value: done.put((True, value)),
+                             error_callback=lambda error: done.put((False,
+                                                                    error)))
+            submitted += 1
+            in_flight += 1
+
+        try:
+            # wake up regularly, the governor may allow more jobs by now
+            ok, value = done.get(timeout=governor.interval)
+        except queue.Empty:
+            if timeout is not None and \
+                    time.monotonic() - last_result > timeout:
+                raise mp.TimeoutError
+            continue
+        if not ok:
+            raise value
+        last_result = time.monotonic()
+        in_flight -= 1
+        yield from value
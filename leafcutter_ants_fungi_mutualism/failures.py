@@ -0,0 +1,136 @@
+"""
+Crash isolation and retries of model runs in a pool. A run that raises (e.g.
+a `RunTimeout`) is reported back instead of breaking the pool, and a pool
+that returns no result for too long (a worker was killed or hangs) is torn
+down, so one bad parameter point cannot bring down a whole sweep. Failed runs
+are retried a bounded number of times with fresh seeds, and every failure is
+recorded in a `FailureLedger` saved next to the results.
+"""
+import contextlib
+import json
+import os
+import time
+import traceback
+
+import multiprocess as mp
+
+from costs import dispatch
+
+
+class FailureLedger:
+    """
+    Record of the failed attempts of model runs, saved as JSON to `path`
+    (not saved if None) after every failure.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = []
+
+    def record(self, run, attempt, error, retried, retry_seed=None) -> None:
+        """
+        Record failed attempt `attempt` (0 for the first) of `run` (its
+        parameters) with the traceback `error`, and whether it is `retried`,
+        with seed `retry_seed`.
+        """
+        self.entries.append({
+            "run": run, "attempt": attempt,
+            "error": error.strip().splitlines()[-1], "traceback": error,
+            "retried": retried, "retry_seed": retry_seed,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S")})
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f, indent=1, default=str)
+            os.replace(tmp, self.path)
+
+    @property
+    def given_up(self) -> list:
+        """
+        The last failures of the runs that were given up on.
+        """
+        return [entry for entry in self.entries if not entry["retried"]]
+
+    def report(self) -> str:
+        given_up = self.given_up
+        lines = [f"{len(self.entries)} failed attempts, {len(given_up)} runs "
+                 f"given up on" + (f" (see {self.path})" if self.path else "")]
+        lines += [f"  {entry['run']}: {entry['error']}" for entry in given_up]
+        return "\n".join(lines)
+
+
+def _attempt(args):
+    func, position, task = args
+    try:
+        return position, True, func(task)
+    except Exception:
+        return position, False, traceback.format_exc()
+
+
+def run_with_retries(open_pool, func, tasks, chunks, describe, retries=2,
+                     reseed=None, ledger=None, task_timeout=None,
+                     governor=None):
+    """
+    Run `func` on every task of `tasks` in the pool returned by `open_pool()`,
+    in `chunks` (see `dispatch`), yielding `(position, result)` for every
+    task that succeeds. A task that raises is retried up to `retries` times,
+    as `reseed(task, attempt)` (with a fresh seed) if given, in the same
+    pool, so the workers of a work queue stay for the retries.
+
+    If `task_timeout` is given, the pool is terminated when no result
+    arrives for twice the longest chunk's worth of it, its unfinished tasks
+    count as failed and the retries run in a new pool. Failures are recorded
+    in `ledger`, by the parameters (a dict including the seed)
+    `describe(task)` of the task. The `MemoryGovernor` `governor` limits the
+    number of jobs in flight.
+    """
+    ledger = FailureLedger() if ledger is None else ledger
+    current = list(tasks)
+    attempts = [0] * len(tasks)
+
+    with contextlib.ExitStack() as pools:
+        pool = None
+        while chunks:
+            stall_timeout = None
+            if task_timeout is not None:
+                stall_timeout = 2 * task_timeout * max(map(len, chunks)) + 60
+
+            jobs = [(func, position, task)
+                    for position, task in enumerate(current)]
+            done = set()
+            failed = []
+            if pool is None:
+                pool = pools.enter_context(open_pool())
+            try:
+                for position, ok, value in dispatch(pool, _attempt, jobs,
+                                                    chunks, stall_timeout,
+                                                    governor):
+                    done.add(position)
+                    if ok:
+                        yield position, value
+                    else:
+                        failed.append((position, value))
+            except mp.TimeoutError:
+                failed += [(position, f"RunTimeout: no result for "
+                                      f"{stall_timeout:.0f} s, the worker "
+                                      f"crashed or hangs")
+                           for chunk in chunks for position in chunk
+                           if position not in done]
+                # the hung workers would hold up the retries
+                pool.terminate()
+                pool = None
+
+            chunks = []
+            for position, error in sorted(failed):
+                attempt = attempts[position]
+                retry_seed = None
+                if attempt < retries:
+                    attempts[position] += 1
+                    if reseed is not None:
+                        current[position] = reseed(tasks[position],
+                                                   attempts[position])
+                    retry_seed = describe(current[position]).get("seed")
+                    chunks.append([position])
+                ledger.record(describe(tasks[position]), attempt, error,
+                              retried=attempt < retries, retry_seed=retry_seed)
@@ -0,0 +1,95 @@
+"""
+Memory-aware concurrency of a local worker pool. The resident memory (RSS)
+of the worker processes and the memory available on the host are read from
+/proc (Linux), and fewer jobs are run at a time when the workers would not
+fit in memory anymore, instead of having the host kill them.
+"""
+import os
+import time
+
+
+def _read_fields(path) -> dict:
+    """
+    The "name: value kB" fields of a /proc file, in bytes.
+    """
+    fields = {}
+    with open(path) as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            value = value.split()
+            if len(value) == 2 and value[1] == "kB":
+                fields[name] = int(value[0]) * 1024
+    return fields
+
+
+def worker_pids(parent=None) -> [int]:
+    """
+    Process ids of the child processes of `parent` (default this process).
+    """
+    parent = os.getpid() if parent is None else parent
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # the command name in parentheses may contain spaces
+                ppid = int(f.read().rpartition(")")[2].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent:
+            pids.append(int(name))
+    return pids
+
+
+class MemoryGovernor:
+    """
+    Limits the number of jobs in flight on `processes` local workers so that
+    they fit in memory. Every job is assumed to need as much memory as the
+    largest peak RSS of any worker so far, and the workers together may use
+    what they use now plus what is available beyond a reserve of `reserve`
+    (a fraction of the total memory). Measured at most every `interval`
+    seconds. Without /proc all workers are used.
+    """
+
+    def __init__(self, processes, reserve=0.1, interval=1.0):
+        self.processes = processes
+        self.reserve = reserve
+        self.interval = interval
+        self.peak_rss = 0
+        self.enabled = os.path.exists("/proc/meminfo")
+        self._limit = processes
+        self._checked = None
+
+    def limit(self) -> int:
+        """
+        Number of jobs that may be in flight.
+        """
+        now = time.monotonic()
+        if not self.enabled or (self._checked is not None
+                                and now - self._checked < self.interval):
+            return self._limit
+        self._checked = now
+
+        rss = 0
+        for pid in worker_pids():
+            try:
+                status = _read_fields(f"/proc/{pid}/status")
+            except OSError:
+                # exited in the meantime
+                continue
+            rss += status.get("VmRSS", 0)
+            self.peak_rss = max(self.peak_rss, status.get("VmHWM", 0))
+        if not self.peak_rss:
+            return self._limit
+
+        meminfo = _read_fields("/proc/meminfo")
+        headroom = meminfo["MemAvailable"] - self.reserve * meminfo["MemTotal"]
+        limit = int(min(max((rss + headroom) // self.peak_rss, 1),
+                        self.processes))
+        if limit != self._limit:
+            print(f"Memory: running {limit} of {self.processes} jobs at a "
+                  f"time ({headroom / 1e6:.0f} MB available beyond the "
+                  f"reserve, workers peak at {self.peak_rss / 1e6:.0f} MB)")
+            self._limit = limit
+        return limit
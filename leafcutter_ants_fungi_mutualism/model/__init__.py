@@ -1 +1,8 @@
 from .model import *
+from .vectorized import *
+from .rng import *
+from .trips import *
+from .results import *
+from .store import *
+from .cache import *
+from .stopping import *
@@ -1,10 +1,7 @@
 from .random_walker_agent import BiasedRandomWalkerAgent
-from .plant import Plant
-from .pheromone import Pheromone
-from .util import arctan_activation_pstv, manhattan_distance
+from .util import arctan_activation_pstv
 
 import numpy as np
-import queue
 from enum import Enum, auto
 
 
@@ -23,7 +20,7 @@ class DeathReason(Enum):
     Enum for storing the reason why the ant colony "died". The colony
     is considered doomed if either the fungus or all the ants die.
     Whichever happens first is considered the reason for the colony's
-    death
+    death.
     """
     FUNGUS = auto()
     ANTS = auto()
@@ -44,31 +41,149 @@ def track_death_reason(model) -> DeathReason:
 
     # the fungus is not dead
     # check if all ants are dead
-    agents_list = model.schedule.agents
-    for agent in agents_list:
-        if isinstance(agent, AntAgent):
-            # a live ant is found
-            return None
+    if model.ant_counts.ants:
+        # a live ant is found
+        return None
     # no ants were found
     return DeathReason.ANTS
 
 
+class AntCounters:
+    """
+    Live counts of the ant population. The counts are kept up to date by
+    `AntAgent` on birth, death, role switch, leaf pickup/delivery and
+    dormancy change, so that model reporters do not need to scan all agents.
+    """
+
+    FIELDS = ("ants", "caretakers", "dormant_caretakers", "with_leaf")
+
+    def __init__(self, ants=0, caretakers=0, dormant_caretakers=0,
+                 with_leaf=0):
+        self.ants = ants
+        self.caretakers = caretakers
+        # dormant ants that are caretakers, drafted foragers keep their
+        # dormant flag but are not counted
+        self.dormant_caretakers = dormant_caretakers
+        self.with_leaf = with_leaf
+
+    def __eq__(self, other):
+        return all(getattr(self, field) == getattr(other, field)
+                   for field in self.FIELDS)
+
+    def __repr__(self):
+        counts = ", ".join(f"{field}={getattr(self, field)}"
+                           for field in self.FIELDS)
+        return f"AntCounters({counts})"
+
+    def add(self, ant, sign=1) -> None:
+        """
+        Count `ant` (or uncount it if `sign` is -1).
+        """
+        self.ants += sign
+        if ant.state is AntWorkerState.CARETAKING:
+            self.caretakers += sign
+            if ant.dormant:
+                self.dormant_caretakers += sign
+        if ant.has_leaf:
+            self.with_leaf += sign
+
+    def remove(self, ant) -> None:
+        self.add(ant, -1)
+
+    @classmethod
+    def scan(cls, ants):
+        """
+        Brute-force counts of the `AntAgent` objects in `ants`.
+        """
+        counts = cls()
+        for ant in ants:
+            counts.add(ant)
+        return counts
+
+    def verify(self, model) -> None:
+        """
+        Compare the live counts to a brute-force scan of the model's ants
+        (`model.ant_agents()`), raises an `AssertionError` if they differ.
+        """
+        expected = self.scan(model.ant_agents())
+        if self != expected:
+            raise AssertionError(
+                f"ant counters {self} differ from scan {expected} at step "
+                f"{model.schedule.steps}")
+
+
 class AntAgent(BiasedRandomWalkerAgent):
     def __init__(self, unique_id, model, state=AntWorkerState.EXPLORE):
         self.unique_id = unique_id
         super().__init__(unique_id, model)
-        self.state = state
-        self.has_leaf = False
+        self._state = state
+        self._has_leaf = False
         self.neighbor_density_acc = 0
         self.trip_duration = 0
         self.roundtrip_length = None
-        self.dormant = False
+        self._dormant = False
+        # birth
+        self.model.ant_counts.add(self)
+        if state is AntWorkerState.CARETAKING:
+            self.model.caretakers.add(self)
+
+    # `state`, `has_leaf` and `dormant` are properties so that every change
+    # is reflected in the model's ant counters. Caretakers are not in the
+    # schedule, they are woken up by `model.caretakers` instead.
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self.model.ant_counts.remove(self)
+        caretaking = self._state is AntWorkerState.CARETAKING
+        self._state = value
+        self.model.ant_counts.add(self)
+
+        if caretaking and value is not AntWorkerState.CARETAKING:
+            self.model.caretakers.remove(self)
+            self.model.schedule.add(self)
+        elif not caretaking and value is AntWorkerState.CARETAKING:
+            self.model.schedule.remove(self)
+            self.model.caretakers.add(self)
+
+    @property
+    def has_leaf(self):
+        return self._has_leaf
+
+    @has_leaf.setter
+    def has_leaf(self, value):
+        self.model.ant_counts.remove(self)
+        self._has_leaf = value
+        self.model.ant_counts.add(self)
+
+    @property
+    def dormant(self):
+        return self._dormant
+
+    @dormant.setter
+    def dormant(self, value):
+        self.model.ant_counts.remove(self)
+        self._dormant = value
+        self.model.ant_counts.add(self)
+
+    def die(self) -> None:
+        """
+        Remove the ant from the model.
+        """
+        self.model.grid._remove_agent(self.pos, self)
+        if self.state is AntWorkerState.CARETAKING:
+            self.model.caretakers.remove(self)
+        else:
+            self.model.schedule.remove(self)
+        self.model.ant_counts.remove(self)
 
     def step(self):
         # mortality
         if self.random.random() <= self.model.ant_death_probability:
-            self.model.grid._remove_agent(self.pos, self)
-            self.model.schedule.remove(self)
+            self.die()
             return
 
         # check the ant's state and perform the corresponding action
@@ -78,8 +193,6 @@ class AntAgent(BiasedRandomWalkerAgent):
             self.recruit_step()
         elif self.state is AntWorkerState.HARVEST:
             self.harvest_step()
-        elif self.state is AntWorkerState.CARETAKING:
-            self.caretaking_step()
 
         if self.state is not AntWorkerState.CARETAKING:
             self.neighbor_density_acc += self.get_neighborhood_density()
@@ -102,7 +215,7 @@ class AntAgent(BiasedRandomWalkerAgent):
 
         if nearby_plants:
             plant = self.random.choice(nearby_plants)
-            if plant.take_leaf():
+            if self.model.plants.take_leaf(plant):
                 self.has_leaf = True
                 self.state = AntWorkerState.RECRUIT
         elif nearby_pheromones:
@@ -124,9 +237,10 @@ class AntAgent(BiasedRandomWalkerAgent):
         self.put_pheromone()
 
         # step towards nest
-        x_step, y_step = self.get_direction_towards_nest()
-        self.model.grid.move_agent(
-            self, (self.pos[0] + x_step, self.pos[1] + y_step))
+        grid = self.model.grid
+        next_pos = self.model.nest_geometry.step_target[
+            grid.cell_index(self.pos)]
+        grid.move_agent(self, next_pos)
 
     def harvest_step(self) -> None:
         """
@@ -138,7 +252,7 @@ class AntAgent(BiasedRandomWalkerAgent):
         if nearby_plants:
             # found plant, get leaf
             plant = self.random.choice(nearby_plants)
-            if plant.take_leaf():
+            if self.model.plants.take_leaf(plant):
                 self.has_leaf = True
                 self.state = AntWorkerState.RECRUIT
             else:
@@ -152,75 +266,60 @@ class AntAgent(BiasedRandomWalkerAgent):
             return
 
         # follow pheromone trail outwards from nest
-        ant_dist_from_nest = manhattan_distance(self.pos, self.model.nest.pos)
-        pheromones_dist_change = np.array([
-            manhattan_distance(p.pos, self.model.nest.pos) - ant_dist_from_nest
-            for p in nearby_pheromones
-        ])
-        if np.all(pheromones_dist_change <= 0):
+        distance = self.model.nest_geometry.distance_rows
+        ant_dist_from_nest = distance[self.pos[0]][self.pos[1]]
+        outwards_pheromones = [
+            pos for pos in nearby_pheromones
+            if distance[pos[0]][pos[1]] > ant_dist_from_nest
+        ]
+        if not outwards_pheromones:
             # no outwards going pheromones near, do random move
             self.random_move()
             self.state = AntWorkerState.EXPLORE
             return
 
         # choose random outwards going pheromone
-        outwards_pheromones = np.argwhere(pheromones_dist_change > 0).flatten()
-        rand_outwards = self.random.choice(outwards_pheromones)
-        outwards_pheromone = nearby_pheromones[rand_outwards]
-        self.model.grid.move_agent(self, outwards_pheromone.pos)
+        outwards_pheromone = self.random.choice(outwards_pheromones)
+        self.model.grid.move_agent(self, outwards_pheromone)
 
     def caretaking_step(self) -> None:
         """
+        Called by `model.caretakers` when the round trip of the caretaker ends.
         Check the health of the fungus (i.e. if its biomass has decreased).
         If biomass has decreased, then the ant does not feed the fungus and
         remains dormant for a normally distributed duration (semantically
         modeled as a round-trip). Else feed one unit to larvae
         (decrement `fungus.biomass`, increment `nest.energy_buffer``).
         """
-        if self.roundtrip_length is None:
-            # first call of care-taking step
+        # dormancy time is up
+        self.dormant = False
+        # NB: `fitness` is not as in the Moran-process context
+        fitness = arctan_activation_pstv(
+            self.model.fungus.biomass / self.fungus_biomass_start, 1
+        )
+
+        if 0.5 > fitness:
+            # fungus health has declined, do not feed the larvae and remain
+            # dormant for some time
+            self.dormant = True
             self.set_roundtrip_length(
-                mu=self.model.caretaker_roundtrip_mean, sigma=self.model.caretaker_roundtrip_std)
+                mu=self.model.dormant_roundtrip_mean,
+                sigma=self.model.dormant_roundtrip_mean / 2)
 
-        self.roundtrip_length -= 1
-        if self.roundtrip_length == 0:
-            # dormancy time is up
-            self.dormant = False
-            # NB: `fitness` is not as in the Moran-process context
-            fitness = arctan_activation_pstv(
-                self.model.fungus.biomass / self.fungus_biomass_start, 1
-            )
-
-            if 0.5 > fitness:
-                # fungus health has declined, do not feed the larvae and remain
-                # dormant for some time
-                self.dormant = True
-                self.set_roundtrip_length(
-                    mu=self.model.dormant_roundtrip_mean,
-                    sigma=self.model.dormant_roundtrip_mean / 2)
-
-            # feed the larvae
-            else:
-                # `fungus.dead` tested inside `feed_larvae`
-                self.model.nest.feed_larvae()
+        # feed the larvae
+        else:
+            # `fungus.dead` tested inside `feed_larvae`
+            self.model.nest.feed_larvae()
 
-                self.set_roundtrip_length(
-                    mu=self.model.caretaker_roundtrip_mean, sigma=self.model.caretaker_roundtrip_std)
+            self.set_roundtrip_length(
+                mu=self.model.caretaker_roundtrip_mean, sigma=self.model.caretaker_roundtrip_std)
 
     def put_pheromone(self) -> None:
         """
         Put a pheromone on the current position of the ant if there is none yet,
         otherwise re-mark the cell.
         """
-        cell_agents = self.model.grid.get_cell_list_contents(self.pos)
-        for agent in cell_agents:
-            if isinstance(agent, Pheromone):
-                agent.remark()
-                return
-
-        agent = Pheromone(self.model.next_id(), self.model)
-        self.model.schedule.add(agent)
-        self.model.grid.place_agent(agent, self.pos)
+        self.model.pheromones.mark(*self.pos)
 
     def get_direction_towards_nest(self) -> (int, int):
         """
@@ -228,29 +327,25 @@ class AntAgent(BiasedRandomWalkerAgent):
         first element corresponding to the x direction and the second element
         corresponding to the y direction. Directions are in {-1, 0, 1}.
         """
-        nest_x, nest_y = self.model.nest.pos
-        self_x, self_y = self.pos
-
-        angle = np.arctan2(nest_x - self_x, nest_y - self_y)
-        x_step = round(np.sin(angle))
-        y_step = round(np.cos(angle))
+        x_step, y_step = \
+            self.model.nest_geometry.step_rows[self.pos[0]][self.pos[1]]
 
         return x_step, y_step
 
-    def get_nearby_plants_and_pheromones(self) -> ([int],[int]):
+    def get_nearby_plants_and_pheromones(self) -> ([int], [(int, int)]):
         """
-        Returns two lists of pheromones and plants in the
-        Moore neighborhood of the current position.
+        Returns a list of plant indices and a list of the positions of
+        pheromones in the Moore neighborhood of the current position.
         """
-        neighbors = self.model.grid.get_neighbors(
-            self.pos, moore=True, include_center=True)
-        nearby_plants = []
-        nearby_pheromones = []
-        for p in neighbors:
-            if isinstance(p, Plant):
-                nearby_plants.append(p)
-            elif isinstance(p, Pheromone):
-                nearby_pheromones.append(p)
+        grid = self.model.grid
+        cell = grid.cell_index(self.pos)
+        neighbor_cells = grid.neighborhood_positions[cell]
+        nearby_plants = [plant for pos in neighbor_cells
+                         for plant in self.model.plants.on_cell(pos)]
+        pheromones = self.model.pheromones.present_cells(
+            grid.neighborhood_table[cell])
+        nearby_pheromones = [pos for pos, present
+                             in zip(neighbor_cells, pheromones) if present]
 
         return nearby_plants, nearby_pheromones
 
@@ -270,20 +365,11 @@ class AntAgent(BiasedRandomWalkerAgent):
         # add fitness to fitness_queue
         fitness = 1 - interaction_prob
 
-        try:
-            self.model.nest.fitness_queue.put_nowait(fitness)
-        except queue.Full:
-            self.model.nest.fitness_queue.get()
-            self.model.nest.fitness_queue.put_nowait(fitness)
+        self.model.nest.push_fitness(fitness)
 
-        # Drafting a random caretaker
+        # Drafting a random caretaker, all caretakers are on the nest
         if self.random.random() <= (1 - interaction_prob):
-            nest_content = self.model.grid.iter_cell_list_contents(self.pos)
-            caretakers = list(filter(
-               lambda a: isinstance(
-                  a, AntAgent) and a.state is AntWorkerState.CARETAKING,
-             nest_content
-            ))
+            caretakers = self.model.caretakers.ants
             if caretakers:
                 drafted_caretaker = self.random.choice(caretakers)
                 drafted_caretaker.state = AntWorkerState.EXPLORE
@@ -301,26 +387,17 @@ class AntAgent(BiasedRandomWalkerAgent):
         Calculates neighborhood density as the number of occupied
         cells in the Moore neighborhood of the current position.
         """
-        neighbor_cells = self.model.grid.get_neighborhood(
-            self.pos, moore=True, include_center=True)
-
-        count = 0
-        for cell in neighbor_cells:
-            for agent in self.model.grid.iter_cell_list_contents(cell):
-                if isinstance(
-                        agent, AntAgent) and self.unique_id != agent.unique_id:
-                    count += 1
-                    break
-
-        neighbor_density = count / 9
-        return neighbor_density
+        return self.model.grid.neighborhood_density(self.pos)
 
     def reset_trip(self) -> None:
         """
         Reset neighborhood density calculation variables.
         """
         if self.model.collect_data:
-            self.model.trip_durations.append(self.trip_duration)
+            if self.model.trip_summary is None:
+                self.model.trip_durations.append(self.trip_duration)
+            else:
+                self.model.trip_summary.add(self.trip_duration, self.unique_id)
 
         self.neighbor_density_acc = 0
         self.trip_duration = 0
@@ -332,4 +409,5 @@ class AntAgent(BiasedRandomWalkerAgent):
         """
         self.fungus_biomass_start = self.model.fungus.biomass
         # self.roundtrip_length = max(round(np.random.normal(mu, sigma)), 1)
-        self.roundtrip_length = round(np.random.uniform(1, mu * 2))
+        # uniform on [1, 2 * mu)
+        self.roundtrip_length = round(1 + (mu * 2 - 1) * self.model.uniforms())
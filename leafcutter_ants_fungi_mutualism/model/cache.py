@@ -0,0 +1,180 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+from enum import Enum
+
+import numpy as np
+
+
+_MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+_code_version = None
+
+
+def code_version() -> str:
+    """
+    Hash of the source of the model package, so cached results are not
+    reused after the model changes.
+    """
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(_MODEL_DIR)):
+            if name.endswith(".py"):
+                digest.update(name.encode())
+                with open(os.path.join(_MODEL_DIR, name), "rb") as f:
+                    digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def _canonical(value):
+    """
+    JSON representation of the values that make up a cache key.
+    """
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    if isinstance(value, type):
+        return f"{value.__module__}.{value.__qualname__}"
+    if callable(value):
+        # the source distinguishes lambdas, which all have the same name
+        try:
+            return inspect.getsource(value)
+        except (OSError, TypeError):
+            return f"{value.__module__}.{value.__qualname__}"
+    return repr(value)
+
+
+def run_key(model_cls, kwargs, max_steps, model_reporters=None,
+            agent_reporters=None, timeseries=True):
+    """
+    Cache key of a model run: a hash of the model class, its constructor
+    `kwargs` (including the seed), the horizon `max_steps`, the reporters
+    evaluated on it and the model source version. `None` if the run has no
+    seed and is therefore not reproducible.
+    """
+    if kwargs.get("seed") is None:
+        return None
+
+    description = json.dumps({
+        "model": model_cls,
+        "kwargs": kwargs,
+        "max_steps": max_steps,
+        "model_reporters": model_reporters or {},
+        "agent_reporters": agent_reporters or {},
+        "timeseries": timeseries,
+        "code": code_version(),
+    }, sort_keys=True, default=_canonical)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+class RunCache:
+    """
+    On-disk cache of `RunResult`s at `path`, keyed by `run_key`. Runners
+    look up every run before dispatching it and only simulate the misses.
+
+    If `max_bytes` is given, the least recently used results are evicted
+    when the cache grows beyond it.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # total size of the cached results, computed when first needed
+        self._size = None
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key + ".pkl")
+
+    def _entries(self):
+        """
+        (last use, size, file) of every cached result.
+        """
+        entries = []
+        for directory, _, names in os.walk(self.path):
+            for name in names:
+                if name.endswith(".pkl"):
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        """
+        Total size of the cached results in bytes.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def get(self, key):
+        """
+        The cached result of `key`, `None` on a miss.
+        """
+        if key is not None:
+            path = self._file(key)
+            try:
+                with open(path, "rb") as f:
+                    result = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+            else:
+                # marks the result as recently used
+                os.utime(path)
+                self.hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key, result) -> None:
+        """
+        Cache `result` under `key` (not cached if `key` is `None`).
+        """
+        if key is None:
+            return
+
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.max_bytes is not None and self._size is None:
+            self._size = self.size()
+        replaced = os.path.getsize(path) if os.path.exists(path) else 0
+
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        if self.max_bytes is not None:
+            self._size += os.path.getsize(path) - replaced
+            if self._size > self.max_bytes:
+                self.evict(self.max_bytes)
+
+    def evict(self, max_bytes) -> None:
+        """
+        Remove the least recently used results until the cache is at most
+        `max_bytes` large.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def stats(self) -> str:
+        """
+        Hit statistics, for printing.
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return (f"{self.hits} hits, {self.misses} misses ({rate:.0%} hit "
+                f"rate), {self.evictions} evictions")
@@ -0,0 +1,137 @@
+from collections import defaultdict
+from functools import partial
+
+
+class CaretakerTimers:
+    """
+    The caretakers of the colony. Caretakers stay on the nest and only act
+    when their round trip (or dormancy) ends, so instead of being stepped by
+    the schedule every tick they are woken up by a timer wheel: a mapping from
+    a tick to the caretakers whose round trip ends at that tick. Every tick,
+    only the caretakers that wake up are touched and caretaker mortality is
+    applied in bulk.
+
+    The caretakers that wake up act in the random activation order of the
+    foragers (see `step`). A caretaker that is drafted as a forager leaves
+    with the remaining length of its round trip, which it resumes if it
+    becomes a caretaker again.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        # the tick processed by the next call to `step`
+        self.now = 0
+        self.ants = []
+        self.wheel = defaultdict(list)
+
+    def __len__(self):
+        return len(self.ants)
+
+    def __iter__(self):
+        return iter(self.ants)
+
+    def add(self, ant) -> None:
+        """
+        Start caretaking with `ant`. Its first caretaking tick is the next
+        tick, which also counts towards its round trip.
+        """
+        ant.timer_index = len(self.ants)
+        self.ants.append(ant)
+        if ant.roundtrip_length is None:
+            # the first round trip is drawn on the first caretaking tick
+            self.set_timer(ant, self.now)
+        else:
+            self.set_timer(ant, self.now + ant.roundtrip_length - 1)
+
+    def remove(self, ant) -> None:
+        """
+        Stop caretaking with `ant` (it died or was drafted as a forager).
+        """
+        last = self.ants.pop()
+        if last is not ant:
+            self.ants[ant.timer_index] = last
+            last.timer_index = ant.timer_index
+
+        if ant.roundtrip_length is not None:
+            # remaining ticks of the round trip, counting the next tick (at
+            # least that tick if it was drafted before waking up at this one)
+            ant.roundtrip_length = max(ant.wake_step - self.now + 1, 1)
+        # the wheel only holds the timers of the caretakers, an activation
+        # already handed to the schedule is skipped by `wake`
+        entries = self.wheel.get(ant.wake_step)
+        if entries is not None and ant in entries:
+            entries.remove(ant)
+            if not entries:
+                del self.wheel[ant.wake_step]
+        ant.wake_step = None
+
+    def next_wake(self):
+        """
+        Number of ticks until the next tick at which a caretaker wakes up (0
+        if one wakes up at the current tick), `None` if no caretaker is
+        waiting.
+        """
+        if not self.wheel:
+            return None
+        return min(self.wheel) - self.now
+
+    def advance(self, ticks) -> None:
+        """
+        Skip `ticks` ticks at which no caretaker wakes up.
+        """
+        end = self.now + ticks
+        for tick in [tick for tick in self.wheel if tick < end]:
+            del self.wheel[tick]
+        self.now = end
+
+    def set_timer(self, ant, tick) -> None:
+        """
+        Wake `ant` up at `tick`.
+        """
+        ant.wake_step = tick
+        self.wheel[tick].append(ant)
+
+    def step(self) -> list:
+        """
+        Apply caretaker mortality and advance to the next tick. Returns one
+        activation (a callable) for every caretaker whose round trip ends at
+        this tick, which the schedule runs in its random activation order
+        among the foragers, like the caretakers were activated before they
+        had timers.
+        """
+        model = self.model
+        tick = self.now
+
+        # mortality
+        if self.ants:
+            deaths = model.rng.binomial(len(self.ants),
+                                        model.ant_death_probability)
+            dying = [self.ants[i]
+                     for i in model.random.sample(range(len(self.ants)),
+                                                  deaths)]
+            for ant in dying:
+                ant.die()
+
+        self.now += 1
+        return [partial(self.wake, ant, tick)
+                for ant in dict.fromkeys(self.wheel.pop(tick, ()))]
+
+    def wake(self, ant, tick) -> None:
+        """
+        Wake `ant` up at the end of its round trip at `tick`, unless it died
+        or was drafted since the timer was set.
+        """
+        if ant.wake_step != tick:
+            return
+
+        if ant.roundtrip_length is None:
+            # first caretaking tick of the ant
+            ant.set_roundtrip_length(
+                mu=self.model.caretaker_roundtrip_mean,
+                sigma=self.model.caretaker_roundtrip_std)
+            if ant.roundtrip_length > 1:
+                self.set_timer(ant, tick + ant.roundtrip_length - 1)
+                return
+
+        ant.caretaking_step()
+        self.set_timer(ant, tick + ant.roundtrip_length)
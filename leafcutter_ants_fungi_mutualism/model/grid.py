@@ -0,0 +1,121 @@
+from mesa.space import MultiGrid
+from functools import lru_cache
+import numpy as np
+
+
+# Moore neighborhood offsets, the center cell is the first row
+MOORE_OFFSETS = np.array([(0, 0), (-1, -1), (-1, 0), (-1, 1), (0, -1),
+                          (0, 1), (1, -1), (1, 0), (1, 1)])
+MOORE_OFFSETS.setflags(write=False)
+
+
+@lru_cache(maxsize=None)
+def moore_neighborhood_table(width, height):
+    """
+    Flat cell indices (`x * height + y`) of the Moore neighborhood of every
+    cell of a `width` x `height` torus grid, as a read-only array of shape
+    (width * height, 9). Columns follow `MOORE_OFFSETS`, so column 0 is the
+    cell itself. Tables are cached and shared between models of the same
+    size.
+    """
+    xs, ys = np.divmod(np.arange(width * height), height)
+    neighbor_xs = (xs[:, None] + MOORE_OFFSETS[:, 0]) % width
+    neighbor_ys = (ys[:, None] + MOORE_OFFSETS[:, 1]) % height
+    table = neighbor_xs * height + neighbor_ys
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=None)
+def moore_neighborhood_positions(width, height):
+    """
+    The same neighborhoods as `moore_neighborhood_table`, as a tuple (indexed
+    by flat cell index) of tuples of 9 position tuples. Used for moving Mesa
+    agents without allocating position tuples.
+    """
+    table = moore_neighborhood_table(width, height)
+    return tuple(
+        tuple((cell // height, cell % height) for cell in row)
+        for row in table.tolist()
+    )
+
+
+def torus_moore_sum(values):
+    """
+    Sum of `values` over the Moore neighborhood (including the center) of
+    every cell of a torus grid, in a single 3x3 stencil pass.
+    """
+    total = np.zeros_like(values)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            total += np.roll(values, (dx, dy), axis=(0, 1))
+    return total
+
+
+class OccupancyGrid(MultiGrid):
+    """
+    Torus `MultiGrid` that counts the agents of type `tracked_type` on every
+    cell, updated on every placement, move and removal. It also keeps, for
+    every cell, the number of occupied cells in its Moore neighborhood
+    (including the center), so that neighborhood densities are a lookup
+    instead of a scan over the contents of nine cells.
+
+    Neighborhood queries use the precomputed `moore_neighborhood_table` and
+    `moore_neighborhood_positions` instead of Mesa's `get_neighborhood`.
+    """
+
+    def __init__(self, width, height, tracked_type):
+        super().__init__(width=width, height=height, torus=True)
+        self.tracked_type = tracked_type
+        self.neighborhood_table = moore_neighborhood_table(width, height)
+        self.neighborhood_positions = moore_neighborhood_positions(
+            width, height)
+        # number of tracked agents on each cell
+        self.occupancy = np.zeros((width, height), dtype=np.int64)
+        # number of cells with tracked agents in each Moore neighborhood
+        self.occupied_nearby = np.zeros((width, height), dtype=np.int64)
+
+    def _place_agent(self, pos, agent) -> None:
+        super()._place_agent(pos, agent)
+        if isinstance(agent, self.tracked_type):
+            self._update_occupancy(pos, 1)
+
+    def _remove_agent(self, pos, agent) -> None:
+        super()._remove_agent(pos, agent)
+        if isinstance(agent, self.tracked_type):
+            self._update_occupancy(pos, -1)
+
+    def _update_occupancy(self, pos, change) -> None:
+        x, y = pos
+        before = self.occupancy[x, y]
+        self.occupancy[x, y] = before + change
+        if before == 0 or before + change == 0:
+            # the cell became occupied or empty, update the stencil
+            neighbors = self.neighborhood_table[x * self.height + y]
+            self.occupied_nearby.reshape(-1)[neighbors] += change
+
+    def cell_index(self, pos) -> int:
+        """
+        Flat index of cell `pos`, as used by the neighborhood tables.
+        """
+        return pos[0] * self.height + pos[1]
+
+    def moore_neighborhood(self, pos):
+        """
+        Positions of the Moore neighborhood of `pos`, with `pos` itself first
+        and its 8 neighbors after it.
+        """
+        return self.neighborhood_positions[pos[0] * self.height + pos[1]]
+
+    def neighborhood_density(self, pos) -> float:
+        """
+        Fraction of cells in the Moore neighborhood (including the center) of
+        `pos` that hold at least one tracked agent, not counting a single
+        tracked agent located at `pos` itself.
+        """
+        x, y = pos
+        occupied = self.occupied_nearby[x, y]
+        if self.occupancy[x, y] == 1:
+            # the only agent on the center cell is the asking agent
+            occupied -= 1
+        return occupied / 9
@@ -1,63 +1,58 @@
 from mesa import Agent, Model
-from mesa.time import RandomActivation
-from mesa.space import MultiGrid
-from mesa.datacollection import DataCollector
-
-from .ant_agent import AntAgent, AntWorkerState, track_death_reason
-from .plant import Plant
-from .nest import Nest
+import numpy as np
+import random
+from collections import defaultdict
+
+from .ant_agent import (
+    AntAgent, AntWorkerState, AntCounters, DeathReason, track_death_reason
+)
+from .plant import Plants
+from .nest import Nest, NestGeometry
 from .fungus import Fungus
+from .pheromone import PheromoneField
+from .grid import OccupancyGrid
+from .caretakers import CaretakerTimers
+from .schedule import StagedTypeActivation
+from .stopping import AntBudgetExceeded, SteadyStateDetector
+from .recorder import ColumnRecorder
+from .trips import TripSummary
+from .rng import UniformBuffer
 
 
 def track_ants_leaves(model):
     """
     Count number of ants with leaves in the model
     """
-    return sum(1 for agent in model.schedule.agents
-               if isinstance(agent, AntAgent) and agent.has_leaf)
+    return model.ant_counts.with_leaf
 
 
 def track_ants(model):
     """
     Count total number of ants in the model
     """
-    return sum(1 for agent in model.schedule.agents
-               if isinstance(agent, AntAgent))
+    return model.ant_counts.ants
 
 
 def track_dormant_ants(model):
     """
     Calculate ratio of dormant ants with respect to total number of caretakers
     """
-    caretakers_count = 0
-    dormant_count = 0
-    for agent in model.schedule.agents:
-        if isinstance(
-                agent, AntAgent) and agent.state is AntWorkerState.CARETAKING:
-            caretakers_count += 1
-            if agent.dormant:
-                dormant_count += 1
-    if caretakers_count == 0:
+    counts = model.ant_counts
+    if counts.caretakers == 0:
         return 0.0
     else:
-        return dormant_count / caretakers_count
+        return counts.dormant_caretakers / counts.caretakers
 
 
 def track_ratio_foragers(model):
     """
     Calculate fraction of foragers in the ant population
     """
-    n_ants = 0
-    n_foragers = 0
-    for agent in model.schedule.agents:
-        if isinstance(agent, AntAgent):
-            n_ants += 1
-            if agent.state is not AntWorkerState.CARETAKING:
-                n_foragers += 1
+    counts = model.ant_counts
 
     # avoid `ZeroDivisionError`
-    if n_ants > 0:
-        return n_foragers / n_ants
+    if counts.ants > 0:
+        return (counts.ants - counts.caretakers) / counts.ants
     else:
         return 0.0
 
@@ -67,19 +62,32 @@ def track_forager_fitness(model):
     Calculate the mean forager fitness using the Moran
     process queue
     """
-    fitness_queue_list = list(model.nest.fitness_queue.queue)
-    if len(fitness_queue_list) != 0:
-        return sum(fitness_queue_list) / len(fitness_queue_list)
-    else:
-        return 0.5
+    return model.nest.average_fitness()
 
 
 def track_leaves(model):
     """
-    Count number of ants that are carrying leaves
+    Count number of leaves available on the plants
+    """
+    return model.plants.total_leaves()
+
+
+def track_fungus_biomass(model):
+    """
+    Biomass of the fungus
     """
-    return sum(agent.num_leaves for agent in model.schedule.agents
-               if isinstance(agent, Plant))
+    return model.fungus.biomass
+
+
+# reporters recorded by the model, by column name
+MODEL_REPORTERS = {
+    "Fungus Biomass": track_fungus_biomass,
+    "Ant Biomass": track_ants,
+    "Ants with Leaves": track_ants_leaves,
+    "Fraction forager ants": track_ratio_foragers,
+    "Available leaves": track_leaves,
+    "Dormant caretakers fraction": track_dormant_ants
+}
 
 
 class LeafcutterAntsFungiMutualismModel(Model):
@@ -102,8 +110,24 @@ class LeafcutterAntsFungiMutualismModel(Model):
                  fungus_larvae_cvn=0.9, energy_per_offspring=1.0,
                  fungus_biomass_death_threshold=5.0, caretaker_carrying_amount=1,
                  max_fitness_queue_size=20, caretaker_roundtrip_mean=5.0,
-                 caretaker_roundtrip_std=5.0, dormant_roundtrip_mean=60.0):
+                 caretaker_roundtrip_std=5.0, dormant_roundtrip_mean=60.0,
+                 check_counters=False, stop_on_death=False,
+                 steady_state_window=None, steady_state_tolerance=0.01,
+                 fast_forward=True, reporters=None, record_interval=1,
+                 record_steps=None, trip_summary=False, trip_bins=None,
+                 trip_sample_every=None, ant_budget=None,
+                 ant_budget_action="censor"):
         super().__init__()
+        # all randomness comes from `self.random` and the NumPy generator
+        # `self.rng`, both seeded by `seed`. Without a seed, one is drawn
+        # from fresh entropy and stored, so every run can be reproduced.
+        seed_sequence = np.random.SeedSequence(seed)
+        self.seed = seed_sequence.entropy
+        self._seed = self.seed
+        self.random = random.Random(self.seed)
+        self.rng = np.random.default_rng(seed_sequence)
+        # NumPy random numbers, drawn in blocks for per-agent use
+        self.uniforms = UniformBuffer(self.rng)
         # model parameters
         # please consult report for detailed explanation
         self.death_reason = None
@@ -122,9 +146,37 @@ class LeafcutterAntsFungiMutualismModel(Model):
         self.fungus_biomass_death_threshold = fungus_biomass_death_threshold
         self.max_fitness_queue_size = max_fitness_queue_size
         self.caretaker_carrying_amount = caretaker_carrying_amount
-
-        self.schedule = RandomActivation(self)
-        self.grid = MultiGrid(width=width, height=height, torus=True)
+        # compare the live ant counters to a brute-force scan every step
+        self.check_counters = check_counters
+        # stop conditions: colony death, and a steady state of the fungus
+        # biomass and ant count over `steady_state_window` steps
+        self.stop_on_death = stop_on_death
+        self.steady_state = None
+        if steady_state_window:
+            self.steady_state = SteadyStateDetector(
+                steady_state_window, steady_state_tolerance)
+        # step at which a stop condition ended the run, if any
+        self.stop_step = None
+        # at most `ant_budget` live ants: once the colony would outgrow it,
+        # the run is stopped and censored (`ant_budget_exceeded`, which is not
+        # a death), or aborted with an `AntBudgetExceeded` error
+        if ant_budget_action not in ("censor", "abort"):
+            raise ValueError(f"unknown ant_budget_action "
+                             f"{ant_budget_action!r}, choose censor or abort")
+        self.ant_budget = ant_budget
+        self.ant_budget_action = ant_budget_action
+        self.ant_budget_exceeded = False
+        # skip quiescent ticks in bulk in `run_model`
+        self.fast_forward = fast_forward
+        self.ant_counts = AntCounters()
+
+        # ants are activated in random order, then the nest and the fungus
+        self.schedule = StagedTypeActivation(
+            self, random_types=(AntAgent,), phase_types=(Nest, Fungus))
+        # caretakers are woken up by timers instead of the schedule
+        self.caretakers = CaretakerTimers(self)
+        self.grid = OccupancyGrid(width, height, tracked_type=AntAgent)
+        self.pheromones = PheromoneField(self, width, height)
         self.initial_foragers_ratio = initial_foragers_ratio
 
         self.nest = None
@@ -134,29 +186,34 @@ class LeafcutterAntsFungiMutualismModel(Model):
         self.dormant_roundtrip_mean = dormant_roundtrip_mean
         self.init_agents()
 
-        self.datacollector = DataCollector(
-            model_reporters={
-                "Fungus Biomass": lambda model: model.fungus.biomass,
-                "Ant Biomass": track_ants,
-                "Ants with Leaves": track_ants_leaves,
-                "Fraction forager ants": track_ratio_foragers,
-                "Available leaves": track_leaves,
-                "Dormant caretakers fraction": track_dormant_ants
-            }
-        )
+        # `reporters` is a list of names from `MODEL_REPORTERS` or a dict of
+        # column names to reporter functions. They are recorded at the end of
+        # every `record_interval`-th step (step 0 is the initial state), or
+        # only at the steps in `record_steps`.
+        if reporters is None:
+            reporters = MODEL_REPORTERS
+        elif not isinstance(reporters, dict):
+            reporters = {name: MODEL_REPORTERS[name] for name in reporters}
+        self.datacollector = ColumnRecorder(
+            reporters, interval=record_interval, steps=record_steps)
 
         self.running = True
 
+        # the forager's trip durations are tracked manually, either in full
+        # by appending to the `trip_durations` list or, if `trip_summary` is
+        # set, as a histogram and summary statistics (see `TripSummary`)
+        self.trip_summary = None
         if self.collect_data:
-            # Mesa doesn't have a nicer way to not collect data every timestep,
-            # so we track the forager's trip durations manually by appending to
-            # this list.
-            self.trip_durations = []
+            if trip_summary:
+                self.trip_summary = TripSummary(trip_bins, trip_sample_every)
+            else:
+                self.trip_durations = []
 
             self.datacollector.collect(self)
 
     def init_agents(self):
         self.init_nest()
+        self.nest_geometry = NestGeometry(self.grid, self.nest.pos)
         self.init_plants()
         self.init_ants()
         self.init_fungus()
@@ -176,10 +233,8 @@ class LeafcutterAntsFungiMutualismModel(Model):
         housing plants are drawn from a uniform distribution that
         excludes the cell housing the nest.
         """
+        positions = []
         for i in range(self.num_plants):
-            agent = Plant(self.next_id(), self)
-            self.schedule.add(agent)
-
             x = self.random.randrange(self.grid.width)
             y = self.random.randrange(self.grid.height)
 
@@ -188,7 +243,9 @@ class LeafcutterAntsFungiMutualismModel(Model):
                 x = self.random.randrange(self.grid.width)
                 y = self.random.randrange(self.grid.height)
 
-            self.grid.place_agent(agent, (x, y))
+            positions.append((x, y))
+
+        self.plants = Plants(self, positions)
 
     def init_ants(self):
         """
@@ -202,9 +259,9 @@ class LeafcutterAntsFungiMutualismModel(Model):
             self.grid.place_agent(agent, self.nest.pos)
 
         for i in range(self.num_ants - foragers_count):
+            # caretakers are added to `self.caretakers` instead of the schedule
             agent = AntAgent(self.next_id(), self,
                              state=AntWorkerState.CARETAKING)
-            self.schedule.add(agent)
             self.grid.place_agent(agent, self.nest.pos)
 
     def init_fungus(self):
@@ -220,10 +277,180 @@ class LeafcutterAntsFungiMutualismModel(Model):
 
     def step(self):
         """
-        A model step. Used for collecting data and advancing the schedule
+        A model step. Used for advancing the schedule, with the caretakers
+        that wake up activated among the foragers, and collecting data
         """
+        self.schedule.step(interleave=self.caretakers.step())
+        self.death_reason = track_death_reason(self)
+        self.check_stop_conditions()
+
         if self.collect_data:
             self.datacollector.collect(self)
 
-        self.schedule.step()
-        self.death_reason = track_death_reason(self)
+        if self.check_counters:
+            self.ant_counts.verify(self)
+
+    def live_ants(self) -> int:
+        """
+        Number of live ants, also in the middle of a step.
+        """
+        return self.ant_counts.ants
+
+    def ant_agents(self) -> list:
+        """
+        All live ants: the scheduled foragers and the caretakers.
+        """
+        return self.schedule.agents_of_type(AntAgent) + list(self.caretakers)
+
+    def agents(self) -> list:
+        """
+        All agents, for the agent-level reporters: the scheduled agents and
+        the caretakers, which wait outside the schedule.
+        """
+        return self.schedule.agents + list(self.caretakers)
+
+    def exceed_ant_budget(self) -> None:
+        """
+        Called when the colony would outgrow the ant budget.
+        """
+        if self.ant_budget_action == "abort":
+            raise AntBudgetExceeded(
+                f"the colony outgrew the budget of {self.ant_budget} ants "
+                f"at step {self.schedule.steps}")
+        self.ant_budget_exceeded = True
+
+    def check_stop_conditions(self) -> None:
+        """
+        Stop the model (set `running` to False and record `stop_step`) if the
+        colony outgrew the ant budget, if the colony died and `stop_on_death`
+        is set, or if the fungus biomass and ant count reached a steady state.
+        """
+        if self.ant_budget_exceeded:
+            self.stop()
+        elif self.stop_on_death and self.death_reason:
+            self.stop()
+        elif self.steady_state and self.steady_state.update(
+                self.fungus.biomass, self.ant_counts.ants):
+            self.stop()
+
+    def stop(self) -> None:
+        self.running = False
+        self.stop_step = self.schedule.steps
+
+    def run_model(self, max_steps=None, limits=None) -> None:
+        """
+        Step the model until it stops, or for at most `max_steps` steps. If a
+        stop condition ended the run early, the final state is carried forward
+        in the collected time series, so that they have the same length as
+        those of a run of `max_steps` steps. `limits` (`RunLimits`) are
+        checked after every step.
+        """
+        if max_steps is None:
+            super().run_model()
+            return
+
+        if self.collect_data:
+            self.datacollector.reserve(max_steps)
+        while self.running and self.schedule.steps < max_steps:
+            if not (self.fast_forward and self.quiescent()
+                    and self.skip_quiescent(max_steps)):
+                self.step()
+            if limits is not None:
+                limits.check(self.schedule.steps)
+
+        if self.collect_data and self.schedule.steps < max_steps:
+            self.carry_forward(max_steps)
+
+    def quiescent(self) -> bool:
+        """
+        Whether nothing but caretaker mortality and fungus decay can happen
+        until the next caretaker wakes up: there are no foragers, the fungus
+        has no energy to convert to biomass and the nest has too little energy
+        for offspring. Pheromones and plants need no updates, as they are
+        brought up to date when they are read.
+        """
+        return self.schedule.get_type_count(AntAgent) == 0 and \
+            self.fungus.energy == 0 and \
+            self.nest.energy_buffer < self.energy_per_offspring
+
+    def skip_quiescent(self, max_steps) -> int:
+        """
+        Advance a quiescent model (see `quiescent`) up to the next tick at
+        which a caretaker wakes up, or up to `max_steps`, without stepping the
+        schedule. The death tick of every caretaker is drawn at once (the
+        number of ticks until death is geometric) and the fungus decay is
+        applied in closed form. Collected data, the death reason and the stop
+        conditions are updated for every skipped tick. Returns the number of
+        ticks skipped.
+        """
+        ticks = max_steps - self.schedule.steps
+        next_wake = self.caretakers.next_wake()
+        if next_wake is not None:
+            ticks = min(ticks, next_wake)
+        if ticks <= 0:
+            return 0
+
+        # caretaker mortality, by tick within the skipped ticks
+        caretakers = list(self.caretakers)
+        if self.ant_death_probability > 0:
+            death_ticks = self.rng.geometric(
+                self.ant_death_probability, len(caretakers)) - 1
+        else:
+            death_ticks = np.full(len(caretakers), ticks)
+        deaths = defaultdict(list)
+        for i in np.flatnonzero(death_ticks < ticks).tolist():
+            deaths[int(death_ticks[i])].append(caretakers[i])
+
+        # fungus biomass after every skipped tick, it stops decaying when it
+        # dies
+        fungus = self.fungus
+        biomass = np.full(ticks, fungus.biomass)
+        if not fungus.dead:
+            biomass *= (1 - self.fungus_decay_rate) ** np.arange(1, ticks + 1)
+            dying = np.flatnonzero(
+                biomass < self.fungus_biomass_death_threshold)
+            if dying.size:
+                biomass[dying[0]:] = biomass[dying[0]]
+
+        if not (self.collect_data or self.stop_on_death or self.steady_state):
+            # nothing observes the skipped ticks, jump to the last one
+            for tick_deaths in deaths.values():
+                for ant in tick_deaths:
+                    ant.die()
+            self.advance_quiescent(ticks, biomass[-1])
+            self.death_reason = track_death_reason(self)
+            skipped = ticks
+        else:
+            for skipped in range(1, ticks + 1):
+                for ant in deaths.get(skipped - 1, ()):
+                    ant.die()
+                self.advance_quiescent(1, biomass[skipped - 1])
+                self.death_reason = track_death_reason(self)
+                self.check_stop_conditions()
+                if self.collect_data:
+                    self.datacollector.collect(self)
+                if not self.running:
+                    break
+
+        if self.check_counters:
+            self.ant_counts.verify(self)
+        return skipped
+
+    def advance_quiescent(self, ticks, biomass) -> None:
+        """
+        Advance the clocks of the model by `ticks` quiescent ticks, after
+        which the fungus has `biomass`.
+        """
+        self.fungus.biomass = float(biomass)
+        if not self.fungus.dead:
+            self.fungus.check_death()
+        self.caretakers.advance(ticks)
+        self.schedule.steps += ticks
+        self.schedule.time += ticks
+
+    def carry_forward(self, max_steps) -> None:
+        """
+        Fill the collected time series up to `max_steps` steps with the
+        current state of the model.
+        """
+        self.datacollector.fill(self, self.schedule.steps + 1, max_steps)
@@ -1,4 +1,5 @@
 from mesa import Agent
+import numpy as np
 import queue
 from .ant_agent import AntAgent, AntWorkerState
 
@@ -22,20 +23,37 @@ class Nest(Agent):
         two possible states are probabalistically assigned to the new adults
         based on the average fitness value of the Moran process queue.
         """
-        fitness_queue_list = list(self.fitness_queue.queue)
-        if len(fitness_queue_list) != 0:
-            average_fitness = sum(fitness_queue_list) / len(fitness_queue_list)
-        else:
-            # Assuming uniform apriori role distribution
-            average_fitness = 0.5
+        average_fitness = self.average_fitness()
         for _ in range(n):
             agent = AntAgent(self.model.next_id(), self.model)
+            self.model.schedule.add(agent)
+            self.model.grid.place_agent(agent, self.pos)
 
             if self.random.random() > average_fitness:
                 agent.state = AntWorkerState.CARETAKING
 
-            self.model.schedule.add(agent)
-            self.model.grid.place_agent(agent, self.pos)
+    def average_fitness(self) -> float:
+        """
+        Mean forager fitness in the Moran process queue. An empty queue
+        corresponds to a uniform apriori role distribution.
+        """
+        fitness_queue_list = list(self.fitness_queue.queue)
+        if len(fitness_queue_list) != 0:
+            return sum(fitness_queue_list) / len(fitness_queue_list)
+        else:
+            # Assuming uniform apriori role distribution
+            return 0.5
+
+    def push_fitness(self, fitness) -> None:
+        """
+        Add a forager fitness value to the Moran process queue, dropping the
+        oldest value if the queue is full.
+        """
+        try:
+            self.fitness_queue.put_nowait(fitness)
+        except queue.Full:
+            self.fitness_queue.get()
+            self.fitness_queue.put_nowait(fitness)
 
     def feed_larvae(self) -> None:
         """
@@ -50,9 +68,47 @@ class Nest(Agent):
     def step(self) -> None:
         """
         Consume energy from the energy buffer and create new adult ants.
-        The amount of energy required per new ant is a fixed constant.
+        The amount of energy required per new ant is a fixed constant. No
+        more ants are born than the model's ant budget allows.
         """
         offspring_count = int(self.energy_buffer /
                               self.model.energy_per_offspring)
         self.energy_buffer -= offspring_count * self.model.energy_per_offspring
+
+        budget = self.model.ant_budget
+        if budget is not None:
+            room = max(budget - self.model.live_ants(), 0)
+            if offspring_count > room:
+                self.model.exceed_ant_budget()
+                offspring_count = room
         self.ant_birth(offspring_count)
+
+
+class NestGeometry:
+    """
+    Fields over the model grid that only depend on the position of the nest.
+    The nest never moves, so they are computed once when the model is built
+    and ants navigate with table lookups.
+    """
+
+    def __init__(self, grid, nest_pos):
+        width, height = grid.width, grid.height
+        xs, ys = np.indices((width, height))
+        dx = nest_pos[0] - xs
+        dy = nest_pos[1] - ys
+
+        # manhattan distance from every cell to the nest
+        self.distance = np.abs(dx) + np.abs(dy)
+        # direction of a step towards the nest, in {-1, 0, 1}
+        angle = np.arctan2(dx, dy)
+        self.step_x = np.rint(np.sin(angle)).astype(np.int64)
+        self.step_y = np.rint(np.cos(angle)).astype(np.int64)
+
+        # the same fields as lists for single ant queries: distances indexed
+        # by `[x][y]` and the position after a step towards the nest indexed
+        # by flat cell index
+        self.distance_rows = self.distance.tolist()
+        self.step_rows = np.stack((self.step_x, self.step_y), axis=-1).tolist()
+        self.step_target = tuple(zip(
+            ((xs + self.step_x) % width).ravel().tolist(),
+            ((ys + self.step_y) % height).ravel().tolist()))
@@ -1,18 +1,44 @@
-from mesa import Agent
+import numpy as np
 
 
-class Pheromone(Agent):
-    def __init__(self, unique_id, model):
-        super().__init__(unique_id, model)
-        self.initial_lifespan = self.model.pheromone_lifespan
-        self.lifespan = self.model.pheromone_lifespan
+# marking time of cells that never held a pheromone, far enough in the past to
+# never be considered present and to not overflow when subtracted from
+NEVER_MARKED = np.iinfo(np.int64).min // 2
 
-    def remark(self):
-        self.lifespan = self.model.pheromone_lifespan
 
-    def step(self):
-        self.lifespan -= 1
+class PheromoneField:
+    """
+    Pheromone trails on the model grid, stored as the step at which each cell
+    was last marked. A cell holds a pheromone while fewer than
+    `model.pheromone_lifespan` steps have passed since it was marked, so
+    pheromones decay without any work per time step and re-marking a cell is
+    a single assignment.
+    """
 
-        if self.lifespan == 0:
-            self.model.grid._remove_agent(self.pos, self)
-            self.model.schedule.remove(self)
+    def __init__(self, model, width, height):
+        self.model = model
+        self.last_marked = np.full((width, height), NEVER_MARKED,
+                                   dtype=np.int64)
+
+    def mark(self, x, y) -> None:
+        """
+        Put a pheromone on cell(s) `(x, y)`, or re-mark them if there already
+        is one. Accepts scalars or index arrays.
+        """
+        self.last_marked[x, y] = self.model.schedule.steps
+
+    def present_cells(self, cells):
+        """
+        Whether the cells with flat indices `cells` (see
+        `grid.moore_neighborhood_table`) currently hold a pheromone.
+        """
+        return self.model.schedule.steps - self.last_marked.reshape(-1)[cells] \
+            < self.model.pheromone_lifespan
+
+    def lifespan(self):
+        """
+        Remaining lifespan of the pheromone on every cell, 0 for cells
+        without a pheromone.
+        """
+        age = self.model.schedule.steps - self.last_marked
+        return np.clip(self.model.pheromone_lifespan - age, 0, None)
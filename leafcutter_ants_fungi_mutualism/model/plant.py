@@ -1,31 +1,109 @@
-from mesa import Agent
+import math
+import numpy as np
 
 
-class Plant(Agent):
+class Plants:
     """
-    Plant agent, the main resource for the ants. Ants collect
-    leaves from this agent and this agent regrows some of its leaves
-    at every time step.
+    The plants of the model, the main resource for the ants. Ants collect
+    leaves from the plants and the plants regrow some of their leaves at
+    every time step.
+
+    Plants never move, so they are held as arrays of positions, leaves and
+    the step at which the leaves were last brought up to date. Regrowth is
+    applied in closed form only when the leaves of a plant are read, instead
+    of stepping every plant at every time step. Plants are identified by their
+    index in these arrays.
     """
 
-    def __init__(self, unique_id, model):
-        super().__init__(unique_id, model)
+    def __init__(self, model, positions):
+        """
+        Parameters
+        ----------
+        model: Model object
+            Expected to have a `grid`, a `schedule`, and the `num_plant_leaves`
+            and `leaf_regrowth_rate` attributes.
+        positions: array of shape (n, 2)
+            Grid cell of each plant, several plants may share a cell.
+        """
+        self.model = model
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        self.x = positions[:, 0]
+        self.y = positions[:, 1]
         self.initial_num_leaves = self.model.num_plant_leaves
-        self.num_leaves = self.model.num_plant_leaves
+        self.num_leaves = np.full(len(positions), self.initial_num_leaves,
+                                  dtype=np.float64)
+        self.last_updated = np.full(len(positions), self.model.schedule.steps,
+                                    dtype=np.int64)
+
+        # plant lookup: number of plants on each cell and the plant indices
+        # sorted by cell, with the offset of each cell into the sorted indices
+        width, height = self.model.grid.width, self.model.grid.height
+        cells = self.x * height + self.y
+        self.counts = np.bincount(
+            cells, minlength=width * height).reshape(width, height)
+        self.by_cell = np.argsort(cells, kind="stable")
+        self.cell_start = np.concatenate(
+            ([0], np.cumsum(self.counts.ravel())[:-1]))
+        # the same lookup as lists for single cell queries
+        self.cell_plants = [[] for _ in range(width * height)]
+        for i in self.by_cell.tolist():
+            self.cell_plants[cells[i]].append(i)
+
+    def __len__(self):
+        return len(self.num_leaves)
+
+    def on_cell(self, pos) -> [int]:
+        """
+        Indices of the plants on cell `pos`.
+        """
+        return self.cell_plants[pos[0] * self.model.grid.height + pos[1]]
+
+    def get_leaves(self, i) -> float:
+        """
+        Up to date number of leaves of plant `i`.
+        """
+        now = self.model.schedule.steps
+        elapsed = now - self.last_updated[i]
+        if elapsed:
+            leaves = self.num_leaves[i]
+            cap = self.initial_num_leaves
+            rate = self.model.leaf_regrowth_rate
+            if leaves < cap and rate > 0:
+                # the leaves grow at every step until they reach the cap
+                growing = min(elapsed, math.ceil((cap - leaves) / rate))
+                self.num_leaves[i] = leaves + growing * rate
+            self.last_updated[i] = now
+        return self.num_leaves[i]
+
+    def update(self, idx=slice(None)) -> None:
+        """
+        Bring the leaves of the plants at indices `idx` (default: all) up to
+        date.
+        """
+        now = self.model.schedule.steps
+        elapsed = now - self.last_updated[idx]
+        leaves = self.num_leaves[idx]
+        rate = self.model.leaf_regrowth_rate
+        if rate > 0:
+            growing = np.ceil((self.initial_num_leaves - leaves) / rate)
+            growing = np.clip(np.minimum(elapsed, growing), 0, None)
+            self.num_leaves[idx] = leaves + growing * rate
+        self.last_updated[idx] = now
 
-    def take_leaf(self) -> bool:
+    def take_leaf(self, i) -> bool:
         """
-        Called by ants in the `HARVEST` state. One unit of leaf is removed.
+        Called by ants in the `HARVEST` state. One unit of leaf is removed from
+        plant `i`.
         """
-        if self.num_leaves >= 1:
-            self.num_leaves -= 1
+        if self.get_leaves(i) >= 1:
+            self.num_leaves[i] -= 1
             return True
 
         return False
 
-    def step(self) -> None:
+    def total_leaves(self) -> float:
         """
-        The leaves regrow at a fixed rate up to a fixed upper bound.
+        Total number of leaves on all plants.
         """
-        if self.num_leaves < self.initial_num_leaves:
-            self.num_leaves += self.model.leaf_regrowth_rate
+        self.update()
+        return float(self.num_leaves.sum())
@@ -1,9 +1,69 @@
 from mesa import Agent
+from bisect import bisect_right
 import numpy as np
 
+from .grid import MOORE_OFFSETS
 from .util import manhattan_distance
 
 
+def biased_walk_weights(prev_dx, prev_dy):
+    """
+    Unnormalized probabilities of stepping to each of the 8 neighbors (in
+    `MOORE_OFFSETS[1:]` order) for walkers whose previous position is at
+    offset `(prev_dx, prev_dy)` from their current position: the manhattan
+    distance between each neighbor and the previous position. Accepts scalars
+    or arrays, returns one row of 8 weights per walker.
+    """
+    offsets = MOORE_OFFSETS[1:]
+    prev_dx = np.asarray(prev_dx)[..., None]
+    prev_dy = np.asarray(prev_dy)[..., None]
+    return np.abs(prev_dx - offsets[:, 0]) + np.abs(prev_dy - offsets[:, 1])
+
+
+# Away from the border of the grid, the walk only depends on the offset of the
+# previous position, which is in the Moore neighborhood of the current position
+# except right after a trip to the nest. The 9 cumulative distributions of
+# those offsets, indexed by `[prev_dx + 1, prev_dy + 1]`.
+_offsets = np.arange(-1, 2)
+BIASED_WALK_CDF = np.cumsum(
+    biased_walk_weights(_offsets[:, None], _offsets[None, :]), axis=-1)
+BIASED_WALK_CDF = BIASED_WALK_CDF / BIASED_WALK_CDF[..., -1:]
+BIASED_WALK_CDF.setflags(write=False)
+# the same tables as lists for scalar lookups
+_BIASED_WALK_CDF_LISTS = BIASED_WALK_CDF.tolist()
+
+
+def biased_walk_choice(x, y, prev_x, prev_y, uniforms, grid):
+    """
+    Vectorized biased random walk step: for each walker at `(x, y)` with
+    previous position `(prev_x, prev_y)`, the column (1 to 8) of the Moore
+    neighborhood table of the torus `grid` to move to, given one uniform
+    draw per walker. Walkers away from the border of the grid with a
+    previous position in their Moore neighborhood use `BIASED_WALK_CDF`,
+    others get their distribution computed from the manhattan distances to
+    the (wrapped) neighbor positions, like `BiasedRandomWalkerAgent`.
+    """
+    prev_dx = prev_x - x
+    prev_dy = prev_y - y
+    near = (np.abs(prev_dx) <= 1) & (np.abs(prev_dy) <= 1) & \
+        (x > 0) & (x < grid.width - 1) & (y > 0) & (y < grid.height - 1)
+
+    cumulative = np.empty((len(x), 8))
+    cumulative[near] = BIASED_WALK_CDF[prev_dx[near] + 1, prev_dy[near] + 1]
+    if not near.all():
+        far = ~near
+        neighbors = grid.neighborhood_table[
+            x[far] * grid.height + y[far], 1:]
+        neighbor_x, neighbor_y = np.divmod(neighbors, grid.height)
+        weights = np.cumsum(np.abs(prev_x[far, None] - neighbor_x) +
+                            np.abs(prev_y[far, None] - neighbor_y), axis=1)
+        cumulative[far] = weights / weights[:, -1:]
+
+    choice = np.count_nonzero(cumulative <= uniforms[:, None], axis=1)
+    # skip the center cell, guard against rounding in the last entry
+    return np.minimum(choice, 7) + 1
+
+
 class RandomWalkerAgent(Agent):
     """
     An agent class capable of executing an unbiased random
@@ -16,7 +76,7 @@ class RandomWalkerAgent(Agent):
         ----------
         model: Model object
             Expected to be an instance of the `Model` class
-            that has a `grid` attribute that is an instance of `mesa.Space.Grid`
+            that has a `grid` attribute that is an instance of `OccupancyGrid`
         """
         super().__init__(unique_id, model)
 
@@ -25,8 +85,10 @@ class RandomWalkerAgent(Agent):
         Randomly move to a cell in the neighborhood of its current
         position.
         """
-        neighbors = self.model.grid.get_neighborhood(self.pos, moore=True)
-        self.model.grid.move_agent(self, self.random.choice(neighbors))
+        neighbors = self.model.grid.moore_neighborhood(self.pos)
+        # skip the center cell
+        self.model.grid.move_agent(
+            self, neighbors[1 + self.random.randrange(8)])
 
 
 class BiasedRandomWalkerAgent(RandomWalkerAgent):
@@ -36,6 +98,12 @@ class BiasedRandomWalkerAgent(RandomWalkerAgent):
     """
 
     def __init__(self, unique_id, model):
+        """
+        Parameters
+        ----------
+        model: Model object
+            Also expected to have a `uniforms` attribute (a `UniformBuffer`).
+        """
         super().__init__(unique_id, model)
         self.prev_pos = None
 
@@ -44,8 +112,8 @@ class BiasedRandomWalkerAgent(RandomWalkerAgent):
         Perform a biased random walk step by randomly selecting
         one of the cells Moore neighborhood. The probability of selecting
         a cell is proportional to the manhattan distance between that cell
-        and this agent's previous position. If previous position is `None`, then
-        an unbiased random walk step is performed instead.
+        and this agent's previous position. If previous position is `None`,
+        then an unbiased random walk step is performed instead.
         """
         if self.prev_pos is None:
             # unbiased random walk for first step
@@ -54,14 +122,25 @@ class BiasedRandomWalkerAgent(RandomWalkerAgent):
             self.prev_pos = self.pos
         else:
             # biased random walk step
-            # get Moore neighborhood
-            neighbors = self.model.grid.get_neighborhood(self.pos, moore=True)
-            dists = np.array([manhattan_distance(self.prev_pos, n)
-                              for n in neighbors])
-            # create probability mass function
-            prob_dist = dists / np.sum(dists)
-            next_idx = np.random.choice(len(neighbors), p=prob_dist)
-            next_pos = neighbors[next_idx]
+            grid = self.model.grid
+            x, y = self.pos
+            prev_dx = self.prev_pos[0] - x
+            prev_dy = self.prev_pos[1] - y
+            neighbors = grid.moore_neighborhood(self.pos)
+
+            if -1 <= prev_dx <= 1 and -1 <= prev_dy <= 1 and \
+                    0 < x < grid.width - 1 and 0 < y < grid.height - 1:
+                cumulative = _BIASED_WALK_CDF_LISTS[prev_dx + 1][prev_dy + 1]
+            else:
+                # the neighbors across the border of the grid are far from
+                # the previous position
+                dists = [manhattan_distance(self.prev_pos, n)
+                         for n in neighbors[1:]]
+                cumulative = (np.cumsum(dists) / sum(dists)).tolist()
+
+            next_idx = min(bisect_right(cumulative, self.model.uniforms()), 7)
+            # skip the center cell
+            next_pos = neighbors[next_idx + 1]
 
             self.prev_pos = self.pos
             self.model.grid.move_agent(self, next_pos)
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+
+class ColumnRecorder:
+    """
+    Records model-level reporters into preallocated NumPy columns, one per
+    reporter, at every `interval`-th step or only at the listed `steps`. It
+    stands in for Mesa's `DataCollector` (the `collect`, `model_vars` and
+    `get_model_vars_dataframe` interface), but only evaluates its reporters at
+    the recorded steps and stores the values without per-step Python
+    containers.
+    """
+
+    def __init__(self, model_reporters, interval=1, steps=None, horizon=None):
+        """
+        Parameters
+        ----------
+        model_reporters: dict
+            Column name to function of the model.
+        interval: int
+            Record the steps that are a multiple of `interval`.
+        steps: iterable of int
+            Record only these steps (overrides `interval`).
+        horizon: int
+            Last step that is expected to be recorded, used to preallocate the
+            columns. Columns grow if more steps are recorded.
+        """
+        self.model_reporters = dict(model_reporters)
+        self.agent_reporters = None
+        self.interval = interval
+        self.steps = None
+        if steps is not None:
+            self.steps = np.unique(np.asarray(steps, dtype=np.int64))
+        # position of the next listed step that can be recorded
+        self._next_listed = 0
+
+        self.n = 0
+        self.index = np.empty(0, dtype=np.int64)
+        self.columns = {name: np.empty(0) for name in self.model_reporters}
+        self.reserve(0 if horizon is None else horizon)
+
+    def recorded_steps(self, start, stop):
+        """
+        The steps in `[start, stop]` that are recorded.
+        """
+        if self.steps is not None:
+            return self.steps[(self.steps >= start) & (self.steps <= stop)]
+        first = -(-start // self.interval) * self.interval
+        return np.arange(first, stop + 1, self.interval, dtype=np.int64)
+
+    def reserve(self, horizon) -> None:
+        """
+        Make room for recording all steps up to `horizon`.
+        """
+        self._grow(self.n + len(self.recorded_steps(
+            int(self.index[self.n - 1]) + 1 if self.n else 0, horizon)))
+
+    def _grow(self, capacity) -> None:
+        if capacity <= len(self.index):
+            return
+        self.index = np.resize(self.index, capacity)
+        for name, column in self.columns.items():
+            self.columns[name] = np.resize(column, capacity)
+
+    def due(self, step) -> bool:
+        """
+        Whether `step` is recorded.
+        """
+        if self.steps is None:
+            return step % self.interval == 0
+
+        listed = self.steps
+        while self._next_listed < len(listed) and \
+                listed[self._next_listed] < step:
+            self._next_listed += 1
+        return self._next_listed < len(listed) and \
+            listed[self._next_listed] == step
+
+    def collect(self, model) -> None:
+        """
+        Evaluate the reporters on `model` if its current step is recorded.
+        """
+        step = model.schedule.steps
+        if not self.due(step):
+            return
+
+        if self.n == len(self.index):
+            self._grow(max(2 * self.n, 16))
+        self.index[self.n] = step
+        for name, reporter in self.model_reporters.items():
+            self.columns[name][self.n] = reporter(model)
+        self.n += 1
+
+    def fill(self, model, start, stop) -> None:
+        """
+        Record the current values of the reporters on `model` at all recorded
+        steps in `[start, stop]`, used to carry a final state forward.
+        """
+        steps = self.recorded_steps(start, stop)
+        if not len(steps):
+            return
+
+        end = self.n + len(steps)
+        self._grow(end)
+        self.index[self.n:end] = steps
+        for name, reporter in self.model_reporters.items():
+            self.columns[name][self.n:end] = reporter(model)
+        self.n = end
+
+    @property
+    def model_vars(self) -> dict:
+        """
+        The recorded values as a dict of column name to array (views of the
+        columns, not copies).
+        """
+        return {name: column[:self.n] for name, column in self.columns.items()}
+
+    def get_model_vars_dataframe(self):
+        """
+        The recorded values as a DataFrame indexed by step.
+        """
+        return pd.DataFrame(self.model_vars, copy=False,
+                            index=pd.Index(self.index[:self.n], name="Step"))
@@ -0,0 +1,142 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+class RunResult:
+    """
+    Compact result of a single model run, built in the worker process that ran
+    the model so that only plain values and arrays are sent back to the parent
+    instead of the whole pickled model (grid, schedule and agents).
+
+    Attributes
+    ----------
+    seed: int
+        Seed of the run.
+    steps: int
+        Number of steps the model executed.
+    stop_step: int
+        Step at which the run was stopped early, `None` if it was not.
+    death_reason:
+        Reason the colony died, `None` if it is alive.
+    censored: bool
+        Whether the run was stopped since the colony outgrew the ant budget.
+        A censored colony did not die, its `death_reason` is `None` unless
+        it died before.
+    runtime: float
+        Wall-clock seconds spent constructing and running the model.
+    reporters: OrderedDict
+        Values of the model-level reporters at the end of the run.
+    agent_vars: OrderedDict
+        Agent id to the values of the agent-level reporters, `None` if no
+        agent reporters were given.
+    timeseries: dict
+        Recorded time series, column name to array, `None` if the model did
+        not record one.
+    timeseries_steps: ndarray
+        Steps at which the time series were recorded.
+    trip_durations: ndarray
+        All forager trip durations, `None` if they were not tracked in full.
+    trip_summary: TripSummary
+        Summary of the trip durations, `None` if it was not tracked.
+    """
+
+    def __init__(self, seed, steps, stop_step=None, death_reason=None,
+                 censored=False, runtime=None, reporters=None, agent_vars=None,
+                 timeseries=None, timeseries_steps=None, trip_durations=None,
+                 trip_summary=None):
+        self.seed = seed
+        self.steps = steps
+        self.stop_step = stop_step
+        self.death_reason = death_reason
+        self.censored = censored
+        self.runtime = runtime
+        self.reporters = OrderedDict() if reporters is None else reporters
+        self.agent_vars = agent_vars
+        self.timeseries = timeseries
+        self.timeseries_steps = timeseries_steps
+        self.trip_durations = trip_durations
+        self.trip_summary = trip_summary
+
+    def get_model_vars_dataframe(self):
+        """
+        The recorded time series as a DataFrame indexed by step, like the
+        model's `datacollector.get_model_vars_dataframe()`.
+        """
+        return pd.DataFrame(self.timeseries or {}, copy=False,
+                            index=pd.Index(self.timeseries_steps, name="Step"))
+
+
+def summarize_run(model, model_reporters=None, agent_reporters=None,
+                  timeseries=True, runtime=None) -> RunResult:
+    """
+    Reduce a finished `model` to a `RunResult`.
+
+    Parameters
+    ----------
+    model_reporters: dict
+        Name to function of the model, evaluated on the final state.
+    agent_reporters: dict
+        Name to agent attribute, read from every agent of `model.agents()`
+        (like Mesa's `BatchRunner`). Raises a `ValueError` for engines
+        without agent objects.
+    timeseries: bool
+        Whether to include the time series recorded by the model.
+    runtime: float
+        Wall-clock seconds the run took.
+    """
+    result = RunResult(model.seed, model.schedule.steps,
+                       stop_step=model.stop_step,
+                       death_reason=model.death_reason,
+                       censored=model.ant_budget_exceeded, runtime=runtime)
+
+    if model_reporters:
+        for name, reporter in model_reporters.items():
+            result.reporters[name] = reporter(model)
+
+    if agent_reporters:
+        result.agent_vars = OrderedDict()
+        for agent in model.agents():
+            result.agent_vars[agent.unique_id] = OrderedDict(
+                (name, getattr(agent, attribute))
+                for name, attribute in agent_reporters.items())
+
+    if timeseries and hasattr(model, "datacollector"):
+        recorder = model.datacollector
+        # copies, so the unused capacity of the columns is not sent along
+        result.timeseries = {name: column.copy()
+                             for name, column in recorder.model_vars.items()}
+        result.timeseries_steps = recorder.index[:recorder.n].copy()
+
+    if model.trip_summary is not None:
+        result.trip_summary = model.trip_summary
+    elif hasattr(model, "trip_durations"):
+        result.trip_durations = np.asarray(model.trip_durations,
+                                           dtype=np.int64)
+
+    return result
+
+
+def run_and_summarize(model_cls, kwargs, max_steps, model_reporters=None,
+                      agent_reporters=None, timeseries=True,
+                      limits=None) -> RunResult:
+    """
+    Construct `model_cls(**kwargs)`, run it for (at most) `max_steps` steps
+    and reduce it to a `RunResult` (see `summarize_run`). Meant to be called
+    in a worker process. Raises a `RunTimeout` if the run exceeds `limits`
+    (`RunLimits`).
+    """
+    start = time.perf_counter()
+    if limits is not None:
+        limits.start()
+    model = model_cls(**kwargs)
+    if agent_reporters:
+        # fail before the run if the engine has no agents to report on
+        model.agents()
+    model.run_model(max_steps, limits=limits)
+    runtime = time.perf_counter() - start
+
+    return summarize_run(model, model_reporters, agent_reporters,
+                         timeseries=timeseries, runtime=runtime)
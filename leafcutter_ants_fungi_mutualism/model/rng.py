@@ -0,0 +1,45 @@
+import numpy as np
+
+
+def spawn_seeds(seed, n) -> (int, [int]):
+    """
+    Spawn `n` independent integer seeds for parallel model runs from `seed`
+    using `numpy.random.SeedSequence`. If `seed` is `None`, fresh entropy is
+    used. Returns the entropy of the root sequence, from which the same seeds
+    can be spawned again, and the list of seeds.
+    """
+    root = np.random.SeedSequence(seed)
+    seeds = [int(child.generate_state(1, np.uint64)[0])
+             for child in root.spawn(n)]
+    return root.entropy, seeds
+
+
+def retry_seed(seed, attempt) -> int:
+    """
+    Fresh seed for retry `attempt` (1, 2, ...) of a failed model run with
+    `seed`, derived from both so the retried run can be reproduced.
+    """
+    sequence = np.random.SeedSequence([seed, attempt])
+    return int(sequence.generate_state(1, np.uint64)[0])
+
+
+class UniformBuffer:
+    """
+    Uniform draws on [0, 1) from a NumPy `Generator`, drawn in blocks of
+    `block_size` and handed out one at a time. Drawing in blocks avoids the
+    overhead of a NumPy call for every single random number.
+    """
+
+    def __init__(self, rng, block_size=4096):
+        self.rng = rng
+        self.block_size = block_size
+        self._block = []
+        self._next = 0
+
+    def __call__(self) -> float:
+        if self._next == len(self._block):
+            self._block = self.rng.random(self.block_size).tolist()
+            self._next = 0
+        value = self._block[self._next]
+        self._next += 1
+        return value
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from mesa.time import BaseScheduler
+
+
+class StagedTypeActivation(BaseScheduler):
+    """
+    Scheduler that keeps its agents per type. Every step, the agents of
+    `random_types` are activated in random order, type by type, after which
+    the agents of `phase_types` are activated as deterministic phases in the
+    given order. Only the agents that need a random activation order are
+    shuffled.
+
+    Every agent added must be an instance of one of the given types, it is
+    filed under the first one that matches.
+    """
+
+    def __init__(self, model, random_types=(), phase_types=()):
+        super().__init__(model)
+        self.random_types = tuple(random_types)
+        self.phase_types = tuple(phase_types)
+        self.agents_by_type = OrderedDict(
+            (agent_type, OrderedDict())
+            for agent_type in self.random_types + self.phase_types
+        )
+
+    def agent_type(self, agent) -> type:
+        """
+        The scheduled type `agent` is filed under.
+        """
+        for agent_type in self.agents_by_type:
+            if isinstance(agent, agent_type):
+                return agent_type
+        raise ValueError(f"{type(agent).__name__} is not a scheduled type")
+
+    def add(self, agent) -> None:
+        agent_type = self.agent_type(agent)
+        super().add(agent)
+        self.agents_by_type[agent_type][agent.unique_id] = agent
+
+    def remove(self, agent) -> None:
+        super().remove(agent)
+        del self.agents_by_type[self.agent_type(agent)][agent.unique_id]
+
+    def agents_of_type(self, agent_type) -> list:
+        """
+        The scheduled agents of type `agent_type`.
+        """
+        return list(self.agents_by_type[agent_type].values())
+
+    def get_type_count(self, agent_type) -> int:
+        """
+        Number of scheduled agents of type `agent_type`.
+        """
+        return len(self.agents_by_type[agent_type])
+
+    def step(self, interleave=()) -> None:
+        """
+        Activate the agents of every type. `interleave` holds extra
+        activations (callables) that are run in the random order of the first
+        of `random_types`, shuffled in with its agents.
+        """
+        for i, agent_type in enumerate(self.random_types):
+            self.step_type(agent_type, shuffled=True,
+                           interleave=interleave if i == 0 else ())
+        for agent_type in self.phase_types:
+            self.step_type(agent_type)
+        self.steps += 1
+        self.time += 1
+
+    def step_type(self, agent_type, shuffled=False, interleave=()) -> None:
+        """
+        Activate all agents of type `agent_type`, in random order if
+        `shuffled`, along with the callables in `interleave`. Agents removed
+        during the activation are skipped, agents added during it are first
+        activated in the next step.
+        """
+        agents = self.agents_by_type[agent_type]
+        activations = list(agents) + list(interleave)
+        if shuffled:
+            self.model.random.shuffle(activations)
+        for key in activations:
+            if callable(key):
+                key()
+            elif key in agents:
+                agents[key].step()
@@ -3,10 +3,9 @@ Configure visualization elements and instantiate a server
 """
 
 from .model import (
-    LeafcutterAntsFungiMutualismModel, AntAgent, Plant, Nest, Fungus,
+    LeafcutterAntsFungiMutualismModel, AntAgent, Nest, Fungus,
     AntWorkerState, track_forager_fitness
 )
-from .pheromone import Pheromone
 
 from mesa.visualization.modules.TextVisualization import TextElement
 from mesa.visualization.ModularVisualization import ModularServer
@@ -19,6 +18,40 @@ class FitnessElement(TextElement):
         return f"Forager fitness: {track_forager_fitness(model):.3f}"
 
 
+class EnvironmentCanvasGrid(CanvasGrid):
+    """
+    Canvas grid that also draws the model's plants and pheromone field, which
+    are not made up of agents.
+    """
+
+    def render(self, model):
+        grid_state = super().render(model)
+        plants = model.plants
+        plants.update()
+        for x, y, leaves in zip(plants.x, plants.y, plants.num_leaves):
+            grid_state[0].append({
+                "Shape": "circle",  # "leafcutter_ants_fungi_mutualism/resources/plant.png"
+                "Color": "green",
+                "Layer": 0,
+                "r": leaves / plants.initial_num_leaves,
+                "x": int(x),
+                "y": int(y)
+            })
+
+        lifespan = model.pheromones.lifespan()
+        for x, y in zip(*lifespan.nonzero()):
+            grid_state[0].append({
+                "Shape": "circle",
+                "Color": "blue",
+                "Layer": 0,
+                "r": lifespan[x, y] / model.pheromone_lifespan,
+                "x": int(x),
+                "y": int(y)
+            })
+
+        return grid_state
+
+
 def circle_portrayal_example(agent):
     if agent is None:
         return
@@ -40,13 +73,6 @@ def circle_portrayal_example(agent):
             portrayal["text_color"] = "green"
 
         return portrayal
-    elif isinstance(agent, Plant):
-        return {
-            "Shape": "circle",  # "leafcutter_ants_fungi_mutualism/resources/plant.png"
-            "Color": "green",
-            "Layer": 0,
-            "r": agent.num_leaves / agent.initial_num_leaves
-        }
     elif isinstance(agent, Nest):
         return {
             "Shape": "circle",
@@ -67,13 +93,6 @@ def circle_portrayal_example(agent):
             portrayal["text_color"] = "purple"
 
         return portrayal
-    elif isinstance(agent, Pheromone):
-        return {
-            "Shape": "circle",
-            "Color": "blue",
-            "Layer": 0,
-            "r": agent.lifespan / agent.initial_lifespan
-        }
     else:
         print(f"Not yet visualized agent {agent.__class__}!")
         return {
@@ -84,7 +103,8 @@ def circle_portrayal_example(agent):
         }
 
 
-canvas_element = CanvasGrid(circle_portrayal_example, 50, 50, 500, 500)
+canvas_element = EnvironmentCanvasGrid(
+    circle_portrayal_example, 50, 50, 500, 500)
 fungus_biomass_element = ChartModule([{
     "Label": "Fungus Biomass",
     "Color": "black"
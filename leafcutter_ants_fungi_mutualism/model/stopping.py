@@ -0,0 +1,82 @@
+import time
+from collections import deque
+
+
+class SteadyStateDetector:
+    """
+    Detects a steady state from windowed statistics: a set of observed series
+    is considered steady once, over the last `window` observations, the range
+    (maximum - minimum) of every series is at most `tolerance` times its mean
+    absolute value.
+    """
+
+    def __init__(self, window, tolerance=0.01):
+        self.window = window
+        self.tolerance = tolerance
+        self.history = deque(maxlen=window)
+
+    def update(self, *values) -> bool:
+        """
+        Observe one value of every series, returns whether the series are in
+        a steady state.
+        """
+        self.history.append(values)
+        if len(self.history) < self.window:
+            return False
+
+        for series in zip(*self.history):
+            scale = sum(abs(value) for value in series) / self.window
+            if max(series) - min(series) > self.tolerance * scale:
+                return False
+        return True
+
+
+class RunTimeout(RuntimeError):
+    """
+    A model run exceeded its `RunLimits`.
+    """
+
+
+class AntBudgetExceeded(RuntimeError):
+    """
+    The colony of a model run outgrew its ant budget.
+    """
+
+
+class RunLimits:
+    """
+    Limits of a model run: at most `timeout` seconds of wall-clock time, and
+    at least `min_step_rate` steps per second, measured over windows of
+    `window` seconds so that a run that slows down later on (e.g. because
+    its ant population explodes) is stopped within one window. `check`
+    raises a `RunTimeout` once a limit is exceeded.
+    """
+
+    def __init__(self, timeout=None, min_step_rate=None, window=10.0):
+        self.timeout = timeout
+        self.min_step_rate = min_step_rate
+        self.window = window
+        self.start()
+
+    def start(self) -> None:
+        """
+        Start the clock of a run.
+        """
+        self._start = self._mark = time.perf_counter()
+        self._mark_steps = 0
+
+    def check(self, steps) -> None:
+        """
+        Check the limits after `steps` steps of the run.
+        """
+        now = time.perf_counter()
+        if self.timeout is not None and now - self._start > self.timeout:
+            raise RunTimeout(f"exceeded the wall-clock limit of "
+                             f"{self.timeout} s at step {steps}")
+
+        if self.min_step_rate is not None and now - self._mark >= self.window:
+            rate = (steps - self._mark_steps) / (now - self._mark)
+            if rate < self.min_step_rate:
+                raise RunTimeout(f"ran {rate:.3g} steps/s at step {steps}, "
+                                 f"below the limit of {self.min_step_rate}")
+            self._mark, self._mark_steps = now, steps
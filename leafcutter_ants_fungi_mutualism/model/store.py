@@ -0,0 +1,393 @@
+import json
+import os
+import re
+import shutil
+from enum import Enum
+
+import numpy as np
+import pandas as pd
+
+from .trips import TripSummary
+
+
+# layout of a results store directory:
+#
+#   meta.json                  metadata of the whole study
+#   runs/000042/run.json       seed, stop step, runtime, parameters, final
+#                              reporter values and the column file names
+#   runs/000042/steps.npy      recorded steps
+#   runs/000042/<column>.npy   one recorded time series per file
+#   runs/000042/trip_*.npy     trip durations or trip summary arrays
+#
+# A run is written to a temporary directory that is renamed into place once
+# complete, so the store only ever holds complete runs.
+RUNS = "runs"
+META = "meta.json"
+RUN_INFO = "run.json"
+
+
+def _plain(value):
+    """
+    JSON representation of NumPy scalars and arrays and of enums.
+    """
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"cannot store {value!r} of type {type(value).__name__}")
+
+
+def _write_json(path, values) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(values, f, default=_plain, indent=1)
+    os.replace(tmp, path)
+
+
+def _column_file(name) -> str:
+    return re.sub(r"\W+", "_", name).strip("_") + ".npy"
+
+
+class ResultsStoreWriter:
+    """
+    Writes the results of model runs to a results store directory at `path`
+    (see `ResultsStore`), one run at a time as the runs complete, so an
+    interrupted study keeps all runs that finished. Existing runs in the
+    store are kept.
+    """
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        os.makedirs(os.path.join(path, RUNS), exist_ok=True)
+        if metadata is not None:
+            self.update_metadata(metadata)
+
+    def update_metadata(self, metadata) -> None:
+        """
+        Merge `metadata` (JSON serializable) into the store's metadata.
+        """
+        meta_path = os.path.join(self.path, META)
+        values = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                values = json.load(f)
+        values.update(metadata)
+        _write_json(meta_path, values)
+
+    def completed(self) -> [int]:
+        """
+        Indices of the runs in the store.
+        """
+        return ResultsStore(self.path).runs
+
+    def next_index(self) -> int:
+        """
+        Index after the last run in the store.
+        """
+        runs = self.completed()
+        return runs[-1] + 1 if runs else 0
+
+    def write(self, index, result, params=None) -> None:
+        """
+        Write `result` (a `RunResult`) as run `index`, replacing that run if
+        it already exists. `params` are the (JSON serializable) parameters of
+        the run.
+        """
+        runs = os.path.join(self.path, RUNS)
+        final = os.path.join(runs, f"{index:06d}")
+        tmp = os.path.join(runs, f".tmp-{index:06d}-{os.getpid()}")
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        info = {
+            "seed": result.seed,
+            "steps": result.steps,
+            "stop_step": result.stop_step,
+            "death_reason": result.death_reason,
+            "censored": result.censored,
+            "runtime": result.runtime,
+            "params": params or {},
+            "reporters": dict(result.reporters),
+            "columns": {},
+        }
+
+        if result.timeseries is not None:
+            np.save(os.path.join(tmp, "steps.npy"), result.timeseries_steps)
+            for name, column in result.timeseries.items():
+                info["columns"][name] = _column_file(name)
+                np.save(os.path.join(tmp, _column_file(name)), column)
+
+        if result.trip_durations is not None:
+            np.save(os.path.join(tmp, "trip_durations.npy"),
+                    result.trip_durations)
+        if result.trip_summary is not None:
+            summary = result.trip_summary.to_dict()
+            for name in ("bin_edges", "counts", "samples"):
+                np.save(os.path.join(tmp, f"trip_{name}.npy"), summary[name])
+            info["trip_summary"] = {
+                name: summary[name] for name in
+                ("count", "total", "total_squares", "min", "max",
+                 "sample_every")}
+
+        _write_json(os.path.join(tmp, RUN_INFO), info)
+        if os.path.exists(final):
+            shutil.rmtree(final)
+        os.replace(tmp, final)
+
+
+class ResultsStore:
+    """
+    Reader of a results store directory written by `ResultsStoreWriter`.
+    Time series are stored as one `.npy` file per run and column and are
+    loaded lazily (memory-mapped) and only for the requested runs.
+
+    `runs` arguments select the runs to load: `None` for all runs, an
+    iterable of run indices, or a `slice` of the completed runs (e.g.
+    `slice(0, 10)` for the first ten).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.metadata = {}
+        meta_path = os.path.join(path, META)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.metadata = json.load(f)
+
+        runs = os.path.join(path, RUNS)
+        names = os.listdir(runs) if os.path.isdir(runs) else []
+        self.runs = sorted(int(name) for name in names if name.isdigit())
+        self._info = {}
+
+    def __len__(self):
+        return len(self.runs)
+
+    def _select(self, runs):
+        if runs is None:
+            return self.runs
+        if isinstance(runs, slice):
+            return self.runs[runs]
+        return list(runs)
+
+    def _run_path(self, run, filename):
+        return os.path.join(self.path, RUNS, f"{run:06d}", filename)
+
+    def run_info(self, run) -> dict:
+        """
+        Seed, stop step, runtime, parameters and final reporter values of
+        `run`.
+        """
+        if run not in self._info:
+            with open(self._run_path(run, RUN_INFO)) as f:
+                self._info[run] = json.load(f)
+        return self._info[run]
+
+    @property
+    def metrics(self) -> [str]:
+        """
+        Names of the recorded time series (of the first run).
+        """
+        return list(self.run_info(self.runs[0])["columns"]) if self.runs \
+            else []
+
+    def steps(self, run):
+        """
+        Steps at which the time series of `run` were recorded.
+        """
+        return np.load(self._run_path(run, "steps.npy"), mmap_mode="r")
+
+    def metric(self, name, runs=None) -> list:
+        """
+        The time series `name` of the selected runs, as a list of
+        memory-mapped arrays.
+        """
+        return [np.load(self._run_path(run,
+                                       self.run_info(run)["columns"][name]),
+                        mmap_mode="r")
+                for run in self._select(runs)]
+
+    def stack(self, name, runs=None):
+        """
+        The time series `name` of the selected runs as one array with a row
+        per run, padded with NaN if the runs recorded different steps.
+        """
+        series = self.metric(name, runs)
+        length = max((len(column) for column in series), default=0)
+        stacked = np.full((len(series), length), np.nan)
+        for row, column in zip(stacked, series):
+            row[:len(column)] = column
+        return stacked
+
+    def dataframe(self, run, metrics=None):
+        """
+        The time series of `run` as a DataFrame indexed by step, like the
+        model's `datacollector.get_model_vars_dataframe()`.
+        """
+        if metrics is None:
+            metrics = list(self.run_info(run)["columns"])
+        return pd.DataFrame({name: self.metric(name, [run])[0]
+                             for name in metrics},
+                            index=pd.Index(self.steps(run), name="Step"))
+
+    def table(self, runs=None):
+        """
+        DataFrame with a row per selected run holding its parameters, final
+        reporter values, seed, stop step and whether it was censored, indexed
+        by run.
+        """
+        runs = self._select(runs)
+        rows = []
+        for run in runs:
+            info = self.run_info(run)
+            rows.append({**info["params"], **info["reporters"],
+                         "seed": info["seed"],
+                         "stop_step": info["stop_step"],
+                         "censored": info.get("censored", False)})
+        return pd.DataFrame(rows, index=pd.Index(runs, name="run"))
+
+    def trip_durations(self, runs=None):
+        """
+        The trip durations of all selected runs, concatenated.
+        """
+        durations = [np.load(self._run_path(run, "trip_durations.npy"))
+                     for run in self._select(runs)]
+        return np.concatenate(durations) if durations \
+            else np.empty(0, dtype=np.int64)
+
+    def trip_summary(self, runs=None) -> TripSummary:
+        """
+        The trip summaries of the selected runs, merged.
+        """
+        summaries = []
+        for run in self._select(runs):
+            values = dict(self.run_info(run)["trip_summary"])
+            for name in ("bin_edges", "counts", "samples"):
+                values[name] = np.load(self._run_path(run, f"trip_{name}.npy"))
+            summaries.append(TripSummary.from_dict(values))
+        return TripSummary.merged(summaries)
+
+
+class ResultMatrix:
+    """
+    Matrix of results with a row per model run and a column per reporter,
+    stored in the directory `path` as memory-mappable `.npy` files together
+    with a completion flag and the stop step (-1 if not stopped early) of
+    every row, and the metadata of the study.
+
+    Rows are written one at a time, each with positional writes of only its
+    own bytes, and flagged complete once written, so interrupted jobs can
+    resume and several jobs (also on different hosts sharing the directory)
+    can fill disjoint rows.
+    """
+
+    VALUES = "values.npy"
+    DONE = "done.npy"
+    STOP_STEPS = "stop_steps.npy"
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META)) as f:
+            self.metadata = json.load(f)
+        self.rows, self.columns = np.load(self._file(self.VALUES),
+                                          mmap_mode="r").shape
+        # position of the data in each file, after the .npy header
+        self._offsets = {name: np.load(self._file(name), mmap_mode="r").offset
+                         for name in (self.VALUES, self.DONE, self.STOP_STEPS)}
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @classmethod
+    def open(cls, path, rows, columns, metadata):
+        """
+        Open the matrix at `path`, creating it with `rows` x `columns`
+        missing values if it does not exist yet. Raises a `ValueError` if an
+        existing matrix has another shape or other `metadata`, i.e. belongs
+        to another study.
+        """
+        if not os.path.exists(os.path.join(path, META)):
+            tmp = f"{path}.tmp-{os.getpid()}"
+            os.makedirs(tmp)
+            np.lib.format.open_memmap(os.path.join(tmp, cls.VALUES), "w+",
+                                      np.float64, (rows, columns))[:] = np.nan
+            np.save(os.path.join(tmp, cls.DONE), np.zeros(rows, np.uint8))
+            np.save(os.path.join(tmp, cls.STOP_STEPS),
+                    np.full(rows, -1, np.int64))
+            _write_json(os.path.join(tmp, META), metadata)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # created concurrently by another job
+                shutil.rmtree(tmp)
+
+        matrix = cls(path)
+        expected = json.loads(json.dumps(metadata, default=_plain))
+        if (matrix.rows, matrix.columns) != (rows, columns) or \
+                matrix.metadata != expected:
+            mismatched = sorted(key for key in expected.keys()
+                                | matrix.metadata.keys()
+                                if expected.get(key)
+                                != matrix.metadata.get(key))
+            raise ValueError(f"the result matrix at {path} belongs to another "
+                             f"study (differs in {mismatched or 'shape'})")
+        return matrix
+
+    @property
+    def values(self):
+        """
+        The matrix, memory-mapped read-only. Missing rows hold NaN.
+        """
+        return np.load(self._file(self.VALUES), mmap_mode="r")
+
+    @property
+    def done(self):
+        """
+        Whether each row is complete.
+        """
+        return np.load(self._file(self.DONE)).astype(bool)
+
+    @property
+    def stop_steps(self):
+        return np.load(self._file(self.STOP_STEPS))
+
+    def missing(self, rows=None):
+        """
+        The rows (of `rows`, default all) that are not complete.
+        """
+        done = self.done
+        rows = np.arange(self.rows) if rows is None else np.asarray(rows)
+        return rows[~done[rows]]
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.done.all())
+
+    def require_complete(self) -> None:
+        """
+        Raise a `RuntimeError` if rows are missing, e.g. before analysing the
+        matrix.
+        """
+        missing = len(self.missing())
+        if missing:
+            raise RuntimeError(f"the result matrix at {self.path} is "
+                               f"incomplete: {missing} of {self.rows} rows "
+                               f"are missing")
+
+    def _write(self, name, position, data) -> None:
+        fd = os.open(self._file(name), os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, self._offsets[name] + position)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def write(self, row, values, stop_step=-1) -> None:
+        """
+        Write the `values` of `row` and flag it complete.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        self._write(self.VALUES, row * values.nbytes, values.tobytes())
+        self._write(self.STOP_STEPS, row * 8, np.int64(stop_step).tobytes())
+        # flagged only once the values are on disk
+        self._write(self.DONE, row, b"\x01")
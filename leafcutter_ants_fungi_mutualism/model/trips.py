@@ -0,0 +1,180 @@
+from bisect import bisect_right
+import numpy as np
+
+
+def linear_bins(maximum=1000, width=1):
+    """
+    Histogram bin edges of equal `width` from 0 up to `maximum`.
+    """
+    return np.arange(0, maximum + width, width)
+
+
+def log_bins(maximum=10000, per_decade=20):
+    """
+    Histogram bin edges from 0 up to `maximum` that are logarithmically spaced
+    (`per_decade` bins per factor 10) and at least 1 apart, for durations with
+    a long tail.
+    """
+    edges = np.geomspace(1, maximum, int(np.log10(maximum) * per_decade) + 1)
+    return np.unique(np.concatenate(([0], np.round(edges))))
+
+
+class TripSummary:
+    """
+    Streaming summary of forager trip durations, used instead of a list of all
+    trips. It holds a histogram over `bin_edges` (the last bin has no upper
+    bound), the count, sum, sum of squares, minimum and maximum of the
+    durations, from which the mean, variance and quantiles follow. Summaries
+    with the same bins can be merged, e.g. across replicates.
+
+    If `sample_every` is given, the raw trips of the ants whose id is a
+    multiple of `sample_every` are kept as well, as (ant id, duration) pairs.
+    """
+
+    def __init__(self, bin_edges=None, sample_every=None):
+        if bin_edges is None:
+            bin_edges = linear_bins()
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        self._edges = self.bin_edges.tolist()
+        self.counts = np.zeros(len(self.bin_edges), dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.total_squares = 0
+        self.min = None
+        self.max = None
+        self.sample_every = sample_every
+        self.samples = []
+
+    def add(self, duration, ant_id=None) -> None:
+        """
+        Add the trip `duration` of the ant with id `ant_id`.
+        """
+        self.counts[max(bisect_right(self._edges, duration) - 1, 0)] += 1
+        self.count += 1
+        self.total += duration
+        self.total_squares += duration * duration
+        if self.min is None or duration < self.min:
+            self.min = duration
+        if self.max is None or duration > self.max:
+            self.max = duration
+
+        if self.sample_every and ant_id is not None and \
+                ant_id % self.sample_every == 0:
+            self.samples.append((ant_id, duration))
+
+    def add_many(self, durations, ant_ids=None) -> None:
+        """
+        Add the trip `durations` (an integer array) of the ants with ids
+        `ant_ids`.
+        """
+        durations = np.asarray(durations, dtype=np.int64)
+        if not len(durations):
+            return
+
+        bins = np.searchsorted(self.bin_edges, durations, side="right") - 1
+        self.counts += np.bincount(np.maximum(bins, 0),
+                                   minlength=len(self.counts))
+        self.count += len(durations)
+        self.total += int(durations.sum())
+        self.total_squares += int((durations * durations).sum())
+        low, high = int(durations.min()), int(durations.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+        if self.sample_every and ant_ids is not None:
+            ant_ids = np.asarray(ant_ids)
+            sampled = ant_ids % self.sample_every == 0
+            self.samples.extend(zip(ant_ids[sampled].tolist(),
+                                    durations[sampled].tolist()))
+
+    def merge(self, other) -> None:
+        """
+        Add the trips summarized by `other`, which must have the same bins.
+        """
+        if not np.array_equal(self.bin_edges, other.bin_edges):
+            raise ValueError("cannot merge trip summaries with different bins")
+
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        self.samples.extend(other.samples)
+
+    @classmethod
+    def merged(cls, summaries):
+        """
+        A new summary of all trips in `summaries`.
+        """
+        summaries = list(summaries)
+        result = cls(summaries[0].bin_edges, summaries[0].sample_every)
+        for summary in summaries:
+            result.merge(summary)
+        return result
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else np.nan
+
+    def variance(self) -> float:
+        if not self.count:
+            return np.nan
+        mean = self.total / self.count
+        return max(self.total_squares / self.count - mean * mean, 0.0)
+
+    def quantile(self, q) -> float:
+        """
+        The `q`-th quantile of the durations, interpolated linearly within
+        the histogram bins.
+        """
+        if not self.count:
+            return np.nan
+
+        rank = q * self.count
+        cumulative = np.cumsum(self.counts)
+        i = min(int(np.searchsorted(cumulative, rank, side="left")),
+                len(self.counts) - 1)
+        below = cumulative[i] - self.counts[i]
+        low = self.bin_edges[i]
+        high = self.bin_edges[i + 1] if i + 1 < len(self.bin_edges) \
+            else self.max
+        fraction = (rank - below) / self.counts[i] if self.counts[i] else 0.0
+        return float(np.clip(low + fraction * (high - low), self.min,
+                             self.max))
+
+    def to_dict(self) -> dict:
+        """
+        The summary as a dict of plain values and arrays, for saving.
+        """
+        return {
+            "bin_edges": self.bin_edges,
+            "counts": self.counts,
+            "count": self.count,
+            "total": self.total,
+            "total_squares": self.total_squares,
+            "mean": self.mean(),
+            "variance": self.variance(),
+            "min": self.min,
+            "max": self.max,
+            "median": self.quantile(0.5),
+            "samples": np.array(self.samples, dtype=np.int64).reshape(-1, 2),
+            "sample_every": self.sample_every,
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        Rebuild a summary saved with `to_dict`.
+        """
+        summary = cls(values["bin_edges"], values["sample_every"])
+        summary.counts = np.asarray(values["counts"], dtype=np.int64).copy()
+        summary.count = int(values["count"])
+        summary.total = int(values["total"])
+        summary.total_squares = int(values["total_squares"])
+        summary.min = values["min"]
+        summary.max = values["max"]
+        summary.samples = [tuple(sample)
+                           for sample in np.asarray(values["samples"]).tolist()]
+        return summary
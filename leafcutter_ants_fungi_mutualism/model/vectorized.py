@@ -0,0 +1,529 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from .model import LeafcutterAntsFungiMutualismModel
+from .ant_agent import AntWorkerState, AntCounters, track_death_reason
+from .nest import Nest
+from .util import arctan_activation_pstv
+from .grid import torus_moore_sum
+from .random_walker_agent import biased_walk_choice
+
+
+EXPLORE = AntWorkerState.EXPLORE.value
+RECRUIT = AntWorkerState.RECRUIT.value
+HARVEST = AntWorkerState.HARVEST.value
+CARETAKING = AntWorkerState.CARETAKING.value
+
+
+class AntArrays:
+    """
+    Struct-of-arrays storage of the ant population. Each attribute of
+    `AntAgent` that changes over a run is a NumPy array indexed by ant.
+    Unset values of `prev_pos` and `roundtrip_length` (`None` on `AntAgent`)
+    are stored as -1. Every ant gets a unique id at birth.
+    """
+
+    FIELDS = {
+        "uid": np.int64,
+        "x": np.int64,
+        "y": np.int64,
+        "prev_x": np.int64,
+        "prev_y": np.int64,
+        "state": np.int8,
+        "has_leaf": np.bool_,
+        "neighbor_density_acc": np.float64,
+        "trip_duration": np.int64,
+        "roundtrip_length": np.int64,
+        "dormant": np.bool_,
+        "fungus_biomass_start": np.float64,
+    }
+
+    def __init__(self):
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.empty(0, dtype=dtype))
+        self.next_uid = 0
+
+    @property
+    def n(self) -> int:
+        return len(self.state)
+
+    def spawn(self, pos, states) -> None:
+        """
+        Append new ants at position `pos`, one for each entry of `states`.
+        """
+        count = len(states)
+        new = {
+            "uid": np.arange(self.next_uid, self.next_uid + count),
+            "x": np.full(count, pos[0]),
+            "y": np.full(count, pos[1]),
+            "prev_x": np.full(count, -1),
+            "prev_y": np.full(count, -1),
+            "state": states,
+            "has_leaf": np.zeros(count),
+            "neighbor_density_acc": np.zeros(count),
+            "trip_duration": np.zeros(count),
+            "roundtrip_length": np.full(count, -1),
+            "dormant": np.zeros(count),
+            "fungus_biomass_start": np.zeros(count),
+        }
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, np.concatenate(
+                (getattr(self, name), np.asarray(new[name], dtype=dtype))))
+        self.next_uid += count
+
+    def counts(self) -> AntCounters:
+        """
+        Counts of the ant population, as kept live by the agent-based engine.
+        """
+        caretakers = self.state == CARETAKING
+        return AntCounters(
+            ants=self.n,
+            caretakers=int(np.count_nonzero(caretakers)),
+            dormant_caretakers=int(np.count_nonzero(self.dormant & caretakers)),
+            with_leaf=int(np.count_nonzero(self.has_leaf)))
+
+    def agents(self) -> list:
+        """
+        One object per ant with the `state`, `dormant` and `has_leaf`
+        attributes of an `AntAgent`, for brute-force checks.
+        """
+        return [SimpleNamespace(state=AntWorkerState(state),
+                                dormant=bool(dormant),
+                                has_leaf=bool(has_leaf))
+                for state, dormant, has_leaf in zip(
+                    self.state.tolist(), self.dormant.tolist(),
+                    self.has_leaf.tolist())]
+
+    def keep(self, mask) -> None:
+        """
+        Remove all ants for which `mask` is False.
+        """
+        for name in self.FIELDS:
+            setattr(self, name, getattr(self, name)[mask])
+
+
+class ArrayNest(Nest):
+    """
+    Nest that gives birth to ants by appending them to the model's
+    `AntArrays` instead of constructing `AntAgent` objects.
+    """
+
+    def ant_birth(self, n) -> None:
+        if n <= 0:
+            return
+        caretaking = self.model.rng.random(n) > self.average_fitness()
+        states = np.where(caretaking, CARETAKING, EXPLORE)
+        self.model.ants.spawn(self.pos, states)
+
+
+class VectorizedLeafcutterAntsFungiMutualismModel(
+        LeafcutterAntsFungiMutualismModel):
+    """
+    Struct-of-arrays engine for the leafcutter ants model. It takes the same
+    parameters and supports the same reporters as
+    `LeafcutterAntsFungiMutualismModel`, but keeps the ants in NumPy arrays
+    (like the plants and pheromones of both engines) and moves the whole ant population in a few
+    vectorized passes per time step.
+
+    Ants are updated synchronously: every ant acts once per step on the state
+    of the grid at the start of its phase (recruit, harvest, explore,
+    caretaking), instead of one after the other in a random order. Competing
+    ants are resolved in random order (e.g. when several ants cut leaves from
+    an almost empty plant), and the caretakers that wake up feed the larvae
+    one after the other, so the dynamics are statistically equivalent to,
+    but not identical to, those of the agent-based engine (see
+    `tests/test_engines.py`).
+    """
+
+    def init_agents(self):
+        self.ants = AntArrays()
+        super().init_agents()
+        self.ant_counts = self.ants.counts()
+
+    def live_ants(self) -> int:
+        return self.ants.n
+
+    def ant_agents(self) -> list:
+        return self.ants.agents()
+
+    def agents(self) -> list:
+        """
+        The ants are rows of `ants`, without agent objects to report on.
+        """
+        raise ValueError("agent reporters need the agent-based engine, the "
+                         "vectorized engine keeps the ants in arrays")
+
+    def init_nest(self):
+        """
+        Spawn a nest at the center of the model grid.
+        """
+        self.nest = ArrayNest(self.next_id(), self)
+        self.schedule.add(self.nest)
+        nest_pos = (self.grid.width // 2, self.grid.height // 2)
+        self.grid.place_agent(self.nest, nest_pos)
+
+    def init_ants(self):
+        """
+        Initialize a fixed number of ants with equal number of foragers
+        (`EXPLORE` state) and caretakers (`CARETAKING` state).
+        """
+        foragers_count = int(self.initial_foragers_ratio * self.num_ants)
+        states = np.full(self.num_ants, CARETAKING)
+        states[:foragers_count] = EXPLORE
+        self.ants.spawn(self.nest.pos, states)
+
+    def step(self):
+        """
+        A model step. Used for moving the ant population, advancing the
+        schedule (which only holds the nest and the fungus) and collecting
+        data. The ant counters are recounted once per step from the arrays.
+        """
+        self.ants_step()
+
+        self.schedule.step()
+        self.ant_counts = self.ants.counts()
+        self.death_reason = track_death_reason(self)
+        self.check_stop_conditions()
+
+        if self.collect_data:
+            self.datacollector.collect(self)
+
+        if self.check_counters:
+            self.ant_counts.verify(self)
+
+    def quiescent(self) -> bool:
+        """
+        Caretakers are updated as arrays at every step, so ticks are never
+        skipped.
+        """
+        return False
+
+    def ants_step(self) -> None:
+        """
+        Vectorized equivalent of `AntAgent.step` for the whole population.
+        """
+        ants = self.ants
+
+        # mortality
+        ants.keep(self.rng.random(ants.n) > self.ant_death_probability)
+
+        state = ants.state
+        recruiters = np.flatnonzero(state == RECRUIT)
+        harvesters = np.flatnonzero(state == HARVEST)
+        explorers = np.flatnonzero(state == EXPLORE)
+        caretakers = np.flatnonzero(state == CARETAKING)
+
+        self.recruit_step(recruiters)
+        self.harvest_step(harvesters)
+        self.explore_step(explorers)
+        # drafted caretakers already turned into explorers
+        self.caretaking_step(caretakers[state[caretakers] == CARETAKING])
+
+        foragers = np.flatnonzero(ants.state != CARETAKING)
+        ants.neighbor_density_acc[foragers] += \
+            self.get_neighborhood_density(foragers)
+        ants.trip_duration[foragers] += 1
+
+    def explore_step(self, idx) -> None:
+        """
+        Vectorized `AntAgent.explore_step` for the ants at indices `idx`.
+        """
+        ants = self.ants
+        self.random_move(idx)
+
+        plant_counts = self.get_nearby(self.plants.counts, idx)
+        near_plant = plant_counts.any(axis=1)
+
+        # found a plant, try to cut a leaf
+        found = idx[near_plant]
+        taken = self.take_leaves(found, plant_counts[near_plant])
+        ants.has_leaf[found[taken]] = True
+        ants.state[found[taken]] = RECRUIT
+
+        # found a pheromone (but no plant), follow the trail
+        rest = idx[~near_plant]
+        near_pheromone = self.get_nearby_pheromones(rest).any(axis=1)
+        ants.state[rest[near_pheromone]] = HARVEST
+
+    def recruit_step(self, idx) -> None:
+        """
+        Vectorized `AntAgent.recruit_step` for the ants at indices `idx`.
+        """
+        ants = self.ants
+        on_nest = (ants.x[idx] == self.nest.pos[0]) & \
+            (ants.y[idx] == self.nest.pos[1])
+        self.returned_to_nest(idx[on_nest])
+
+        # leave pheromone on current location and step towards nest
+        moving = idx[~on_nest]
+        self.pheromones.mark(ants.x[moving], ants.y[moving])
+        x_step, y_step = self.get_direction_towards_nest(moving)
+        ants.x[moving] = (ants.x[moving] + x_step) % self.grid.width
+        ants.y[moving] = (ants.y[moving] + y_step) % self.grid.height
+
+    def harvest_step(self, idx) -> None:
+        """
+        Vectorized `AntAgent.harvest_step` for the ants at indices `idx`.
+        """
+        ants = self.ants
+
+        plant_counts = self.get_nearby(self.plants.counts, idx)
+        near_plant = plant_counts.any(axis=1)
+
+        # found plant, get leaf or return to exploring if the plant's leaves
+        # have been exhausted
+        found = idx[near_plant]
+        taken = self.take_leaves(found, plant_counts[near_plant])
+        ants.has_leaf[found[taken]] = True
+        ants.state[found] = np.where(taken, RECRUIT, EXPLORE)
+
+        # pheromones disappeared
+        rest = idx[~near_plant]
+        pheromones = self.get_nearby_pheromones(rest)
+        near_pheromone = pheromones.any(axis=1)
+        ants.state[rest[~near_pheromone]] = EXPLORE
+
+        # follow pheromone trail outwards from nest
+        following = rest[near_pheromone]
+        pheromones = pheromones[near_pheromone]
+        nest_distance = self.nest_geometry.distance
+        ant_dist = nest_distance[ants.x[following], ants.y[following]]
+        outwards = pheromones & \
+            (self.get_nearby(nest_distance, following) > ant_dist[:, None])
+        has_outwards = outwards.any(axis=1)
+
+        # no outwards going pheromones near, do random move
+        lost = following[~has_outwards]
+        self.random_move(lost)
+        ants.state[lost] = EXPLORE
+
+        # choose random outwards going pheromone
+        following = following[has_outwards]
+        outwards = outwards[has_outwards]
+        keys = self.rng.random(outwards.shape) * outwards
+        self.move_to_neighbor(following, np.argmax(keys, axis=1))
+
+    def caretaking_step(self, idx) -> None:
+        """
+        Vectorized `AntAgent.caretaking_step` for the ants at indices `idx`.
+        The caretakers that wake up in this step act one at a time in random
+        order, like in the agent-based engine: each one compares the biomass
+        left by the caretakers before it to the biomass at the start of its
+        own round trip, so the feeding of the colony stops when the fungus
+        declines. Only few caretakers wake up per step.
+        """
+        ants = self.ants
+
+        # first call of care-taking step
+        first = idx[ants.roundtrip_length[idx] < 0]
+        self.set_roundtrip_length(
+            first, self.caretaker_roundtrip_mean)
+
+        ants.roundtrip_length[idx] -= 1
+        awake = self.rng.permutation(idx[ants.roundtrip_length[idx] == 0])
+        # dormancy time is up
+        ants.dormant[awake] = False
+
+        declined = np.zeros(len(awake), dtype=bool)
+        biomass_start = np.empty(len(awake))
+        for i, ant in enumerate(awake):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                fitness = arctan_activation_pstv(
+                    self.fungus.biomass / ants.fungus_biomass_start[ant], 1)
+            if fitness < 0.5:
+                # fungus health has declined, do not feed the larvae and
+                # remain dormant for some time
+                declined[i] = True
+            else:
+                # feed the larvae
+                self.nest.feed_larvae()
+            biomass_start[i] = self.fungus.biomass
+
+        ants.dormant[awake[declined]] = True
+        self.set_roundtrip_length(
+            awake, np.where(declined, self.dormant_roundtrip_mean,
+                            self.caretaker_roundtrip_mean))
+        ants.fungus_biomass_start[awake] = biomass_start
+
+    def returned_to_nest(self, idx) -> None:
+        """
+        Vectorized `AntAgent.returned_to_nest` for the ants at indices `idx`.
+        """
+        if len(idx) == 0:
+            return
+        ants = self.ants
+
+        # feed fungus first if we have a leaf
+        for _ in range(np.count_nonzero(ants.has_leaf[idx])):
+            self.fungus.feed()
+        ants.has_leaf[idx] = False
+
+        # task division
+        interaction_prob = ants.neighbor_density_acc[idx] / \
+            ants.trip_duration[idx]
+        fitness = 1 - interaction_prob
+        for value in self.rng.permutation(fitness):
+            self.nest.push_fitness(value)
+
+        # drafting random caretakers
+        n_drafted = np.count_nonzero(
+            self.rng.random(len(idx)) <= fitness)
+        caretakers = np.flatnonzero(ants.state == CARETAKING)
+        drafted = self.rng.choice(
+            caretakers, min(n_drafted, len(caretakers)), replace=False)
+        ants.state[drafted] = EXPLORE
+
+        # switching roles with certain probability
+        ants.state[idx] = np.where(
+            self.rng.random(len(idx)) <= interaction_prob,
+            CARETAKING, EXPLORE)
+
+        self.reset_trip(idx)
+
+    def random_move(self, idx) -> None:
+        """
+        Vectorized `BiasedRandomWalkerAgent.random_move` for the ants at
+        indices `idx`. The probability of moving to a neighboring cell is
+        proportional to its distance to the ant's previous position. Ants
+        without a previous position do an unbiased step.
+        """
+        ants = self.ants
+        x, y = ants.x[idx], ants.y[idx]
+
+        uniforms = self.rng.random(len(idx))
+        column = biased_walk_choice(x, y, ants.prev_x[idx], ants.prev_y[idx],
+                                    uniforms, self.grid)
+
+        # unbiased random walk for first step, skipping the center cell
+        unbiased = ants.prev_x[idx] < 0
+        column[unbiased] = 1 + (uniforms[unbiased] * 8).astype(np.int64)
+        self.move_to_neighbor(idx, column)
+        # the unbiased first step sets the previous position to the new one
+        ants.prev_x[idx] = np.where(unbiased, ants.x[idx], x)
+        ants.prev_y[idx] = np.where(unbiased, ants.y[idx], y)
+
+    def take_leaves(self, idx, plant_counts):
+        """
+        Let each ant at indices `idx` cut a leaf from a random plant in its
+        Moore neighborhood (`plant_counts` holds the number of plants on each
+        of the neighboring cells). Ants competing for the same plant are
+        served in random order. Returns a boolean array telling which ants
+        got a leaf.
+        """
+        if len(idx) == 0:
+            return np.zeros(0, dtype=bool)
+
+        # choose a plant uniformly among the plants in the neighborhood
+        cumulative = np.cumsum(plant_counts, axis=1)
+        draws = (self.rng.random(len(idx)) * cumulative[:, -1]).astype(
+            np.int64)
+        cell = np.argmax(cumulative > draws[:, None], axis=1)
+        within = draws - (cumulative[np.arange(len(idx)), cell] -
+                          plant_counts[np.arange(len(idx)), cell])
+        flat_cell = self.grid.neighborhood_table[self.get_cells(idx), cell]
+        plants = self.plants.by_cell[self.plants.cell_start[flat_cell] +
+                                     within]
+        self.plants.update(plants)
+
+        # rank of each ant among the ants (in random order) choosing the
+        # same plant
+        order = self.rng.permutation(len(idx))
+        order = order[np.argsort(plants[order], kind="stable")]
+        sorted_plants = plants[order]
+        rank = np.arange(len(idx)) - \
+            np.searchsorted(sorted_plants, sorted_plants, side="left")
+
+        taken = np.empty(len(idx), dtype=bool)
+        taken[order] = rank < np.floor(self.plants.num_leaves[sorted_plants])
+        self.plants.num_leaves -= np.bincount(plants[taken],
+                                              minlength=len(self.plants))
+        return taken
+
+    def get_cells(self, idx):
+        """
+        Flat cell indices of the positions of the ants at indices `idx`.
+        """
+        return self.ants.x[idx] * self.grid.height + self.ants.y[idx]
+
+    def move_to_neighbor(self, idx, column) -> None:
+        """
+        Move each ant at indices `idx` to the cell in the given `column` of
+        the Moore neighborhood table (column 0 is the current cell).
+        """
+        cells = self.grid.neighborhood_table[self.get_cells(idx), column]
+        self.ants.x[idx], self.ants.y[idx] = np.divmod(
+            cells, self.grid.height)
+
+    def get_nearby(self, field, idx):
+        """
+        Values of the grid array `field` on the Moore neighborhood (including
+        the center) of the ants at indices `idx`, one row per ant.
+        """
+        return field.reshape(-1)[
+            self.grid.neighborhood_table[self.get_cells(idx)]]
+
+    def get_nearby_pheromones(self, idx):
+        """
+        Whether the cells in the Moore neighborhood (including the center) of
+        the ants at indices `idx` hold a pheromone, one row per ant.
+        """
+        return self.pheromones.present_cells(
+            self.grid.neighborhood_table[self.get_cells(idx)])
+
+    def get_direction_towards_nest(self, idx):
+        """
+        Vectorized `AntAgent.get_direction_towards_nest` for the ants at
+        indices `idx`.
+        """
+        x, y = self.ants.x[idx], self.ants.y[idx]
+        return self.nest_geometry.step_x[x, y], \
+            self.nest_geometry.step_y[x, y]
+
+    def get_neighborhood_density(self, idx):
+        """
+        Vectorized `AntAgent.get_neighborhood_density` for the ants at indices
+        `idx`: the fraction of cells in the Moore neighborhood that are
+        occupied by at least one other ant.
+        """
+        ants = self.ants
+        occupancy = np.zeros((self.grid.width, self.grid.height),
+                             dtype=np.int64)
+        np.add.at(occupancy, (ants.x, ants.y), 1)
+        occupied_nearby = torus_moore_sum((occupancy > 0).astype(np.int64))
+
+        x, y = ants.x[idx], ants.y[idx]
+        # an ant alone on its cell does not count its own cell
+        alone = occupancy[x, y] == 1
+        return (occupied_nearby[x, y] - alone) / 9
+
+    def set_roundtrip_length(self, idx, mu) -> None:
+        """
+        Vectorized `AntAgent.set_roundtrip_length` for the ants at indices
+        `idx`.
+        """
+        self.ants.fungus_biomass_start[idx] = self.fungus.biomass
+        self.ants.roundtrip_length[idx] = np.rint(
+            self.rng.uniform(1, mu * 2, len(idx)))
+
+    def reset_trip(self, idx) -> None:
+        """
+        Vectorized `AntAgent.reset_trip` for the ants at indices `idx`.
+        """
+        if self.collect_data:
+            if self.trip_summary is None:
+                self.trip_durations.extend(
+                    self.ants.trip_duration[idx].tolist())
+            else:
+                self.trip_summary.add_many(self.ants.trip_duration[idx],
+                                           self.ants.uid[idx])
+
+        self.ants.neighbor_density_acc[idx] = 0
+        self.ants.trip_duration[idx] = 0
+
+
+# model engines selectable from the runner scripts
+MODEL_ENGINES = {
+    "agent": LeafcutterAntsFungiMutualismModel,
+    "vectorized": VectorizedLeafcutterAntsFungiMutualismModel,
+}
@@ -1,56 +1,169 @@
 #! /usr/bin/env python3
 
+import os
 import time
 import argparse
 import multiprocess as mp
 import numpy as np
 from itertools import product
 
-from model import LeafcutterAntsFungiMutualismModel
+from model import MODEL_ENGINES, ResultsStoreWriter, TripSummary
+from model import RunCache, RunLimits, retry_seed, run_and_summarize
+from model import run_key, spawn_seeds
 from batchrunner import BatchRunnerMP
+from failures import FailureLedger, run_with_retries
+from memory import MemoryGovernor
+from workqueue import BACKENDS, open_pool
 
 
-def run_model(args):
-    model, args = args
-    m = model(**{"collect_data": args["collect_timeseries"]})
-
-    while m.running and m.schedule.steps < args["time_steps"]:
-        m.step()
-
-    return m
+def model_kwargs(args, seed):
+    """
+    Model parameters of the repetition with `seed`.
+    """
+    return {"collect_data": args["collect_timeseries"], "seed": seed,
+            "stop_on_death": args["stop_on_death"],
+            "steady_state_window": args["steady_state_window"],
+            "record_interval": args["record_interval"],
+            "trip_summary": args["trip_summary"],
+            "trip_sample_every": args["trip_sample_every"],
+            "ant_budget": args["ant_budget"],
+            "ant_budget_action": args["ant_budget_action"]}
 
 
-def run_model_parallel(args):
+def run_model(args):
+    model, kwargs, time_steps, index, limits = args
+
+    # only the compact result is sent back to the parent, not the model
+    return index, run_and_summarize(model, kwargs, time_steps, limits=limits)
+
+
+def reseed(task, attempt):
+    """
+    Task `task` with a fresh seed for retry `attempt`.
+    """
+    model, kwargs, time_steps, index, limits = task
+    return (model, dict(kwargs, seed=retry_seed(kwargs["seed"], attempt)),
+            time_steps, index, limits)
+
+
+def run_model_parallel(args, seeds, cache=None, ledger=None):
+    """
+    Run one repetition per seed in `seeds`, yielding `(index, result)` as
+    the repetitions complete. Repetitions found in `cache` are not run again,
+    the others are added to it. Repetitions that fail or exceed the limits
+    are retried with fresh seeds, and left out if they keep failing; the
+    failures are recorded in the `FailureLedger` `ledger`. Fewer repetitions
+    are run at a time if the workers would run out of memory.
+    """
     n_cores = args["n_cores"]
     if n_cores is None:
         n_cores = mp.cpu_count()
 
-    repetitions = args["repetitions"]
-    results = []
-    trip_durations = []
-
-    with mp.Pool(n_cores) as pool:
-        for model in pool.imap_unordered(
-            run_model,
-            [(LeafcutterAntsFungiMutualismModel, args)
-             for _ in range(repetitions)]
-        ):
-            results.append(
-                model.datacollector.get_model_vars_dataframe().to_dict())
-            trip_durations.append(model.trip_durations)
-
-    return results, trip_durations
+    model_cls = MODEL_ENGINES[args["engine"]]
+    limits = None
+    if args["timeout"] is not None or args["min_step_rate"] is not None:
+        limits = RunLimits(args["timeout"], args["min_step_rate"])
+
+    tasks = []
+    keys = {}
+    for i, seed in enumerate(seeds):
+        kwargs = model_kwargs(args, seed)
+        if cache is not None:
+            keys[i] = run_key(model_cls, kwargs, args["time_steps"])
+            result = cache.get(keys[i])
+            if result is not None:
+                yield i, result
+                continue
+        tasks.append((model_cls, kwargs, args["time_steps"], i, limits))
+
+    if not tasks:
+        return
+
+    for _, (i, result) in run_with_retries(
+            lambda: open_pool(args["backend"], n_cores, args["queue"],
+                              args["max_tasks_per_child"]),
+            run_model, tasks, [[position] for position in range(len(tasks))],
+            describe=lambda task: task[1], retries=args["retries"],
+            reseed=reseed, ledger=ledger, task_timeout=args["timeout"],
+            governor=MemoryGovernor(n_cores)):
+        # a retried repetition has another seed than its cache key
+        if cache is not None and result.seed == seeds[i]:
+            cache.put(keys[i], result)
+        yield i, result
+
+
+def save_npz(path, results, seed_entropy) -> None:
+    """
+    Save the results of all repetitions in a single .npz file, the format
+    of the time steps notebook.
+    """
+    results = [results[index] for index in sorted(results)]
+
+    def objects(values):
+        # one entry per repetition, also if the entries have different lengths
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    if results and results[0].trip_summary is not None:
+        # the summaries of all repetitions merged, and each repetition's own
+        summaries = [result.trip_summary for result in results]
+        trips = {
+            "trip_summary": TripSummary.merged(summaries).to_dict(),
+            "trip_summaries": [summary.to_dict() for summary in summaries],
+        }
+    else:
+        trips = {"trip_durations": objects(
+            [result.trip_durations.tolist() for result in results])}
+
+    # -1 if the run was not stopped early
+    stop_steps = [-1 if result.stop_step is None else result.stop_step
+                  for result in results]
+    np.savez(path,
+             results=objects([result.get_model_vars_dataframe().to_dict()
+                              for result in results]),
+             seeds=[result.seed for result in results],
+             seed_entropy=str(seed_entropy),
+             stop_steps=stop_steps,
+             runtimes=[result.runtime for result in results], **trips)
 
 
 def main(args):
     start = time.time()
-    results, trip_durations = run_model_parallel(args)
+    # one independent seed per repetition
+    seed_entropy, seeds = spawn_seeds(args["seed"], args["repetitions"])
+
+    writer = None
+    if args["store"]:
+        print(f"------ Writing data to {args['store']} --------")
+        # every repetition is written to the store as soon as it completes
+        writer = ResultsStoreWriter(args["store"], metadata={
+            "args": args, "seed_entropy": str(seed_entropy), "seeds": seeds})
+    cache = None
+    if args["cache"]:
+        cache = RunCache(args["cache"], max_bytes=None if args["cache_size"]
+                         is None else int(args["cache_size"] * 1e6))
+    # repetitions that keep failing are recorded next to the results
+    if args["store"]:
+        ledger_path = os.path.join(args["store"], "failures.json")
+    else:
+        ledger_path = os.path.splitext(args["output_file"])[0] + \
+            ".failures.json"
+    ledger = FailureLedger(ledger_path)
+    results = {}
+    for index, result in run_model_parallel(args, seeds, cache, ledger):
+        if writer is not None:
+            writer.write(index, result)
+        results[index] = result
     end = time.time()
 
     print(f"Done! Took {end - start}")
+    if ledger.entries:
+        print(ledger.report())
+    if cache is not None:
+        print(f"Cache: {cache.stats()}")
     print(f"------ Saving data to {args['output_file']} --------")
-    np.savez(args["output_file"], results=results,
-             trip_durations=trip_durations)
+    save_npz(args["output_file"], results, seed_entropy)
 
 
 if __name__ == "__main__":
@@ -58,15 +171,71 @@ if __name__ == "__main__":
         description="Leafcutter Ants Fungy Mutualism model runner")
 
     argparser.add_argument("output_file", type=str,
-                           help="location of output file")
+                           help="location of output file (.npz)")
     argparser.add_argument("-r", "--repetitions", type=int, default=1,
                            help="number of repeated model runs")
     argparser.add_argument("-t", "--time-steps", type=int, default=1000,
                            help="number of time steps to execute")
     argparser.add_argument("-n", "--n-cores", type=int, default=None,
-                           help="number of processes to use in pool")
+                           help="number of processes to use in pool (local "
+                           "workers with the queue backend)")
     argparser.add_argument("-c", "--collect-timeseries", type=bool,
                            default=True, help="collect timeseries data")
+    argparser.add_argument("-e", "--engine", type=str, default="agent",
+                           choices=sorted(MODEL_ENGINES.keys()),
+                           help="model engine to run")
+    argparser.add_argument("-s", "--seed", type=int, default=None,
+                           help="root seed of the repetitions' seeds")
+    argparser.add_argument("--stop-on-death", action="store_true",
+                           help="stop a run when the colony dies")
+    argparser.add_argument("--steady-state-window", type=int, default=None,
+                           help="stop a run when the fungus biomass and ant "
+                           "count are steady over this many steps")
+    argparser.add_argument("-i", "--record-interval", type=int, default=1,
+                           help="record the timeseries every this many steps")
+    argparser.add_argument("--trip-summary", action="store_true",
+                           help="save a histogram and summary statistics of "
+                           "the trip durations instead of all trips")
+    argparser.add_argument("--trip-sample-every", type=int, default=None,
+                           help="with --trip-summary, also save the trips of "
+                           "the ants whose id is a multiple of this number")
+    argparser.add_argument("--store", type=str, default=None,
+                           help="also write every repetition to this results "
+                           "store directory as soon as it completes, see "
+                           "ResultsStore")
+    argparser.add_argument("--cache", type=str, default=None,
+                           help="directory of a cache of model runs; "
+                           "repetitions found in it are not run again")
+    argparser.add_argument("--cache-size", type=float, default=None,
+                           help="size limit of the cache in MB, the least "
+                           "recently used runs are evicted beyond it")
+    argparser.add_argument("--backend", type=str, default="local",
+                           choices=BACKENDS,
+                           help="run the repetitions in a pool of local "
+                           "processes, or in a work queue that workers on "
+                           "other hosts can join (see workqueue.py)")
+    argparser.add_argument("--queue", type=str, default="data/queue",
+                           help="directory of the work queue, shared with the "
+                           "workers")
+    argparser.add_argument("--ant-budget", type=int, default=None,
+                           help="maximum number of live ants, a colony that "
+                           "outgrows it ends the repetition")
+    argparser.add_argument("--ant-budget-action", type=str, default="censor",
+                           choices=("censor", "abort"),
+                           help="stop a repetition that outgrows the ant "
+                           "budget and record it as censored, or fail it")
+    argparser.add_argument("--timeout", type=float, default=None,
+                           help="wall-clock limit of a repetition in seconds")
+    argparser.add_argument("--min-step-rate", type=float, default=None,
+                           help="stop a repetition that runs fewer steps per "
+                           "second (over 10 s windows), e.g. because its ant "
+                           "population explodes")
+    argparser.add_argument("--retries", type=int, default=2,
+                           help="number of times a failed repetition is "
+                           "retried with a fresh seed")
+    argparser.add_argument("--max-tasks-per-child", type=int, default=None,
+                           help="replace a worker process after this many "
+                           "repetitions")
 
     args = vars(argparser.parse_args())
 
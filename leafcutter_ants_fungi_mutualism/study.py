@@ -0,0 +1,377 @@
+"""
+Experiment planner: compiles a declarative study file into a deduplicated set
+of model runs. A study is a JSON file like
+
+    {
+        "engine": "agent",
+        "max_steps": 1000,
+        "repetitions": 64,
+        "seed": 20220101,
+        "limits": {"timeout": 600, "min_step_rate": 1},
+        "retries": 2,
+        "reporters": ["Ants_Biomass", "Fungus_Biomass"],
+        "fixed_parameters": {"collect_data": false, "num_ants": 50, ...},
+        "analyses": {
+            "ofat": {"kind": "ofat", "samples": 10,
+                     "problem": {"num_ants": ["int", [10, 100]], ...}},
+            "sobol": {"kind": "saltelli", "N": 512, "repetitions": 1,
+                      "sample_file": "data/Sobol/saltellisample",
+                      "problem": {...}},
+            "grid": {"kind": "grid", "parameters": {"num_ants": [10, 50]}},
+            "lhs": {"kind": "lhs", "samples": 100, "problem": {...}}
+        }
+    }
+
+Every analysis expands into parameter points (on top of the fixed
+parameters of the study and the analysis), each run `repetitions` times (per
+analysis or for the whole study). The seed of a run is derived from the study
+seed, its parameters and its repetition, so identical runs, such as the
+nominal point that is part of every OFAT sweep, are simulated only once and
+shared by all analyses. A run that exceeds the `limits` (see `RunLimits`) or
+fails otherwise is retried `retries` times with a fresh seed.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from itertools import product
+
+import multiprocess as mp
+import numpy as np
+import pandas as pd
+
+from costs import RuntimeModel, makespan_report, plan_chunks
+from failures import FailureLedger, run_with_retries
+from memory import MemoryGovernor
+from model import MODEL_ENGINES, RunLimits, retry_seed, run_and_summarize
+from model import run_key
+from model import track_ants, track_ants_leaves, track_dormant_ants
+from model import track_leaves, track_ratio_foragers
+from workqueue import open_pool
+
+
+def fungus_biomass(model):
+    return model.fungus.biomass
+
+
+def death_reason(model):
+    return model.death_reason
+
+
+def censored(model):
+    return model.ant_budget_exceeded
+
+
+# reporters that a study can refer to by name
+REPORTERS = {"Ants_Biomass": track_ants,
+             "Fungus_Biomass": fungus_biomass,
+             "Fraction forager ants": track_ratio_foragers,
+             "Available leaves": track_leaves,
+             "Dormant caretakers fraction": track_dormant_ants,
+             "Ants with leaves": track_ants_leaves,
+             "Death reason": death_reason,
+             "Censored": censored,
+             }
+
+TYPES = {"int": int, "float": float}
+
+
+def load_study(path) -> dict:
+    """ load a study file """
+    with open(path) as f:
+        return json.load(f)
+
+
+def _value(value):
+    """ plain, rounded parameter value, so equal points compare equal """
+    if isinstance(value, (np.integer, int)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return float(f"{value:.12g}")
+    return value
+
+
+def _typed(problem, name, value):
+    return _value(round(value) if TYPES[problem[name][0]] is int else value)
+
+
+def problem_sampler(problem) -> dict:
+    """ the problem in the format of SALib """
+    names = sorted(problem.keys())
+    return {'num_vars': len(names), 'names': names,
+            'bounds': [problem[name][1] for name in names]}
+
+
+def sample_hash(param_values) -> str:
+    """ hash of a parameter sample """
+    return hashlib.sha256(np.ascontiguousarray(
+        param_values, dtype=np.float64).tobytes()).hexdigest()
+
+
+def saltelli_sample(problem, N, path=None):
+    """
+    Saltelli sample of `problem`. If `path` is given the sample is created
+    there once, with its hash in `path.sha256`, and loaded (and checked
+    against the hash) from then on.
+    """
+    from SALib.sample import saltelli
+
+    if path is None:
+        return saltelli.sample(problem_sampler(problem), N=N,
+                               calc_second_order=False)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savetxt(path, saltelli.sample(problem_sampler(problem), N=N,
+                                         calc_second_order=False))
+        # hash of the sample as saved, checked whenever it is loaded
+        with open(path + '.sha256', 'w') as f:
+            f.write(sample_hash(np.loadtxt(path)))
+
+    param_values = np.loadtxt(path)
+    with open(path + '.sha256') as f:
+        if f.read().strip() != sample_hash(param_values):
+            raise ValueError(f"{path} does not match its recorded hash")
+    return param_values
+
+
+def ofat_points(analysis, fixed_parameters):
+    """ points of a one-factor-at-a-time sweep, tagged with the parameter """
+    problem = analysis['problem']
+    for name in problem:
+        kind, bounds = problem[name]
+        for value in np.linspace(*bounds, num=analysis['samples'],
+                                 dtype=TYPES[kind]):
+            point = dict(fixed_parameters)
+            point[name] = _value(value)
+            yield point, {'parameter': name}
+
+
+def saltelli_points(analysis, fixed_parameters):
+    """ points of a Saltelli sample, tagged with the sample row """
+    problem = analysis['problem']
+    names = sorted(problem.keys())
+    sample = saltelli_sample(problem, analysis['N'],
+                             analysis.get('sample_file'))
+    for row, values in enumerate(sample):
+        point = dict(fixed_parameters)
+        point.update((name, _typed(problem, name, value))
+                     for name, value in zip(names, values))
+        yield point, {'row': row}
+
+
+def grid_points(analysis, fixed_parameters):
+    """ points of the full grid of the parameter values """
+    names = list(analysis['parameters'])
+    for values in product(*analysis['parameters'].values()):
+        point = dict(fixed_parameters)
+        point.update((name, _value(value))
+                     for name, value in zip(names, values))
+        yield point, {}
+
+
+def lhs_points(analysis, fixed_parameters, seed=None):
+    """ points of a latin hypercube sample """
+    from SALib.sample import latin
+
+    problem = analysis['problem']
+    names = sorted(problem.keys())
+    sample = latin.sample(problem_sampler(problem), analysis['samples'],
+                          seed=seed)
+    for values in sample:
+        point = dict(fixed_parameters)
+        point.update((name, _typed(problem, name, value))
+                     for name, value in zip(names, values))
+        yield point, {}
+
+
+def point_seed(seed, point, repetition) -> int:
+    """
+    Seed of repetition `repetition` at parameter point `point`, derived from
+    the study `seed`. Equal points get equal seeds, in whichever analysis
+    they occur.
+    """
+    digest = hashlib.sha256(json.dumps(point, sort_keys=True).encode())
+    words = np.frombuffer(digest.digest()[:16], dtype=np.uint32)
+    sequence = np.random.SeedSequence(
+        [seed, *words.tolist(), repetition])
+    return int(sequence.generate_state(1, np.uint64)[0])
+
+
+class StudyPlan:
+    """
+    Study compiled into its unique model runs (`tasks`, the model kwargs
+    including the seed) and, per analysis, the runs it consists of
+    (`analyses[name]`, a list of `(task, point, repetition, tags)`).
+    """
+
+    def __init__(self, study):
+        self.study = study
+        # fresh entropy if the study has no seed
+        self.seed = study.get('seed')
+        if self.seed is None:
+            self.seed = np.random.SeedSequence().entropy
+        self.model_cls = MODEL_ENGINES[study.get('engine', 'agent')]
+        self.max_steps = study['max_steps']
+        self.model_reporters = OrderedDict(
+            (name, REPORTERS[name]) for name in study['reporters'])
+        # limits of every run ({"timeout": s, "min_step_rate": steps/s}) and
+        # how often a failed run is retried with a fresh seed
+        self.limits = RunLimits(**study['limits']) if 'limits' in study \
+            else None
+        self.retries = study.get('retries', 2)
+        self.tasks = []
+        self.analyses = OrderedDict()
+
+        seed = self.seed
+        task_index = {}
+        for name, analysis in study['analyses'].items():
+            kind = analysis['kind']
+            # analyses can override fixed parameters of the study
+            fixed_parameters = {name: _value(value) for name, value in dict(
+                study.get('fixed_parameters', {}),
+                **analysis.get('fixed_parameters', {})).items()}
+            if kind == 'ofat':
+                points = ofat_points(analysis, fixed_parameters)
+            elif kind == 'saltelli':
+                points = saltelli_points(analysis, fixed_parameters)
+            elif kind == 'grid':
+                points = grid_points(analysis, fixed_parameters)
+            elif kind == 'lhs':
+                points = lhs_points(analysis, fixed_parameters,
+                                    seed % 2 ** 32)
+            else:
+                raise ValueError(f"unknown analysis kind {kind!r}")
+
+            repetitions = analysis.get('repetitions',
+                                       study.get('repetitions', 1))
+            runs = self.analyses[name] = []
+            for point, tags in points:
+                for repetition in range(repetitions):
+                    kwargs = dict(point, seed=point_seed(seed, point,
+                                                         repetition))
+                    key = json.dumps(kwargs, sort_keys=True)
+                    if key not in task_index:
+                        task_index[key] = len(self.tasks)
+                        self.tasks.append(kwargs)
+                    runs.append((task_index[key], point, repetition, tags))
+
+    @property
+    def requested(self) -> int:
+        """ number of runs the analyses consist of """
+        return sum(len(runs) for runs in self.analyses.values())
+
+    @property
+    def saved(self) -> int:
+        """ number of runs shared with another analysis or point """
+        return self.requested - len(self.tasks)
+
+    def summary(self) -> str:
+        return (f"{self.requested} runs requested, {len(self.tasks)} unique "
+                f"simulations ({self.saved} saved by deduplication)")
+
+    def run_key(self, task):
+        """ cache key of task `task` """
+        return run_key(self.model_cls, self.tasks[task], self.max_steps,
+                       model_reporters=self.model_reporters, timeseries=False)
+
+    def table(self, name, results):
+        """
+        DataFrame with a row per run of analysis `name`: its parameters,
+        repetition, tags, seed, stop step, whether it was censored (see
+        `RunResult.censored`) and reporter values, from
+        `results` (task to `RunResult`), without the runs missing from it.
+        """
+        rows = []
+        for task, point, repetition, tags in self.analyses[name]:
+            if task not in results:
+                # given up on, see the failure ledger
+                continue
+            result = results[task]
+            rows.append({**point, **tags, 'iteration': repetition,
+                         **result.reporters, 'seed': result.seed,
+                         'stop_step': result.stop_step,
+                         'censored': result.censored})
+        return pd.DataFrame(rows)
+
+
+def compile_study(study) -> StudyPlan:
+    """ compile a study (a dict or the path of a study file) """
+    if not isinstance(study, dict):
+        study = load_study(study)
+    return StudyPlan(study)
+
+
+def _run_task(args):
+    task, model_cls, kwargs, max_steps, model_reporters, limits = args
+    return task, run_and_summarize(model_cls, kwargs, max_steps,
+                                   model_reporters=model_reporters,
+                                   timeseries=False, limits=limits)
+
+
+def _reseed(args, attempt):
+    kwargs = dict(args[2], seed=retry_seed(args[2]['seed'], attempt))
+    return args[:2] + (kwargs,) + args[3:]
+
+
+def run_plan(plan, tasks=None, processes=None, cache=None, costs=None,
+             backend=None, queue=None, ledger=None, maxtasksperchild=None):
+    """
+    Run the tasks `tasks` (default all) of `plan` in one pool of `processes`
+    processes (all available processors if None), yielding
+    `(task, result)` as the runs complete. Tasks found in `cache` are not
+    run again, the others are added to it. The tasks are run longest
+    expected first according to the `RuntimeModel` `costs` (if given), which
+    records the runtimes of the new runs. The runs are executed by the pool
+    of `backend` (see `open_pool`), for the "queue" backend also by workers
+    on other hosts sharing the directory `queue`, with local processes
+    replaced after `maxtasksperchild` jobs.
+
+    A run that fails or exceeds the limits of the study is retried
+    `plan.retries` times with fresh seeds, and left out if it keeps failing.
+    Failures are recorded in the `FailureLedger` `ledger` and reported at
+    the end. Fewer runs are run at a time if the workers would run out of
+    memory (see `MemoryGovernor`).
+    """
+    tasks = range(len(plan.tasks)) if tasks is None else tasks
+    pending = []
+    for task in tasks:
+        result = None if cache is None else cache.get(plan.run_key(task))
+        if result is not None:
+            yield task, result
+        else:
+            pending.append((task, plan.model_cls, plan.tasks[task],
+                            plan.max_steps, plan.model_reporters, plan.limits))
+
+    if not pending:
+        return
+
+    processes = mp.cpu_count() if processes is None else processes
+    if costs is None:
+        costs = RuntimeModel()
+    expected = [costs.predict(kwargs, max_steps)
+                for _, _, kwargs, max_steps, _, _ in pending]
+    chunks = plan_chunks(expected, processes)
+    if costs.fitted:
+        print("Expected " + makespan_report(expected, chunks, processes))
+
+    ledger = FailureLedger() if ledger is None else ledger
+    runtimes = [0.0] * len(pending)
+    start = time.perf_counter()
+    for position, (task, result) in run_with_retries(
+            lambda: open_pool(backend, processes, queue, maxtasksperchild),
+            _run_task, pending, chunks, describe=lambda args: args[2],
+            retries=plan.retries, reseed=_reseed, ledger=ledger,
+            task_timeout=getattr(plan.limits, 'timeout', None),
+            governor=MemoryGovernor(processes)):
+        runtimes[position] = result.runtime
+        costs.record(plan.tasks[task], plan.max_steps, result.runtime)
+        # a retried run has another seed than its cache key
+        if cache is not None and result.seed == plan.tasks[task]['seed']:
+            cache.put(plan.run_key(task), result)
+        yield task, result
+    print(f"Took {time.perf_counter() - start:.1f} s, measured "
+          + makespan_report(runtimes, chunks, processes))
+    if ledger.entries:
+        print(ledger.report())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the model package and the runner modules are imported from the folder
+# above, like the scripts do when run from it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,33 @@
+import pytest
+
+from model import MODEL_ENGINES, summarize_run
+from model.stopping import AntBudgetExceeded
+from study import REPORTERS
+
+
+@pytest.mark.parametrize("engine", sorted(MODEL_ENGINES))
+def test_runs_over_the_ant_budget_are_censored_not_dead(engine):
+    model = MODEL_ENGINES[engine](seed=1, collect_data=False, ant_budget=55)
+    model.run_model(300)
+    result = summarize_run(model, model_reporters={
+        name: REPORTERS[name] for name in ("Death reason", "Censored")})
+
+    assert result.censored
+    assert result.stop_step == model.schedule.steps < 300
+    assert result.death_reason is None
+    assert result.reporters == {"Death reason": None, "Censored": True}
+    assert model.ant_counts.ants == 55
+
+
+def test_runs_within_the_ant_budget_are_not_censored():
+    model = MODEL_ENGINES["agent"](seed=1, collect_data=False)
+    model.run_model(50)
+    assert not summarize_run(model).censored
+
+
+@pytest.mark.parametrize("engine", sorted(MODEL_ENGINES))
+def test_runs_over_the_ant_budget_can_abort(engine):
+    model = MODEL_ENGINES[engine](seed=1, collect_data=False, ant_budget=55,
+                                  ant_budget_action="abort")
+    with pytest.raises(AntBudgetExceeded):
+        model.run_model(300)
@@ -0,0 +1,84 @@
+import os
+
+from model import LeafcutterAntsFungiMutualismModel, RunCache, run_key
+from model import run_and_summarize
+from model.vectorized import VectorizedLeafcutterAntsFungiMutualismModel
+
+MODEL = LeafcutterAntsFungiMutualismModel
+
+
+def test_run_keys():
+    key = run_key(MODEL, {"seed": 1, "num_ants": 50}, 100)
+    assert key == run_key(MODEL, {"num_ants": 50, "seed": 1}, 100)
+    assert key != run_key(MODEL, {"seed": 2, "num_ants": 50}, 100)
+    assert key != run_key(MODEL, {"seed": 1, "num_ants": 51}, 100)
+    assert key != run_key(MODEL, {"seed": 1, "num_ants": 50}, 101)
+    assert key != run_key(VectorizedLeafcutterAntsFungiMutualismModel,
+                          {"seed": 1, "num_ants": 50}, 100)
+    assert key != run_key(MODEL, {"seed": 1, "num_ants": 50}, 100,
+                          timeseries=False)
+    # reporters by their source, lambdas included
+    ants = run_key(MODEL, {"seed": 1}, 100,
+                   model_reporters={"x": lambda m: m.ant_counts.ants})
+    biomass = run_key(MODEL, {"seed": 1}, 100,
+                      model_reporters={"x": lambda m: m.fungus.biomass})
+    assert ants != biomass
+
+    # runs without a seed are not reproducible
+    assert run_key(MODEL, {"num_ants": 50}, 100) is None
+    assert run_key(MODEL, {"seed": None}, 100) is None
+
+
+def test_cached_runs_round_trip(tmp_path):
+    cache = RunCache(str(tmp_path))
+    kwargs = {"seed": 4, "collect_data": True}
+    key = run_key(MODEL, kwargs, 50)
+    assert cache.get(key) is None
+
+    result = run_and_summarize(MODEL, kwargs, 50)
+    cache.put(key, result)
+    cached = RunCache(str(tmp_path)).get(key)
+    assert (cached.seed, cached.steps) == (4, 50)
+    assert cached.get_model_vars_dataframe().equals(
+        result.get_model_vars_dataframe())
+    assert cache.stats() == "0 hits, 1 misses (0% hit rate), 0 evictions"
+
+
+def test_runs_without_a_key_are_not_cached(tmp_path):
+    cache = RunCache(str(tmp_path))
+    cache.put(None, {"value": 1})
+    assert cache.size() == 0
+    assert cache.get(None) is None
+    assert cache.misses == 1
+
+
+def test_unreadable_results_are_misses(tmp_path):
+    cache = RunCache(str(tmp_path))
+    cache.put("ab01", {"value": 1})
+    with open(cache._file("ab01"), "wb") as f:
+        f.write(b"truncated")
+    assert cache.get("ab01") is None
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    keys = ["aa01", "bb02", "cc03", "dd04"]
+    cache = RunCache(str(tmp_path))
+    for age, key in enumerate(keys[:3]):
+        cache.put(key, {"value": "x" * 1000})
+        # oldest first, one second apart
+        os.utime(cache._file(key), (1000 + age, 1000 + age))
+    entry = os.path.getsize(cache._file(keys[0]))
+
+    cache = RunCache(str(tmp_path), max_bytes=3 * entry)
+    # used, so no longer the least recently used
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[3], {"value": "y" * 1000})
+
+    assert cache.evictions == 1
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) is not None for key in (keys[0], keys[2],
+                                                       keys[3]))
+    assert cache.size() == 3 * entry
+
+    cache.evict(entry)
+    assert [key for key in keys if cache.get(key) is not None] == [keys[3]]
@@ -0,0 +1,103 @@
+import time
+
+import multiprocess as mp
+import numpy as np
+import pytest
+
+from costs import RuntimeModel, dispatch, makespan, plan_chunks
+
+
+def test_runtime_model_learns_from_its_log(tmp_path):
+    path = str(tmp_path / "runtimes" / "agent.jsonl")
+    costs = RuntimeModel(path)
+    assert not costs.fitted
+    assert costs.predict({"num_ants": 50}, 100) == 1.0
+
+    for num_ants in (10, 20, 50, 100, 200):
+        for max_steps in (100, 1000):
+            costs.record({"num_ants": num_ants, "seed": num_ants,
+                          "collect_data": True}, max_steps,
+                         1e-5 * num_ants * max_steps)
+
+    # learned from the log, without the seed and flags
+    costs = RuntimeModel(path)
+    assert costs.fitted
+    assert costs.names == ["num_ants"]
+    assert costs.predict({"num_ants": 100}, 1000) == pytest.approx(1.0,
+                                                                  rel=0.1)
+    assert costs.predict({"num_ants": 20}, 100) == pytest.approx(0.02,
+                                                                rel=0.1)
+
+
+def test_runtime_model_ignores_non_numeric_values(tmp_path):
+    path = str(tmp_path / "agent.jsonl")
+    costs = RuntimeModel(path)
+    for num_ants in (10, 50, 100):
+        costs.record({"num_ants": num_ants, "ant_budget": 10000,
+                      "engine": "agent"}, 100, 1e-3 * num_ants)
+
+    costs = RuntimeModel(path)
+    assert costs.names == ["ant_budget", "num_ants"]
+    expected = costs.predict({"num_ants": 50}, 100)
+    assert np.isfinite(expected)
+    assert costs.predict({"num_ants": 50, "ant_budget": None}, 100) == expected
+    assert costs.predict({"num_ants": 50, "ant_budget": "10000"},
+                         100) == expected
+
+
+def test_plan_chunks_runs_longest_first_and_batches_the_tail():
+    costs = [1.0] * 40 + [30.0, 20.0, 0.5, 10.0]
+    chunks = plan_chunks(costs, processes=4)
+
+    order = [i for chunk in chunks for i in chunk]
+    assert sorted(order) == list(range(len(costs)))
+    assert [costs[i] for i in order] == sorted(costs, reverse=True)
+    # expensive tasks on their own, cheap ones batched
+    assert chunks[:3] == [[40], [41], [43]]
+    assert len(chunks) < len(costs)
+
+    chunk_costs = [sum(costs[i] for i in chunk) for chunk in chunks]
+    single = makespan(sorted(costs, reverse=True), 4)[0]
+    assert makespan(chunk_costs, 4)[0] <= single * 1.01
+
+
+def test_plan_chunks_keeps_tasks_apart_when_batching_hurts():
+    # batching the two longest tasks would take 18 instead of 17
+    costs = [4.0, 5.0, 4.0, 8.0, 6.0, 5.0]
+    chunks = plan_chunks(costs, processes=2, chunks_per_process=1)
+    assert chunks == [[3], [4], [1], [5], [0], [2]]
+
+
+def test_makespan():
+    assert makespan([3, 1, 1, 1], 2) == (3, 0.0)
+    assert makespan([1, 1, 1], 2) == (2, 1.0)
+
+
+def _timed(duration):
+    start = time.monotonic()
+    time.sleep(duration)
+    return start, time.monotonic()
+
+
+class OneJobAtATime:
+    interval = 0.01
+
+    def limit(self):
+        return 1
+
+
+def test_dispatch_runs_no_more_jobs_than_the_governor_allows():
+    with mp.Pool(3) as pool:
+        results = list(dispatch(pool, _timed, [0.1] * 4, [[0], [1], [2], [3]],
+                                governor=OneJobAtATime()))
+    results.sort()
+    assert len(results) == 4
+    for (_, end), (start, _) in zip(results, results[1:]):
+        assert start >= end
+
+
+def test_dispatch_times_out_without_results():
+    with mp.Pool(1) as pool:
+        with pytest.raises(mp.TimeoutError):
+            list(dispatch(pool, _timed, [5.0], [[0]], timeout=0.5))
+        pool.terminate()
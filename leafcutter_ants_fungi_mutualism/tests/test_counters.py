@@ -0,0 +1,124 @@
+import pytest
+
+from model import MODEL_ENGINES, AntAgent, AntCounters, AntWorkerState
+from model import LeafcutterAntsFungiMutualismModel
+from model.vectorized import CARETAKING, EXPLORE
+
+
+def assert_counted(model):
+    assert model.ant_counts == AntCounters.scan(model.ant_agents())
+
+
+@pytest.mark.parametrize("engine", sorted(MODEL_ENGINES))
+def test_counters_match_scan_over_a_run(engine):
+    # `check_counters` verifies the counters against a scan every step
+    model = MODEL_ENGINES[engine](seed=0, collect_data=False,
+                                  check_counters=True)
+    events = set()
+    for _ in range(200):
+        ants, caretakers = model.ant_counts.ants, model.ant_counts.caretakers
+        model.step()
+        counts = model.ant_counts
+        if counts.ants > ants:
+            events.add("birth")
+        if counts.ants < ants:
+            events.add("death")
+        if counts.caretakers != caretakers:
+            events.add("role")
+        if counts.dormant_caretakers:
+            events.add("dormancy")
+    assert events == {"birth", "death", "role", "dormancy"}
+
+
+def test_counters_match_scan_after_fast_forward():
+    # without foragers, the model is quiescent between caretaker wake-ups
+    model = LeafcutterAntsFungiMutualismModel(
+        seed=0, collect_data=False, check_counters=True, fast_forward=True,
+        initial_foragers_ratio=0.0)
+    model.run_model(400)
+    assert_counted(model)
+
+
+@pytest.mark.parametrize("stop_on_death", [False, True])
+def test_counters_are_verified_after_every_fast_forward(monkeypatch,
+                                                        stop_on_death):
+    model = LeafcutterAntsFungiMutualismModel(
+        seed=0, collect_data=False, check_counters=True, fast_forward=True,
+        stop_on_death=stop_on_death, initial_foragers_ratio=0.0)
+    verified = []
+    verify = AntCounters.verify
+    monkeypatch.setattr(AntCounters, "verify", lambda self, model: (
+        verified.append(model.schedule.steps), verify(self, model)))
+
+    skips = []
+    skip_quiescent = model.skip_quiescent
+
+    def skip(max_steps):
+        ticks = skip_quiescent(max_steps)
+        if ticks:
+            skips.append(verified[-1:] == [model.schedule.steps])
+        return ticks
+
+    model.skip_quiescent = skip
+    model.run_model(400)
+    assert skips and all(skips)
+
+
+def test_agent_counters_follow_every_change():
+    model = LeafcutterAntsFungiMutualismModel(seed=0, collect_data=False)
+    assert_counted(model)
+
+    model.nest.ant_birth(5)
+    assert model.ant_counts.ants == model.num_ants + 5
+    assert_counted(model)
+
+    ant = model.schedule.agents_of_type(AntAgent)[0]
+    ant.has_leaf = True
+    assert_counted(model)
+    ant.state = AntWorkerState.CARETAKING
+    assert_counted(model)
+    ant.dormant = True
+    assert model.ant_counts.dormant_caretakers == 1
+    assert_counted(model)
+    # a drafted caretaker keeps its dormant flag but is not counted
+    ant.state = AntWorkerState.EXPLORE
+    assert model.ant_counts.dormant_caretakers == 0
+    assert_counted(model)
+    ant.state = AntWorkerState.CARETAKING
+    ant.die()
+    assert model.ant_counts.ants == model.num_ants + 4
+    assert_counted(model)
+
+
+def test_vectorized_counts_follow_every_change():
+    model = MODEL_ENGINES["vectorized"](seed=0, collect_data=False)
+    ants = model.ants
+
+    def assert_recounted():
+        assert ants.counts() == AntCounters.scan(model.ant_agents())
+
+    model.nest.ant_birth(5)
+    assert ants.counts().ants == model.num_ants + 5
+    assert_recounted()
+
+    forager = int(ants.state.tolist().index(EXPLORE))
+    ants.has_leaf[forager] = True
+    ants.state[forager] = CARETAKING
+    ants.dormant[forager] = True
+    assert ants.counts().dormant_caretakers == 1
+    assert_recounted()
+    ants.state[forager] = EXPLORE
+    assert ants.counts().dormant_caretakers == 0
+    assert_recounted()
+
+    alive = ants.state != CARETAKING
+    ants.keep(alive)
+    assert ants.counts().caretakers == 0
+    assert_recounted()
+
+
+def test_verify_detects_drift():
+    model = LeafcutterAntsFungiMutualismModel(seed=0, collect_data=False)
+    model.ant_counts.caretakers += 1
+    with pytest.raises(AssertionError, match="differ from scan"):
+        model.ant_counts.verify(model)
@@ -0,0 +1,37 @@
+import numpy as np
+
+from model import MODEL_ENGINES, DeathReason
+
+SEEDS = range(24)
+STEPS = 300
+
+
+def final_states(engine):
+    """
+    Death reason and fungus biomass after `STEPS` steps of every seed.
+    """
+    states = []
+    for seed in SEEDS:
+        model = MODEL_ENGINES[engine](seed=seed, collect_data=False)
+        for _ in range(STEPS):
+            model.step()
+        states.append((model.death_reason, model.fungus.biomass))
+    return states
+
+
+def test_engines_agree_on_colony_fate():
+    agent = final_states("agent")
+    vectorized = final_states("vectorized")
+
+    for states in (agent, vectorized):
+        fungus_deaths = sum(reason is DeathReason.FUNGUS
+                            for reason, _ in states)
+        assert fungus_deaths <= 2
+
+    deaths = [sum(reason is not None for reason, _ in states)
+              for states in (agent, vectorized)]
+    assert abs(deaths[0] - deaths[1]) <= 3
+
+    biomass = [np.median([biomass for _, biomass in states])
+               for states in (agent, vectorized)]
+    assert 2 / 3 < biomass[1] / biomass[0] < 3 / 2
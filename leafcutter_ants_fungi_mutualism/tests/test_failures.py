@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+
+import multiprocess as mp
+import pytest
+
+from failures import FailureLedger, run_with_retries
+from model import LeafcutterAntsFungiMutualismModel, RunLimits, RunTimeout
+from model import retry_seed, run_and_summarize
+from workqueue import QueuePool, run_worker
+
+
+def _always_fail(task):
+    raise ValueError(f"bad run {task['seed']}")
+
+
+def _fail_planned_seeds(task):
+    if task["seed"] < 100:
+        raise ValueError(f"bad run {task['seed']}")
+    return task["seed"]
+
+
+def _reseed(task, attempt):
+    return dict(task, seed=retry_seed(task["seed"], attempt))
+
+
+def run(func, tasks, ledger, retries=2):
+    return list(run_with_retries(
+        lambda: mp.Pool(2), func, tasks, [[i] for i in range(len(tasks))],
+        describe=dict, retries=retries, reseed=_reseed, ledger=ledger))
+
+
+def test_failing_runs_are_retried_with_fresh_seeds_then_given_up(tmp_path):
+    path = str(tmp_path / "failures.json")
+    ledger = FailureLedger(path)
+    tasks = [{"seed": 1}, {"seed": 2}]
+    assert run(_always_fail, tasks, ledger) == []
+
+    assert len(ledger.entries) == 6
+    for task in tasks:
+        entries = [entry for entry in ledger.entries if entry["run"] == task]
+        assert [entry["attempt"] for entry in entries] == [0, 1, 2]
+        assert [entry["retried"] for entry in entries] == [True, True, False]
+        assert [entry["retry_seed"] for entry in entries] == [
+            retry_seed(task["seed"], 1), retry_seed(task["seed"], 2), None]
+        assert all(entry["error"].startswith("ValueError: bad run")
+                   for entry in entries)
+    assert [entry["run"] for entry in ledger.given_up] == tasks
+    assert "6 failed attempts, 2 runs given up on" in ledger.report()
+
+    with open(path) as f:
+        assert json.load(f) == json.loads(json.dumps(ledger.entries))
+
+
+def test_retried_runs_succeed_with_their_retry_seed():
+    ledger = FailureLedger()
+    tasks = [{"seed": 1}, {"seed": 500}, {"seed": 3}]
+    results = dict(run(_fail_planned_seeds, tasks, ledger))
+
+    assert results == {0: retry_seed(1, 1), 1: 500, 2: retry_seed(3, 1)}
+    assert [entry["run"] for entry in ledger.entries] == [tasks[0], tasks[2]]
+    assert ledger.given_up == []
+
+
+def test_no_retries():
+    ledger = FailureLedger()
+    assert run(_always_fail, [{"seed": 1}], ledger, retries=0) == []
+    assert [entry["retried"] for entry in ledger.entries] == [False]
+
+
+def test_retries_run_on_the_workers_of_a_queue(tmp_path):
+    # a worker on another host, which exits once a coordinator is done
+    path = str(tmp_path)
+    worker = threading.Thread(target=run_worker, args=(path,),
+                              kwargs={"heartbeat": 0.05, "poll": 0.02},
+                              daemon=True)
+    results = {}
+    tasks = [{"seed": 1}, {"seed": 500}]
+
+    def open_pool():
+        # slower than the worker polls the queue
+        time.sleep(0.2)
+        return QueuePool(path, poll=0.02)
+
+    def coordinator():
+        results.update(run_with_retries(
+            open_pool, _fail_planned_seeds, tasks, [[0], [1]],
+            describe=dict, reseed=_reseed))
+
+    thread = threading.Thread(target=coordinator, daemon=True)
+    thread.start()
+    worker.start()
+    thread.join(20)
+    assert results == {0: retry_seed(1, 1), 1: 500}
+    worker.join(5)
+    assert not worker.is_alive()
+
+
+def test_run_limits():
+    limits = RunLimits(timeout=0.05)
+    limits.check(10)
+    time.sleep(0.1)
+    with pytest.raises(RunTimeout, match="wall-clock"):
+        limits.check(20)
+
+    limits = RunLimits(min_step_rate=1000, window=0.05)
+    time.sleep(0.1)
+    with pytest.raises(RunTimeout, match="steps/s"):
+        limits.check(5)
+
+
+def test_runs_over_their_limits_raise():
+    with pytest.raises(RunTimeout):
+        run_and_summarize(LeafcutterAntsFungiMutualismModel,
+                          {"seed": 0, "collect_data": False}, 10 ** 6,
+                          limits=RunLimits(timeout=0.2))
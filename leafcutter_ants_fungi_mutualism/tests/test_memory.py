@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import memory
+from memory import MemoryGovernor, _read_fields, worker_pids
+
+MB = 1024 ** 2
+
+
+class FakeProc:
+    """ a /proc of two workers whose readings the tests change """
+
+    def __init__(self, monkeypatch):
+        self.workers = {101: (100 * MB, 200 * MB), 102: (100 * MB, 150 * MB)}
+        self.available = 4000 * MB
+        self.total = 10000 * MB
+        # listed, but gone by the time their status is read
+        self.exited = []
+        monkeypatch.setattr(memory, "worker_pids",
+                            lambda: list(self.workers) + self.exited)
+        monkeypatch.setattr(memory, "_read_fields", self.read_fields)
+
+    def read_fields(self, path):
+        if path == "/proc/meminfo":
+            return {"MemAvailable": self.available, "MemTotal": self.total}
+        pid = int(path.split("/")[2])
+        if pid not in self.workers:
+            raise FileNotFoundError(path)
+        rss, hwm = self.workers[pid]
+        return {"VmRSS": rss, "VmHWM": hwm}
+
+
+@pytest.fixture
+def proc(monkeypatch):
+    return FakeProc(monkeypatch)
+
+
+def governor(processes):
+    governor = MemoryGovernor(processes, reserve=0.1, interval=0)
+    governor.enabled = True
+    return governor
+
+
+def test_limit_follows_the_available_memory(proc):
+    gov = governor(32)
+    # (200 MB of workers + 4000 - 1000 MB headroom) // 200 MB peak
+    assert gov.limit() == 16
+    assert gov.peak_rss == 200 * MB
+
+    proc.available = 1500 * MB
+    assert gov.limit() == 3
+
+    # a worker peaking higher lowers the limit
+    proc.workers[102] = (100 * MB, 700 * MB)
+    assert gov.limit() == 1
+
+
+def test_limit_is_clamped(proc):
+    assert governor(4).limit() == 4
+
+    gov = governor(4)
+    proc.available = 0
+    assert gov.limit() == 1
+
+
+def test_exited_workers_are_skipped(proc):
+    proc.exited = [103]
+    assert governor(32).limit() == 16
+
+
+def test_limit_is_measured_at_most_every_interval(proc):
+    gov = governor(32)
+    gov.interval = 3600
+    assert gov.limit() == 16
+    proc.available = 0
+    assert gov.limit() == 16
+
+
+def test_without_workers_or_proc_all_workers_are_used(proc):
+    proc.workers = {}
+    assert governor(8).limit() == 8
+
+    proc.workers = {101: (100 * MB, 200 * MB)}
+    proc.available = 0
+    gov = governor(8)
+    gov.enabled = False
+    assert gov.limit() == 8
+
+
+def test_read_fields(tmp_path):
+    path = tmp_path / "status"
+    path.write_text("Name:\tpython\nVmHWM:\t   2048 kB\nVmRSS:\t1024 kB\n"
+                    "Threads:\t4\n")
+    assert _read_fields(str(path)) == {"VmHWM": 2048 * 1024,
+                                       "VmRSS": 1024 * 1024}
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/meminfo"), reason="needs /proc")
+def test_worker_pids_finds_child_processes():
+    child = subprocess.Popen([sys.executable, "-c", "input()"],
+                             stdin=subprocess.PIPE)
+    try:
+        assert child.pid in worker_pids()
+    finally:
+        child.communicate(b"\n")
@@ -0,0 +1,72 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from model import AntAgent, LeafcutterAntsFungiMutualismModel
+from model.random_walker_agent import biased_walk_choice
+from model.util import manhattan_distance
+
+# evenly spaced uniform draws, to read the step distribution off the choices
+UNIFORMS = (np.arange(20000) + 0.5) / 20000
+
+POSITIONS = [(10, 10), (0, 5), (49, 5), (5, 0), (5, 49), (0, 0), (49, 49)]
+
+
+def walk_cases(grid):
+    """
+    Positions with every neighbor as previous position, and a far one.
+    """
+    for pos in POSITIONS:
+        for prev_pos in grid.get_neighborhood(pos, moore=True) + [(25, 25)]:
+            yield pos, prev_pos
+
+
+def expected_distribution(grid, pos, prev_pos):
+    """
+    Step distribution of the original biased walk: proportional to the
+    manhattan distance from each (wrapped) neighbor to the previous position.
+    """
+    neighbors = grid.get_neighborhood(pos, moore=True)
+    dists = np.array([manhattan_distance(prev_pos, n) for n in neighbors])
+    return dict(zip(neighbors, dists / dists.sum()))
+
+
+def assert_distribution(steps, expected):
+    counts = Counter(steps)
+    assert set(counts) <= set(expected)
+    for neighbor, probability in expected.items():
+        assert counts[neighbor] / len(steps) == \
+            pytest.approx(probability, abs=1e-3)
+
+
+@pytest.fixture
+def model():
+    return LeafcutterAntsFungiMutualismModel(seed=0, collect_data=False)
+
+
+def test_agent_walk_matches_original_distribution(model):
+    grid = model.grid
+    ant = AntAgent(model.next_id(), model)
+    grid.place_agent(ant, (10, 10))
+    for pos, prev_pos in walk_cases(grid):
+        steps = []
+        for u in UNIFORMS[::10]:
+            grid.move_agent(ant, pos)
+            ant.prev_pos = prev_pos
+            model.uniforms = lambda: u
+            ant.random_move()
+            steps.append(ant.pos)
+        assert_distribution(steps, expected_distribution(grid, pos, prev_pos))
+
+
+def test_vectorized_walk_matches_original_distribution(model):
+    grid = model.grid
+    for pos, prev_pos in walk_cases(grid):
+        n = len(UNIFORMS)
+        columns = biased_walk_choice(
+            np.full(n, pos[0]), np.full(n, pos[1]), np.full(n, prev_pos[0]),
+            np.full(n, prev_pos[1]), UNIFORMS, grid)
+        steps = [grid.moore_neighborhood(pos)[column]
+                 for column in columns.tolist()]
+        assert_distribution(steps, expected_distribution(grid, pos, prev_pos))
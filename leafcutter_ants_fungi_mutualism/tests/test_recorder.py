@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from model import LeafcutterAntsFungiMutualismModel
+from model.recorder import ColumnRecorder
+
+
+class Clock:
+    """ stands in for a model, its reporter reads the step """
+
+    def __init__(self):
+        self.schedule = SimpleNamespace(steps=0)
+
+
+def run(recorder, steps):
+    clock = Clock()
+    for step in range(steps + 1):
+        clock.schedule.steps = step
+        recorder.collect(clock)
+    return clock
+
+
+def test_records_every_interval_th_step():
+    recorder = ColumnRecorder({"Step": lambda m: 10 * m.schedule.steps},
+                              interval=4, horizon=10)
+    assert len(recorder.index) == 3
+    run(recorder, 25)
+
+    # grew past the horizon
+    assert list(recorder.index[:recorder.n]) == [0, 4, 8, 12, 16, 20, 24]
+    assert list(recorder.model_vars["Step"]) == [0, 40, 80, 120, 160, 200,
+                                                 240]
+    df = recorder.get_model_vars_dataframe()
+    assert df.index.name == "Step"
+    assert df.loc[12, "Step"] == 120
+
+
+def test_records_only_the_listed_steps():
+    recorder = ColumnRecorder({"Step": lambda m: m.schedule.steps},
+                              steps=[7, 3, 3, 100, 0])
+    assert list(recorder.recorded_steps(1, 50)) == [3, 7]
+    run(recorder, 50)
+    assert list(recorder.model_vars["Step"]) == [0, 3, 7]
+
+
+def test_fill_carries_the_final_state_forward():
+    recorder = ColumnRecorder({"Step": lambda m: m.schedule.steps},
+                              interval=5)
+    clock = run(recorder, 12)
+    recorder.fill(clock, 13, 30)
+    assert list(recorder.index[:recorder.n]) == [0, 5, 10, 15, 20, 25, 30]
+    assert list(recorder.model_vars["Step"]) == [0, 5, 10, 12, 12, 12, 12]
+
+
+def test_model_records_the_same_values_at_an_interval():
+    every = LeafcutterAntsFungiMutualismModel(seed=3)
+    every.run_model(100)
+    sparse = LeafcutterAntsFungiMutualismModel(seed=3, record_interval=10)
+    sparse.run_model(100)
+
+    expected = every.datacollector.get_model_vars_dataframe().loc[::10]
+    recorded = sparse.datacollector.get_model_vars_dataframe()
+    assert list(recorded.index) == list(range(0, 101, 10))
+    np.testing.assert_array_equal(recorded.to_numpy(), expected.to_numpy())
@@ -0,0 +1,78 @@
+import multiprocess as mp
+import numpy as np
+import pytest
+
+from model import ResultMatrix
+
+METADATA = {"columns": ["a", "b"], "seed_entropy": "123",
+            "problem": {"names": ["x"], "bounds": [[0, 1]]}}
+
+
+def test_rows_are_kept_when_the_matrix_is_reopened(tmp_path):
+    path = str(tmp_path / "matrix")
+    matrix = ResultMatrix.open(path, 4, 2, METADATA)
+    assert list(matrix.missing()) == [0, 1, 2, 3]
+    assert np.isnan(matrix.values).all()
+
+    matrix.write(2, [1.5, 2.5], stop_step=40)
+    matrix.write(0, [0.5, np.nan])
+
+    # a resumed job
+    matrix = ResultMatrix.open(path, 4, 2, METADATA)
+    assert matrix.metadata == METADATA
+    assert list(matrix.missing()) == [1, 3]
+    assert list(matrix.missing([0, 1])) == [1]
+    np.testing.assert_array_equal(matrix.values[2], [1.5, 2.5])
+    np.testing.assert_array_equal(matrix.values[0], [0.5, np.nan])
+    assert list(matrix.stop_steps) == [-1, -1, 40, -1]
+    assert not matrix.complete
+    with pytest.raises(RuntimeError, match="2 of 4 rows are missing"):
+        matrix.require_complete()
+
+    matrix.write(1, [3, 4])
+    matrix.write(3, [5, 6])
+    assert matrix.complete
+    matrix.require_complete()
+
+
+def test_rows_written_without_their_flag_are_missing(tmp_path):
+    path = str(tmp_path / "matrix")
+    matrix = ResultMatrix.open(path, 3, 2, METADATA)
+    # killed between writing the values and flagging the row
+    matrix._write(ResultMatrix.VALUES, 16, np.array([7.0, 8.0]).tobytes())
+
+    matrix = ResultMatrix(path)
+    assert list(matrix.missing()) == [0, 1, 2]
+    matrix.write(1, [9, 10])
+    np.testing.assert_array_equal(matrix.values[1], [9, 10])
+    assert list(matrix.missing()) == [0, 2]
+
+
+def test_another_study_is_refused(tmp_path):
+    path = str(tmp_path / "matrix")
+    ResultMatrix.open(path, 3, 2, METADATA)
+    with pytest.raises(ValueError, match="shape"):
+        ResultMatrix.open(path, 4, 2, METADATA)
+    with pytest.raises(ValueError, match="seed_entropy"):
+        ResultMatrix.open(path, 3, 2, dict(METADATA, seed_entropy="456"))
+
+
+def _fill(args):
+    path, rows = args
+    matrix = ResultMatrix(path)
+    for row in rows:
+        matrix.write(row, [row, -row], stop_step=row)
+
+
+def test_jobs_fill_disjoint_rows(tmp_path):
+    path = str(tmp_path / "matrix")
+    ResultMatrix.open(path, 100, 2, METADATA)
+    shards = np.array_split(np.arange(100), 4)
+    with mp.Pool(4) as pool:
+        pool.map(_fill, [(path, shard.tolist()) for shard in shards])
+
+    matrix = ResultMatrix(path)
+    assert matrix.complete
+    np.testing.assert_array_equal(matrix.values[:, 0], np.arange(100))
+    np.testing.assert_array_equal(matrix.values[:, 1], -np.arange(100))
+    np.testing.assert_array_equal(matrix.stop_steps, np.arange(100))
@@ -0,0 +1,28 @@
+import pytest
+
+from model import MODEL_ENGINES, AntAgent
+from model import LeafcutterAntsFungiMutualismModel
+from model import run_and_summarize, summarize_run
+
+
+def test_agent_reporters_include_the_caretakers():
+    model = LeafcutterAntsFungiMutualismModel(seed=0, collect_data=False)
+    model.run_model(50)
+    assert model.caretakers
+
+    result = summarize_run(model, agent_reporters={"Type": "__class__"})
+    types = [reports["Type"] for reports in result.agent_vars.values()]
+    assert types.count(AntAgent) == model.ant_counts.ants
+    ants = {uid for uid, reports in result.agent_vars.items()
+            if reports["Type"] is AntAgent}
+    assert ants == {ant.unique_id for ant in model.ant_agents()}
+    assert ants >= {ant.unique_id for ant in model.caretakers}
+    assert len(result.agent_vars) == len(model.schedule.agents) + \
+        len(model.caretakers)
+
+
+def test_agent_reporters_are_rejected_without_agents():
+    with pytest.raises(ValueError, match="agent-based engine"):
+        run_and_summarize(MODEL_ENGINES["vectorized"],
+                          {"seed": 0, "collect_data": False}, 10,
+                          agent_reporters={"State": "state"})
@@ -0,0 +1,75 @@
+from mesa import Agent, Model
+
+from model import AntAgent, AntWorkerState, LeafcutterAntsFungiMutualismModel
+from model.schedule import StagedTypeActivation
+
+
+class Walker(Agent):
+    def step(self):
+        self.model.activations.append(self.unique_id)
+
+
+class Phase(Agent):
+    def step(self):
+        self.model.activations.append("phase")
+
+
+def test_interleaved_activations_are_shuffled_in():
+    model = Model()
+    model.activations = []
+    schedule = StagedTypeActivation(model, random_types=(Walker,),
+                                    phase_types=(Phase,))
+    for i in range(5):
+        schedule.add(Walker(i, model))
+    schedule.add(Phase(5, model))
+
+    positions = set()
+    for _ in range(200):
+        model.activations = []
+        schedule.step(interleave=[lambda: model.activations.append("wake")])
+        assert sorted(model.activations[:6], key=str) == \
+            [0, 1, 2, 3, 4, "wake"]
+        assert model.activations[6:] == ["phase"]
+        positions.add(model.activations.index("wake"))
+    assert positions == set(range(6))
+
+
+def test_caretakers_wake_among_foragers():
+    model = LeafcutterAntsFungiMutualismModel(seed=0, collect_data=False)
+    model.activations = []
+    for ant in model.schedule.agents_of_type(AntAgent):
+        step = ant.step
+        ant.step = lambda step=step: (model.activations.append("forager"),
+                                      step())
+    wake = model.caretakers.wake
+
+    def record_wake(ant, tick):
+        model.activations.append("caretaker")
+        wake(ant, tick)
+    model.caretakers.wake = record_wake
+
+    # all caretakers start their first round trip at the first tick
+    model.step()
+    first = model.activations.index("forager")
+    last = len(model.activations) - model.activations[::-1].index("caretaker")
+    assert first < last - 1
+
+
+def test_timer_wheel_holds_only_live_caretakers():
+    model = LeafcutterAntsFungiMutualismModel(seed=0, collect_data=False)
+    timers = model.caretakers
+    for _ in range(200):
+        model.step()
+        entries = [(tick, ant) for tick, ants in timers.wheel.items()
+                   for ant in ants]
+        assert all(ants for ants in timers.wheel.values())
+        assert all(ant.wake_step == tick for tick, ant in entries)
+        assert {id(ant) for _, ant in entries} == {id(ant) for ant in timers}
+        assert timers.next_wake() == min(ant.wake_step
+                                         for ant in timers) - timers.now
+
+    # the first caretaker to wake up leaves
+    ant = min(timers, key=lambda ant: ant.wake_step)
+    ant.state = AntWorkerState.EXPLORE
+    assert timers.next_wake() == min(ant.wake_step
+                                     for ant in timers) - timers.now
@@ -0,0 +1,56 @@
+from model import DeathReason, LeafcutterAntsFungiMutualismModel
+from model import SteadyStateDetector
+
+
+def test_steady_state_needs_a_full_window():
+    detector = SteadyStateDetector(3)
+    assert not detector.update(5.0, 10)
+    assert not detector.update(5.0, 10)
+    assert detector.update(5.0, 10)
+
+
+def test_steady_state_range_is_relative_to_the_mean():
+    detector = SteadyStateDetector(4, tolerance=0.1)
+    for value in (100, 104, 96):
+        detector.update(value, 1.0)
+    # range 8 is within 10% of the mean 100
+    assert detector.update(100, 1.0)
+    # range 20 is not
+    assert not detector.update(116, 1.0)
+    # every series has to be steady
+    for _ in range(4):
+        detector.update(100, 1.0)
+    assert not detector.update(100, 2.0)
+
+
+def test_steady_state_only_looks_at_the_window():
+    detector = SteadyStateDetector(3, tolerance=0.01)
+    for value in (0, 50, 100, 100):
+        detector.update(value)
+    assert detector.update(100)
+
+
+def test_dead_colonies_stop_and_carry_their_state_forward():
+    model = LeafcutterAntsFungiMutualismModel(seed=0, num_ants=2,
+                                              stop_on_death=True)
+    model.run_model(300)
+
+    assert model.death_reason is DeathReason.ANTS
+    assert not model.running
+    assert model.stop_step == model.schedule.steps < 300
+    df = model.datacollector.get_model_vars_dataframe()
+    assert list(df.index) == list(range(301))
+    final = df.loc[model.stop_step]
+    assert (df.loc[model.stop_step:] == final).all().all()
+
+
+def test_steady_colonies_stop():
+    model = LeafcutterAntsFungiMutualismModel(
+        seed=0, collect_data=False, steady_state_window=20,
+        steady_state_tolerance=0.05)
+    model.run_model(1000)
+
+    assert model.stop_step == model.schedule.steps < 1000
+    assert model.death_reason is None
+    assert model.steady_state.update(model.fungus.biomass,
+                                     model.ant_counts.ants)
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from model import LeafcutterAntsFungiMutualismModel, ResultsStore
+from model import ResultsStoreWriter, run_and_summarize
+from model.store import RUNS
+
+
+def run(seed, **kwargs):
+    return run_and_summarize(LeafcutterAntsFungiMutualismModel,
+                             dict(seed=seed, **kwargs), 100)
+
+
+def test_runs_round_trip(tmp_path):
+    path = str(tmp_path / "store")
+    writer = ResultsStoreWriter(path, metadata={"study": "test"})
+    results = [run(seed, stop_on_death=True, num_ants=2) for seed in range(3)]
+    for i, result in enumerate(results):
+        writer.write(i, result, params={"num_ants": 2, "iteration": i})
+
+    store = ResultsStore(path)
+    assert store.runs == [0, 1, 2] and len(store) == 3
+    assert store.metadata == {"study": "test"}
+    assert store.metrics == list(results[0].timeseries)
+
+    for i, result in enumerate(results):
+        pd.testing.assert_frame_equal(store.dataframe(i),
+                                      result.get_model_vars_dataframe())
+    name = "Fungus Biomass"
+    np.testing.assert_array_equal(
+        store.stack(name, runs=slice(1, 3)),
+        [result.timeseries[name] for result in results[1:]])
+
+    table = store.table()
+    assert list(table.index) == [0, 1, 2]
+    assert list(table["iteration"]) == [0, 1, 2]
+    assert list(table["seed"]) == [0, 1, 2]
+    assert list(table["stop_step"]) == [result.stop_step
+                                        for result in results]
+    assert not table["censored"].any()
+    assert store.run_info(0)["death_reason"] == \
+        (results[0].death_reason and results[0].death_reason.name)
+
+    durations = np.concatenate([result.trip_durations for result in results])
+    np.testing.assert_array_equal(store.trip_durations(), durations)
+
+
+def test_trip_summaries_are_merged(tmp_path):
+    path = str(tmp_path / "store")
+    writer = ResultsStoreWriter(path)
+    results = [run(seed, trip_summary=True) for seed in range(2)]
+    for i, result in enumerate(results):
+        writer.write(i, result)
+
+    merged = ResultsStore(path).trip_summary()
+    expected = results[0].trip_summary
+    expected.merge(results[1].trip_summary)
+    for key, value in expected.to_dict().items():
+        np.testing.assert_array_equal(value, merged.to_dict()[key])
+
+
+def test_interrupted_writes_leave_complete_runs(tmp_path):
+    path = str(tmp_path / "store")
+    writer = ResultsStoreWriter(path)
+    writer.write(0, run(0))
+    # a write killed before its rename, and a run rewritten in place
+    os.makedirs(os.path.join(path, RUNS, ".tmp-000001-123"))
+    replacement = run(5)
+    writer.write(0, replacement)
+
+    store = ResultsStore(path)
+    assert store.runs == [0]
+    assert writer.next_index() == 1
+    assert store.run_info(0)["seed"] == 5
+    pd.testing.assert_frame_equal(store.dataframe(0),
+                                  replacement.get_model_vars_dataframe())
+
+    # a new writer keeps the runs and merges the metadata
+    ResultsStoreWriter(path, metadata={"a": 1})
+    writer = ResultsStoreWriter(path, metadata={"b": 2})
+    writer.write(writer.next_index(), run(6))
+    store = ResultsStore(path)
+    assert store.runs == [0, 1]
+    assert store.metadata == {"a": 1, "b": 2}
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from model import LeafcutterAntsFungiMutualismModel
+from model.trips import TripSummary, linear_bins, log_bins
+
+
+def histogram(durations, edges):
+    """ counts per bin, the last bin has no upper bound """
+    return np.histogram(durations, np.append(edges, np.inf))[0]
+
+
+@pytest.fixture
+def trips():
+    rng = np.random.default_rng(0)
+    return [rng.geometric(0.02, size) for size in (500, 300, 1)]
+
+
+def test_merge_equals_the_summary_of_all_trips(trips):
+    edges = log_bins(1000, per_decade=10)
+    summaries = []
+    for durations in trips:
+        summary = TripSummary(edges)
+        summary.add_many(durations)
+        summaries.append(summary)
+    merged = TripSummary.merged(summaries)
+
+    everything = np.concatenate(trips)
+    np.testing.assert_array_equal(merged.counts, histogram(everything, edges))
+    assert merged.count == len(everything)
+    assert merged.total == everything.sum()
+    assert (merged.min, merged.max) == (everything.min(), everything.max())
+    assert merged.mean() == pytest.approx(everything.mean())
+    assert merged.variance() == pytest.approx(everything.var())
+
+
+def test_merge_needs_the_same_bins():
+    with pytest.raises(ValueError, match="different bins"):
+        TripSummary(linear_bins(100)).merge(TripSummary(linear_bins(200)))
+
+
+def test_add_and_add_many_agree(trips):
+    one, many = TripSummary(sample_every=7), TripSummary(sample_every=7)
+    durations = trips[0]
+    ant_ids = np.arange(len(durations))
+    for duration, ant_id in zip(durations.tolist(), ant_ids.tolist()):
+        one.add(duration, ant_id)
+    many.add_many(durations, ant_ids)
+
+    assert one.to_dict().keys() == many.to_dict().keys()
+    for key, value in one.to_dict().items():
+        np.testing.assert_array_equal(value, many.to_dict()[key])
+    assert one.samples == [(ant_id, duration) for ant_id, duration in zip(
+        ant_ids.tolist(), durations.tolist()) if ant_id % 7 == 0]
+
+
+def test_quantiles_within_a_bin(trips):
+    summary = TripSummary(linear_bins(1000))
+    summary.add_many(trips[0])
+    for q in (0.1, 0.5, 0.9):
+        assert abs(summary.quantile(q) - np.quantile(trips[0], q)) <= 1
+    assert summary.quantile(0) == trips[0].min()
+    assert summary.quantile(1) == trips[0].max()
+    assert np.isnan(TripSummary().quantile(0.5))
+
+
+def test_quantiles_beyond_the_last_bin():
+    summary = TripSummary(linear_bins(10))
+    summary.add_many([20, 30, 40, 50])
+    assert 20 <= summary.quantile(0.5) <= 50
+    assert summary.quantile(1) == 50
+
+
+def test_round_trip(trips):
+    summary = TripSummary(log_bins(), sample_every=3)
+    summary.add_many(trips[0], np.arange(len(trips[0])))
+    restored = TripSummary.from_dict(summary.to_dict())
+    for key, value in summary.to_dict().items():
+        np.testing.assert_array_equal(value, restored.to_dict()[key])
+    assert restored.samples == summary.samples
+
+
+def test_model_summary_matches_the_trip_durations():
+    listed = LeafcutterAntsFungiMutualismModel(seed=0)
+    listed.run_model(300)
+    summarized = LeafcutterAntsFungiMutualismModel(seed=0, trip_summary=True)
+    summarized.run_model(300)
+
+    summary = summarized.trip_summary
+    assert summary.count == len(listed.trip_durations) > 0
+    np.testing.assert_array_equal(
+        summary.counts, histogram(listed.trip_durations, summary.bin_edges))
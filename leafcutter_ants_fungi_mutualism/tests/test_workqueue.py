@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+import multiprocess as mp
+import pytest
+
+from workqueue import CLAIMED, TASKS, WORKERS, QueuePool, _listdir, _write
+from workqueue import run_worker
+
+
+def _square(x):
+    return x * x
+
+
+def _fail(x):
+    raise ValueError(f"bad task {x}")
+
+
+def start_worker(path):
+    worker = threading.Thread(target=run_worker, args=(path,),
+                              kwargs={"heartbeat": 0.05, "poll": 0.02},
+                              daemon=True)
+    worker.start()
+    return worker
+
+
+def test_tasks_of_a_dead_worker_are_queued_again(tmp_path):
+    path = str(tmp_path)
+    pool = QueuePool(path, timeout=0.5, poll=0.02)
+    claimed = os.path.join(path, CLAIMED, "deadhost-1")
+    workers = []
+
+    def dead_worker():
+        # claims the first task, sends one heartbeat and hangs
+        while not _listdir(os.path.join(path, TASKS)):
+            time.sleep(0.01)
+        name = _listdir(os.path.join(path, TASKS))[0]
+        os.makedirs(claimed)
+        os.rename(os.path.join(path, TASKS, name), os.path.join(claimed, name))
+        _write(os.path.join(path, WORKERS, "deadhost-1"), b"0")
+        workers.append(start_worker(path))
+
+    thread = threading.Thread(target=dead_worker, daemon=True)
+    thread.start()
+    results = []
+    # without re-queuing, the results would never all arrive
+    coordinator = threading.Thread(
+        target=lambda: results.extend(pool.imap_unordered(_square, [1, 2, 3])),
+        daemon=True)
+    coordinator.start()
+    coordinator.join(10)
+    assert sorted(results) == [1, 4, 9]
+    pool.close()
+    thread.join()
+    workers[0].join(5)
+
+    assert not workers[0].is_alive()
+    assert not os.path.exists(claimed)
+    assert not os.path.exists(os.path.join(path, WORKERS, "deadhost-1"))
+
+
+def test_live_workers_keep_their_tasks(tmp_path):
+    path = str(tmp_path)
+    pool = QueuePool(path, timeout=0.2, poll=0.02)
+    claimed = os.path.join(path, CLAIMED, "slowhost-1")
+    os.makedirs(claimed)
+    _write(os.path.join(claimed, "task.pkl"), b"")
+    for beat in range(5):
+        _write(os.path.join(path, WORKERS, "slowhost-1"), str(beat).encode())
+        pool._requeue_dead()
+        time.sleep(0.1)
+    assert os.listdir(claimed) == ["task.pkl"]
+    assert os.listdir(os.path.join(path, TASKS)) == []
+
+
+def test_failed_tasks_raise_with_the_worker_traceback(tmp_path):
+    with QueuePool(str(tmp_path), local_workers=1, poll=0.02) as pool:
+        with pytest.raises(RuntimeError, match="bad task 1"):
+            list(pool.imap_unordered(_fail, [1]))
+
+
+def test_results_time_out_without_workers(tmp_path):
+    pool = QueuePool(str(tmp_path), poll=0.02)
+    results = pool.imap_unordered(_square, [3])
+    with pytest.raises(mp.TimeoutError):
+        results.next(0.2)
+
+    worker = start_worker(str(tmp_path))
+    assert results.next(5) == 9
+    with pytest.raises(StopIteration):
+        results.next(0.2)
+    pool.close()
+    worker.join(5)
+    assert not worker.is_alive()
@@ -0,0 +1,305 @@
+"""
+Work queue on a shared directory, to run model runs on workers on several
+hosts. The coordinator (a `QueuePool`, used like a `multiprocess.Pool`) puts
+the tasks in the directory, workers started on any host that shares it claim
+them one at a time, heartbeat while they run them and push back the results,
+and the coordinator re-queues the tasks of workers whose heartbeat stops.
+
+Start a worker with
+
+    python3 workqueue.py QUEUE_DIR [--keep-alive]
+
+from this directory, so the worker can import the model code. Layout of the
+queue directory:
+
+    tasks/<session>-<task>.pkl             tasks waiting for a worker
+    claimed/<worker>/<session>-<task>.pkl  tasks a worker is running
+    results/<session>-<task>.pkl           results waiting for the coordinator
+    workers/<worker>                       heartbeat counter of a worker
+    stop                                   tells the workers to exit
+
+Every file is written to a temporary name first and renamed into place, and
+a task is claimed by renaming it into the worker's directory, so exactly one
+worker gets it.
+"""
+import argparse
+import os
+import shutil
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+import dill
+import multiprocess as mp
+
+TASKS = "tasks"
+CLAIMED = "claimed"
+RESULTS = "results"
+WORKERS = "workers"
+STOP = "stop"
+BACKENDS = ("local", "queue")
+
+
+def _write(path, data) -> None:
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _listdir(path):
+    try:
+        return sorted(name for name in os.listdir(path) if ".tmp" not in name)
+    except FileNotFoundError:
+        return []
+
+
+class QueuePool:
+    """
+    Coordinator of the work queue in directory `path`, with the interface of
+    the `multiprocess.Pool` methods used by the runners. `local_workers`
+    workers are started on this host, others can join from any host. A
+    worker whose heartbeat has not changed for `timeout` seconds is
+    considered dead and its tasks are queued again.
+
+    Only one coordinator may use a queue directory at a time; tasks and
+    results of an earlier coordinator are removed.
+    """
+
+    def __init__(self, path, local_workers=0, timeout=60.0, poll=0.1):
+        self.path = path
+        self.timeout = timeout
+        self.poll = poll
+        self.session = uuid.uuid4().hex[:12]
+        self._next_task = 0
+        # last heartbeat of every worker and when it changed (local clock, so
+        # the clocks of the hosts do not matter)
+        self._heartbeats = {}
+
+        for name in (TASKS, CLAIMED, RESULTS):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        for name in (TASKS, CLAIMED, RESULTS, WORKERS):
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+        if os.path.exists(os.path.join(path, STOP)):
+            os.remove(os.path.join(path, STOP))
+
+        self._workers = [mp.Process(target=run_worker, args=(path,),
+                                    kwargs={"heartbeat": timeout / 4},
+                                    daemon=True)
+                         for _ in range(local_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Tell the workers to exit, and wait for the local ones.
+        """
+        _write(os.path.join(self.path, STOP), b"")
+        for worker in self._workers:
+            worker.join()
+
+    def terminate(self) -> None:
+        """
+        Kill the local workers, which may hang. The workers on other hosts
+        keep running, for the next coordinator of the queue.
+        """
+        for worker in self._workers:
+            worker.terminate()
+            worker.join()
+
+    def _requeue_dead(self) -> None:
+        now = time.monotonic()
+        for worker in _listdir(os.path.join(self.path, CLAIMED)):
+            try:
+                with open(os.path.join(self.path, WORKERS, worker)) as f:
+                    beat = f.read()
+            except FileNotFoundError:
+                beat = None
+            if self._heartbeats.get(worker, (None,))[0] != beat:
+                self._heartbeats[worker] = (beat, now)
+            elif now - self._heartbeats[worker][1] > self.timeout:
+                claimed = os.path.join(self.path, CLAIMED, worker)
+                for name in _listdir(claimed):
+                    print(f"Worker {worker} stopped responding, queuing "
+                          f"task {name} again")
+                    try:
+                        os.rename(os.path.join(claimed, name),
+                                  os.path.join(self.path, TASKS, name))
+                    except FileNotFoundError:
+                        pass
+                shutil.rmtree(claimed, ignore_errors=True)
+                try:
+                    os.remove(os.path.join(self.path, WORKERS, worker))
+                except FileNotFoundError:
+                    pass
+                del self._heartbeats[worker]
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        """
+        Queue `func(item)` for every item of `iterable`. Returns an iterator
+        over the results as they arrive, like the one of
+        `multiprocess.Pool.imap_unordered`: its `next(timeout)` raises a
+        `multiprocess.TimeoutError` if no result arrives for `timeout`
+        seconds. A task that raised in a worker raises a `RuntimeError` with
+        the worker's traceback.
+        """
+        pending = set()
+        for item in iterable:
+            name = f"{self.session}-{self._next_task:08d}.pkl"
+            self._next_task += 1
+            # with the globals of functions of a script, which the workers
+            # cannot import
+            _write(os.path.join(self.path, TASKS, name),
+                   dill.dumps((func, item), recurse=True))
+            pending.add(name)
+        return _QueueResults(self, pending)
+
+
+class _QueueResults:
+    """
+    Iterator over the results of the tasks `pending` of `QueuePool` `pool`.
+    """
+
+    def __init__(self, pool, pending):
+        self.pool = pool
+        self.pending = pending
+        self._arrived = []
+        self._last_check = time.monotonic()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next()
+
+    def next(self, timeout=None):
+        pool = self.pool
+        results = os.path.join(pool.path, RESULTS)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending:
+            if not self._arrived:
+                self._arrived = [name for name in _listdir(results)
+                                 if name in self.pending]
+            if self._arrived:
+                name = self._arrived.pop()
+                with open(os.path.join(results, name), "rb") as f:
+                    ok, value = dill.load(f)
+                os.remove(os.path.join(results, name))
+                self.pending.discard(name)
+                if not ok:
+                    raise RuntimeError(f"task {name} failed:\n{value}")
+                return value
+
+            if time.monotonic() - self._last_check > pool.poll * 10:
+                pool._requeue_dead()
+                self._last_check = time.monotonic()
+            if deadline is not None and time.monotonic() > deadline:
+                # the workers are gone or hang while sending heartbeats
+                raise mp.TimeoutError
+            time.sleep(pool.poll)
+        raise StopIteration
+
+
+def run_worker(path, heartbeat=15.0, poll=0.5, keep_alive=False) -> None:
+    """
+    Run tasks of the work queue in directory `path` until the coordinator
+    stops it (forever if `keep_alive`), writing a heartbeat every
+    `heartbeat` seconds.
+    """
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    claimed = os.path.join(path, CLAIMED, worker)
+    beat_path = os.path.join(path, WORKERS, worker)
+    os.makedirs(os.path.join(path, WORKERS), exist_ok=True)
+
+    stopped = threading.Event()
+
+    def beat():
+        count = 0
+        while not stopped.is_set():
+            _write(beat_path, str(count).encode())
+            count += 1
+            stopped.wait(heartbeat)
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        while True:
+            tasks = _listdir(os.path.join(path, TASKS))
+            if not tasks:
+                if not keep_alive and os.path.exists(os.path.join(path, STOP)):
+                    return
+                time.sleep(poll)
+                continue
+
+            for name in tasks:
+                os.makedirs(claimed, exist_ok=True)
+                try:
+                    os.rename(os.path.join(path, TASKS, name),
+                              os.path.join(claimed, name))
+                except FileNotFoundError:
+                    # claimed by another worker
+                    continue
+                _run_task(path, claimed, name)
+                break
+    finally:
+        stopped.set()
+        thread.join()
+        if os.path.exists(beat_path):
+            os.remove(beat_path)
+        shutil.rmtree(claimed, ignore_errors=True)
+
+
+def _run_task(path, claimed, name) -> None:
+    try:
+        with open(os.path.join(claimed, name), "rb") as f:
+            func, item = dill.load(f)
+        result = (True, func(item))
+    except Exception:
+        result = (False, traceback.format_exc())
+    try:
+        os.remove(os.path.join(claimed, name))
+    except FileNotFoundError:
+        # queued again in the meantime, the coordinator keeps one result
+        pass
+    _write(os.path.join(path, RESULTS, name), dill.dumps(result))
+
+
+def open_pool(backend, processes, queue=None, maxtasksperchild=None):
+    """
+    Pool of the `backend`: `processes` local processes for "local" (or
+    None), each replaced after `maxtasksperchild` jobs if given, or a
+    `QueuePool` on directory `queue` that starts `processes` local workers
+    for "queue".
+    """
+    if backend in (None, "local"):
+        return mp.Pool(processes, maxtasksperchild=maxtasksperchild)
+    if backend == "queue":
+        if queue is None:
+            raise ValueError("the queue backend needs a queue directory")
+        return QueuePool(queue, local_workers=processes)
+    raise ValueError(f"unknown backend {backend!r}, choose one of {BACKENDS}")
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Worker of a work queue of model runs")
+    argparser.add_argument("queue", type=str,
+                           help="queue directory shared with the coordinator")
+    argparser.add_argument("--keep-alive", action="store_true",
+                           help="keep waiting for tasks when the coordinator "
+                           "is done, for the next study")
+    argparser.add_argument("--heartbeat", type=float, default=15.0,
+                           help="seconds between heartbeats, well below the "
+                           "timeout of the coordinator (60 s)")
+
+    args = argparser.parse_args()
+    run_worker(args.queue, heartbeat=args.heartbeat,
+               keep_alive=args.keep_alive)